@@ -1,23 +1,22 @@
 #!/usr/bin/env python3
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, JSONResponse
-import csv
+import os
 from pathlib import Path
 from difflib import SequenceMatcher
+from structured_store import StructuredStore
 
 app = FastAPI()
 
-# ——— Load your structured CSV once at startup ———
-CSV_PATH = Path("structured_output.csv")
+# ——— Load and index every processed receipt once at startup (reloaded when the file changes) ———
+CSV_PATH = Path(os.getenv("STRUCTURED_PATH", "structured_output.csv"))   # .csv or .jsonl
 if not CSV_PATH.exists():
-    raise FileNotFoundError("structured_output.csv not found — run your OCR+AI pipeline first")
+    raise FileNotFoundError(f"{CSV_PATH} not found — run your OCR+AI pipeline first")
 
-with CSV_PATH.open(newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    try:
-        structured_row = next(reader)
-    except StopIteration:
-        raise ValueError("structured_output.csv must contain at least one data row")
+store = StructuredStore(CSV_PATH)
+if not len(store):
+    raise ValueError(f"{CSV_PATH} must contain at least one data row")
 
 @app.get("/scan", response_class=HTMLResponse)
 async def scan_page():
@@ -103,13 +102,20 @@ async def scan_page():
 @app.get("/compare")
 async def compare(code: str = Query(..., description="Scanned barcode value")):
     """
-    Returns JSON with scanned code and a comparison array:
+    Finds the receipt whose Order ID / Order Reference / Truck ID matches the
+    scanned code (exactly, else the closest fuzzy match) and returns JSON with
+    the scanned code, the match and a comparison array:
       [
         { column, csv_value, similarity },
         …
       ]
     where similarity is a 0.0–1.0 ratio.
     """
+    found = await run_in_threadpool(store.match, code)   # may re-read the CSV; keep it off the event loop
+    if found is None:
+        return JSONResponse({"scanned": code, "match": None, "comparison": []})
+    structured_row, field, score, exact = found
+
     results = []
     for col, val in structured_row.items():
         val_str = val or ""
@@ -119,4 +125,8 @@ async def compare(code: str = Query(..., description="Scanned barcode value")):
             "csv_value": val_str,
             "similarity": round(sim, 2)
         })
-    return JSONResponse({"scanned": code, "comparison": results})
+    return JSONResponse({
+        "scanned": code,
+        "match": {"field": field, "score": round(score, 2), "exact": exact},
+        "comparison": results,
+    })
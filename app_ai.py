@@ -1,17 +1,29 @@
 # app_ai.py
 
 import os
+import sys
 import json
 import csv
-import cv2
+import threading
+import subprocess
 import easyocr
-import numpy as np
 import openai
 
-from fastapi import FastAPI, UploadFile, File, Response, HTTPException
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+from fastapi import FastAPI, UploadFile, File, Form, Response, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, JSONResponse
 from tempfile import NamedTemporaryFile
 from json import JSONDecodeError
+from reader_pool import ReaderPool, PoolFullError
+from recognition_batcher import RecognitionBatcher
+from llm_cache import cached_structuring
+from field_extractor import extract_fields, is_confident
+from block_encoding import BLOCK_FORMAT, encode_blocks, token_report
+from layout_templates import LayoutRegistry
+from easyocr.utils import decode_image
+from job_queue import JobQueue, run_stage, deliver_webhooks
 
 # ————— CONFIG —————
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -22,24 +34,81 @@ LABELS = [
     "Estimated Departure Time","Estimated Arrival Time",
     "Priority Class","Loading Priority","Order Reference","Shipping Carrier"
 ]
+# fields the local extractor must resolve confidently, otherwise fall back to GPT
+REQUIRED_FIELDS = ["Order ID","Truck ID","Date","Order Reference"]
+MIN_FIELD_CONF  = float(os.getenv("MIN_FIELD_CONF", 0.5))
+OCR_WORKERS    = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))   # warm Readers
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", 2 * OCR_WORKERS))     # waiting uploads before 429
+OCR_BATCH_WAIT_MS = float(os.getenv("OCR_BATCH_WAIT_MS", 0))    # >0: cross-request batching (python benchmark.py batching)
+OCR_MAX_BATCH     = int(os.getenv("OCR_MAX_BATCH", 64))         # crops per recognizer pass
+OCR_CACHE_PATH    = os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite")  # "" disables the result cache
+OCR_BACKEND       = os.getenv("OCR_BACKEND", "torch")   # "onnx": onnxruntime CPU sessions (python -m easyocr.export)
+LAYOUT_DB_PATH    = os.getenv("LAYOUT_DB_PATH", "layouts.sqlite")   # "" disables layout-template ROI OCR
+JOB_DB_PATH       = os.getenv("JOB_DB_PATH", "jobs.sqlite")   # "" disables the async /jobs API
+JOB_OCR_PROCESSES = int(os.getenv("JOB_OCR_PROCESSES", 2))    # OCR worker processes started with the app
+                                                              # (0: run `python job_queue.py` workers yourself)
+JOB_LLM_THREADS   = int(os.getenv("JOB_LLM_THREADS", 4))      # threads structuring queued jobs' OCR blocks
+JOB_MAX_PENDING   = int(os.getenv("JOB_MAX_PENDING", 10000))  # unfinished jobs before POST /jobs answers 429
+JOB_WEBHOOK_HOSTS = {h.strip().lower() for h in os.getenv("JOB_WEBHOOK_HOSTS", "").split(",") if h.strip()}
+                                                              # hosts job webhooks may POST to ("*": any; empty: no webhooks)
+LLM_PROMPT_VERSION = 2   # bump whenever the structuring prompt below changes
 # —————————————————
 
-app = FastAPI()
-ocr = easyocr.Reader(["en"], gpu=False)
+@asynccontextmanager
+async def lifespan(app):
+    # /jobs: OCR worker processes with their own warm Readers; structuring and webhooks run here
+    stop, workers, threads = threading.Event(), [], []
+    if jobs is not None:
+        torch_threads = max(1, (os.cpu_count() or 1) // max(1, JOB_OCR_PROCESSES))
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_queue.py")
+        for i in range(JOB_OCR_PROCESSES):
+            workers.append(subprocess.Popen([sys.executable, script, "--db", JOB_DB_PATH,
+                                             "--id", f"ocr-{os.getpid()}-{i}", "--threads", str(torch_threads),
+                                             "--backend", OCR_BACKEND, "--cache", OCR_CACHE_PATH]))
+        for i in range(JOB_LLM_THREADS):
+            threads.append(threading.Thread(target=run_stage, name=f"job-structure-{i}", daemon=True,
+                                            args=(jobs, "structure", "done", structure_job,
+                                                  f"structure-{os.getpid()}-{i}", stop)))
+        threads.append(threading.Thread(target=deliver_webhooks, name="job-webhooks", daemon=True,
+                                        args=(jobs, f"webhook-{os.getpid()}", stop)))
+        for t in threads:
+            t.start()
+    yield
+    stop.set()
+    for w in workers:
+        w.terminate()   # a job cut off here is picked up again once its lease runs out
+    for w in workers:
+        w.wait()
+    for t in threads:
+        t.join()
 
+app = FastAPI(lifespan=lifespan)
+jobs = JobQueue(JOB_DB_PATH) if JOB_DB_PATH else None
+ocr_cache = easyocr.OCRCache(OCR_CACHE_PATH) if OCR_CACHE_PATH else None
+batcher = None
+if OCR_BATCH_WAIT_MS > 0:
+    batcher = RecognitionBatcher(easyocr.Reader(["en"], gpu=False, detector=False, backend=OCR_BACKEND),
+                                 max_batch=OCR_MAX_BATCH, max_wait_ms=OCR_BATCH_WAIT_MS)
+ocr = ReaderPool(["en"], size=OCR_WORKERS, max_queue=OCR_QUEUE_SIZE, gpu=False,
+                 batcher=batcher, cache=ocr_cache, backend=OCR_BACKEND)
+layouts = LayoutRegistry(LABELS, LAYOUT_DB_PATH) if LAYOUT_DB_PATH else None
+
+@cached_structuring("app_ai.call_llm_to_structure", LLM_PROMPT_VERSION)
 def call_llm_to_structure(raw_blocks):
     """
     Ask GPT-4 to map raw OCR blocks → our LABELS schema,
     and raise an HTTPException if it doesn't return valid JSON.
     """
+    report = token_report(raw_blocks)
+    print(f"🔢 LLM blocks: {report['json_tokens']} → {report['compact_tokens']} tokens")
     prompt = f"""
-You are given a list of OCR text blocks from a warehouse receipt.
-Each block is a JSON object with "text", "conf", "x", and "y".
+You are given the OCR text blocks from a warehouse receipt.
+{BLOCK_FORMAT}
 Extract EXACTLY the following fields as a single JSON object with these keys:
 {json.dumps(LABELS)}
 
 OCR blocks:
-{json.dumps(raw_blocks, indent=2)}
+{encode_blocks(raw_blocks)}
 
 **IMPORTANT**: Reply ONLY with valid JSON—no extra commentary.
 Example:
@@ -71,6 +140,22 @@ Example:
         )
     return data
 
+def structure_blocks(blocks):
+    """
+    OCR blocks → {label: value} for LABELS, and what produced it: the local
+    extractor ("rules"), or GPT when required fields are missing/unsure ("llm").
+    """
+    fields = extract_fields(blocks, LABELS)
+    if is_confident(fields, REQUIRED_FIELDS, MIN_FIELD_CONF):
+        return {lab: fields[lab][0] if lab in fields else "" for lab in LABELS}, "rules"
+    return call_llm_to_structure(blocks), "llm"
+
+def structure_job(job):
+    """The "structure" stage of a queued job (see job_queue.run_stage)."""
+    structured, source = structure_blocks(json.loads(job["blocks"]))
+    return {"result": json.dumps({"filename": job["filename"], "fields": structured, "structured_by": source},
+                                 ensure_ascii=False)}
+
 @app.get("/", response_class=HTMLResponse)
 def read_root():
     return """
@@ -86,9 +171,21 @@ def read_root():
 @app.post("/ocr-ai/")
 async def ocr_ai(file: UploadFile = File(...)):
     # 1) Read & OCR
-    data = await file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    raw = ocr.readtext(img, detail=1)
+    image = await file.read()    # decoded once, then shared by the template and full-page paths
+    try:
+        raw = None
+        if layouts is not None:
+            # a learned order layout: recognize its cached label / value regions, no page detection
+            image = await run_in_threadpool(decode_image, image)
+            raw = await ocr.arun(layouts.readtext, image)
+        if raw is None:
+            raw = await ocr.areadtext(image)
+            if layouts is not None:
+                await run_in_threadpool(layouts.observe, image.grey, raw)
+    except PoolFullError as e:
+        return JSONResponse(status_code=429, content={"error": str(e)}, headers={"Retry-After": "1"})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     blocks = [
         {
             "text": txt,
@@ -99,9 +196,9 @@ async def ocr_ai(file: UploadFile = File(...)):
         for bbox, txt, conf in raw
     ]
 
-    # 2) Structure via GPT
+    # 2) Structure locally by label position; GPT only when required fields are missing/unsure
     try:
-        structured = call_llm_to_structure(blocks)
+        structured, _ = await run_in_threadpool(structure_blocks, blocks)
     except HTTPException as e:
         # Return JSON error so client sees a clear message
         return JSONResponse(status_code=e.status_code, content={"error": e.detail})
@@ -126,6 +223,31 @@ async def ocr_ai(file: UploadFile = File(...)):
         headers={"Content-Disposition": f"attachment; filename={file.filename}.csv"}
     )
 
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), webhook: str = Form(None)):
+    """Queue a receipt for OCR + structuring; poll GET /jobs/{id} or pass a webhook URL."""
+    if jobs is None:
+        return JSONResponse(status_code=404, content={"error": "job API disabled (JOB_DB_PATH is empty)"})
+    if webhook and urlparse(webhook).scheme not in ("http", "https"):
+        return JSONResponse(status_code=400, content={"error": "webhook must be an http(s) URL"})
+    if webhook and "*" not in JOB_WEBHOOK_HOSTS and (urlparse(webhook).hostname or "") not in JOB_WEBHOOK_HOSTS:
+        # the app POSTs job results from inside the network: only to hosts the operator listed
+        return JSONResponse(status_code=400, content={"error": "webhook host not allowed (JOB_WEBHOOK_HOSTS)"})
+    if await run_in_threadpool(jobs.pending) >= JOB_MAX_PENDING:
+        return JSONResponse(status_code=429, content={"error": f"{JOB_MAX_PENDING} jobs already pending"},
+                            headers={"Retry-After": "5"})
+    data = await file.read()
+    job_id = await run_in_threadpool(jobs.submit, data, file.filename, webhook or None)
+    return JSONResponse(status_code=202, content={"id": job_id, "status": "queued", "url": f"/jobs/{job_id}"},
+                        headers={"Location": f"/jobs/{job_id}"})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(jobs.get, job_id) if jobs is not None else None
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "unknown job"})
+    return job
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
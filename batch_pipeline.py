@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# ——— CONFIG ———
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite")   # "" disables the OCR result cache
+OCR_TILE_HEIGHT = int(os.getenv("OCR_TILE_HEIGHT", "0")) or None  # detect taller receipts in overlapping tiles
+# —————————————————
+
+_reader = None
+
+
+def _init_ocr_worker(n_workers):
+    """Runs once per OCR process: load the Reader (CRAFT + recognizer) and keep it warm."""
+    global _reader
+    import torch
+    import easyocr
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // n_workers))
+    _reader = easyocr.Reader(["en"], gpu=False, verbose=False, cache=OCR_CACHE_PATH or None)
+
+
+def _ocr_image(path):
+    """OCR one image in a worker process → (blocks of text/conf/x/y, seconds)."""
+    start = time.perf_counter()
+    blocks = []
+    for bbox, text, conf in _reader.readtext(path, detail=1, tile_height=OCR_TILE_HEIGHT):
+        x = float((bbox[0][0] + bbox[2][0]) / 2)
+        y = float((bbox[0][1] + bbox[2][1]) / 2)
+        blocks.append({"text": text, "conf": float(conf), "x": x, "y": y})
+    return blocks, time.perf_counter() - start
+
+
+def _timed(fn, blocks):
+    start = time.perf_counter()
+    return fn(blocks), time.perf_counter() - start
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_journal(journal_path):
+    """filename → record for every receipt already finished in a previous run."""
+    done = {}
+    if journal_path and Path(journal_path).exists():
+        with open(journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue    # half-written last line from a crash
+                done[rec["filename"]] = rec
+    return done
+
+
+def compact_journal(journal_path, hashes):
+    """
+    Rewrite the journal with the latest record of each file in `hashes`
+    (filename → current sha1), dropping removed receipts and records of an
+    older version of the file (e.g. a changed image whose rerun failed).
+    Returns filename → record.
+    """
+    done = load_journal(journal_path)
+    keep = {fn: done[fn] for fn, digest in hashes.items()
+            if fn in done and done[fn].get("sha1") == digest}
+    tmp = Path(str(journal_path) + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for rec in keep.values():
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    os.replace(tmp, journal_path)
+    return keep
+
+
+class BatchPipeline:
+    """
+    Staged receipt pipeline: a process pool of long-lived Readers does OCR and
+    feeds a thread pool that runs `llm_fn(blocks)` with at most
+    `llm_concurrency` calls in flight.
+
+    Every finished receipt is appended to a JSONL journal (filename, content
+    hash, prediction, stage timings) and flushed, so a rerun skips receipts
+    whose file hash is unchanged. `run()` yields records as they complete;
+    failed receipts are yielded with an "error" and not journaled, so they are
+    retried next time.
+    """
+
+    def __init__(self, llm_fn, journal_path=None, ocr_workers=None, llm_concurrency=4):
+        self.llm_fn = llm_fn
+        self.journal_path = journal_path
+        self.ocr_workers = ocr_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.llm_concurrency = llm_concurrency
+        self.stats = {"resumed": 0, "done": 0, "failed": 0, "ocr_s": 0.0, "llm_s": 0.0, "wall_s": 0.0}
+
+    def run(self, image_paths):
+        start = time.perf_counter()
+        image_paths = [Path(p) for p in image_paths]
+        done = load_journal(self.journal_path)
+        todo = []
+        for p in image_paths:
+            digest = file_hash(p)
+            rec = done.get(p.name)
+            if rec is not None and rec.get("sha1") == digest:
+                self.stats["resumed"] += 1
+                yield rec
+            else:
+                todo.append((p, digest))
+
+        total = len(todo)
+        if not total:
+            return
+        journal = open(self.journal_path, "a", encoding="utf-8") if self.journal_path else None
+        try:
+            with ProcessPoolExecutor(self.ocr_workers, initializer=_init_ocr_worker,
+                                     initargs=(self.ocr_workers,)) as ocr_pool, \
+                 ThreadPoolExecutor(self.llm_concurrency) as llm_pool:
+                meta = {ocr_pool.submit(_ocr_image, str(p)): ("ocr", p, digest, None) for p, digest in todo}
+                pending = set(meta)
+                while pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        stage, p, digest, ocr_s = meta.pop(fut)
+                        try:
+                            result, seconds = fut.result()
+                        except Exception as e:
+                            self.stats["failed"] += 1
+                            print(f"❌ {stage.upper()} error on {p.name}: {e}")
+                            yield {"filename": p.name, "sha1": digest, "error": str(e)}
+                            continue
+
+                        if stage == "ocr":
+                            self.stats["ocr_s"] += seconds
+                            nxt = llm_pool.submit(_timed, self.llm_fn, result)
+                            meta[nxt] = ("llm", p, digest, seconds)
+                            pending.add(nxt)
+                            continue
+
+                        self.stats["llm_s"] += seconds
+                        self.stats["done"] += 1
+                        rec = {"filename": p.name, "sha1": digest, "pred": result,
+                               "ocr_s": round(ocr_s, 3), "llm_s": round(seconds, 3)}
+                        if journal:
+                            journal.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                            journal.flush()
+                        n = self.stats["done"] + self.stats["failed"]
+                        print(f"⏳ [{n}/{total}] {p.name}  ocr {ocr_s:.1f}s  llm {seconds:.1f}s")
+                        yield rec
+        finally:
+            if journal:
+                journal.close()
+            self.stats["wall_s"] = time.perf_counter() - start
+
+    def print_stats(self):
+        s = self.stats
+        n = max(1, s["done"])
+        print(f"⏱️  {s['done']} processed, {s['resumed']} resumed, {s['failed']} failed "
+              f"in {s['wall_s']:.1f}s wall — OCR {s['ocr_s']:.1f}s total ({s['ocr_s'] / n:.2f}s/receipt), "
+              f"LLM {s['llm_s']:.1f}s total ({s['llm_s'] / n:.2f}s/receipt)")
@@ -5,72 +5,90 @@ import csv
 import json
 from pathlib import Path
 from difflib import SequenceMatcher
-from universal_receipt_ocr import extract_blocks, call_llm_extract  # your existing functions
+from batch_pipeline import BatchPipeline
 
 # CONFIG ———
 IMG_DIR     = Path("large-receipt-image-dataset-SRD")            # folder containing your 200 .png/.jpg files
 GROUND_TRUTH = Path("ground_truth.csv")   # CSV: filename + all structured columns
 OUTPUT_SUMMARY = Path("batch_summary.csv")
+PREDICTIONS  = Path("batch_predictions.jsonl")   # per-receipt journal; rerunning skips finished receipts
+OCR_WORKERS  = int(os.getenv("OCR_WORKERS", "0")) or None   # OCR processes (default: half the cores)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))    # LLM calls in flight at once
 # —————————
 
-# 1) Load ground-truth into a dict: filename → { field: value, … }
-gt = {}
-with GROUND_TRUTH.open(newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        fn = row["filename"]
-        gt[fn] = {k:v for k,v in row.items() if k != "filename"}
 
-# 2) Prepare accumulators
-fields = list(next(iter(gt.values())).keys())
-field_totals = {fld: 0.0 for fld in fields}
-field_counts = {fld: 0 for fld in fields}
-exact_matches = 0
-total_files = 0
+def main():
+    # imported here so OCR worker processes don't rerun the OpenAI startup check
+    from universal_receipt_ocr import call_llm_extract
 
-# 3) Loop through each image in IMG_DIR
-for img_path in sorted(IMG_DIR.iterdir()):
-    if img_path.name not in gt:
-        print(f"⚠️  Skipping {img_path.name}: no ground truth row.")
-        continue
+    # 1) Load ground-truth into a dict: filename → { field: value, … }
+    gt = {}
+    with GROUND_TRUTH.open(newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            fn = row["filename"]
+            gt[fn] = {k:v for k,v in row.items() if k != "filename"}
 
-    total_files += 1
-    # OCR + GPT structuring
-    blocks = extract_blocks(img_path)
-    try:
-        pred = call_llm_extract(blocks)
-    except Exception as e:
-        print(f"❌ Error on {img_path.name}: {e}")
-        continue
+    # 2) Prepare accumulators
+    fields = list(next(iter(gt.values())).keys())
+    field_totals = {fld: 0.0 for fld in fields}
+    field_counts = {fld: 0 for fld in fields}
+    exact_matches = 0
+    total_files = 0
 
-    truth = gt[img_path.name]
-    file_exact = True
+    images = []
+    for img_path in sorted(IMG_DIR.iterdir()):
+        if img_path.name not in gt:
+            print(f"⚠️  Skipping {img_path.name}: no ground truth row.")
+            continue
+        images.append(img_path)
 
-    # Compare each field
-    for fld in fields:
-        tval = truth.get(fld,"") or ""
-        pval = pred.get(fld,"") or ""
-        sim  = SequenceMatcher(None, tval, pval).ratio()
-        field_totals[fld] += sim
-        field_counts[fld] += 1
-        if sim < 1.0:
-            file_exact = False
+    # 3) OCR (process pool) → GPT structuring (thread pool) → score, as each receipt finishes
+    pipeline = BatchPipeline(call_llm_extract, journal_path=PREDICTIONS,
+                             ocr_workers=OCR_WORKERS, llm_concurrency=LLM_CONCURRENCY)
+    for rec in pipeline.run(images):
+        total_files += 1
+        if "error" in rec:
+            continue
+        pred = rec["pred"]
 
-    if file_exact:
-        exact_matches += 1
+        truth = gt[rec["filename"]]
+        file_exact = True
 
-# 4) Compute averages
-with OUTPUT_SUMMARY.open("w", newline="", encoding="utf-8") as f:
-    writer = csv.writer(f)
-    writer.writerow(["field","avg_similarity"])
-    for fld in fields:
-        avg = field_totals[fld] / field_counts[fld] if field_counts[fld] else 0
-        writer.writerow([fld, f"{avg:.3f}"])
-    # overall exact-rate
-    writer.writerow([])
-    writer.writerow(["total_files", total_files])
-    writer.writerow(["exact_match_files", exact_matches])
-    writer.writerow(["exact_match_rate", f"{exact_matches/total_files:.3f}"])
+        # Compare each field
+        for fld in fields:
+            tval = truth.get(fld,"") or ""
+            pval = pred.get(fld,"") or ""
+            sim  = SequenceMatcher(None, tval, pval).ratio()
+            field_totals[fld] += sim
+            field_counts[fld] += 1
+            if sim < 1.0:
+                file_exact = False
 
-print(f"✅ Done! Summary written to {OUTPUT_SUMMARY}")
-print(f"Exact-match rate: {exact_matches}/{total_files} = {exact_matches/total_files:.2%}")
+        if file_exact:
+            exact_matches += 1
+
+    if not total_files:
+        print("⚠️  No images to score.")
+        sys.exit(1)
+
+    # 4) Compute averages
+    with OUTPUT_SUMMARY.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["field","avg_similarity"])
+        for fld in fields:
+            avg = field_totals[fld] / field_counts[fld] if field_counts[fld] else 0
+            writer.writerow([fld, f"{avg:.3f}"])
+        # overall exact-rate
+        writer.writerow([])
+        writer.writerow(["total_files", total_files])
+        writer.writerow(["exact_match_files", exact_matches])
+        writer.writerow(["exact_match_rate", f"{exact_matches/total_files:.3f}"])
+
+    pipeline.print_stats()
+    print(f"✅ Done! Summary written to {OUTPUT_SUMMARY}")
+    print(f"Exact-match rate: {exact_matches}/{total_files} = {exact_matches/total_files:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,878 @@
+#!/usr/bin/env python3
+"""
+Parity + speed benchmarks for the EasyOCR post-processing hot spots.
+
+    python benchmark.py detboxes [--words 400] [--repeat 5] [--maps maps.npz]
+    python benchmark.py poly [images ...] [--words 150] [--repeat 5]
+    python benchmark.py ingest [images ...] [--repeat 5]
+    python benchmark.py startup [--baseline DIR] [--models *.pth] [--repeat 3]
+    python benchmark.py beamsearch [--batch 64] [--frames 80] [--beam 5] [--repeat 3]
+    python benchmark.py constrained [--batch 256] [--beam 5] [--repeat 3]
+    python benchmark.py canvas [images ...] [--limit 40] [--target 16] [--canvas 2560] [--repeat 1]
+    python benchmark.py batching [--receipts 64] [--lines 20] [--clients 8] [--workers 2] [--wait 10]
+    python benchmark.py widthbucket [--receipts 16] [--lines 20] [--batch 32] [--repeat 1]
+
+Each subcommand runs the pre-optimization reference implementation and the
+current easyocr one on the same inputs, checks the outputs are identical and
+prints both timings. `canvas` is a trade-off rather than a parity check: it
+needs the downloaded detection / recognition models and reports the detection
+time canvas_size='auto' saves against the boxes and words it loses.
+`batching` (needs the recognition model) compares the recognition throughput
+of app_ai.py's Reader pool with and without the cross-request batcher.
+`widthbucket` (needs the recognition model) reads rendered receipt lines in
+batches with and without width bucketing, and one box at a time (what
+Reader.recognize does on CPU), and reports time and accuracy against the
+rendered text.
+"""
+import os
+import sys
+import glob
+import math
+import time
+import argparse
+import collections
+import difflib
+import subprocess
+import tracemalloc
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from scipy.ndimage import label
+
+from easyocr import craft_utils
+from easyocr.imgproc import loadImage
+from easyocr import utils as easyocr_utils
+from easyocr.utils import decode_image, ctcBeamSearch, word_segmentation, CTCLabelConverter
+from easyocr.config import BASE_PATH, recognition_models
+
+
+# ——— reference implementations (as they were before vectorization) ———
+
+def _getDetBoxes_core_reference(textmap, linkmap, text_threshold, link_threshold, low_text, estimate_num_chars=False):
+    linkmap = linkmap.copy()
+    textmap = textmap.copy()
+    img_h, img_w = textmap.shape
+
+    ret, text_score = cv2.threshold(textmap, low_text, 1, 0)
+    ret, link_score = cv2.threshold(linkmap, link_threshold, 1, 0)
+
+    text_score_comb = np.clip(text_score + link_score, 0, 1)
+    nLabels, labels, stats, centroids = cv2.connectedComponentsWithStats(text_score_comb.astype(np.uint8), connectivity=4)
+
+    det = []
+    mapper = []
+    for k in range(1,nLabels):
+        size = stats[k, cv2.CC_STAT_AREA]
+        if size < 10: continue
+        if np.max(textmap[labels==k]) < text_threshold: continue
+
+        segmap = np.zeros(textmap.shape, dtype=np.uint8)
+        segmap[labels==k] = 255
+        if estimate_num_chars:
+            _, character_locs = cv2.threshold((textmap - linkmap) * segmap /255., text_threshold, 1, 0)
+            _, n_chars = label(character_locs)
+            mapper.append(n_chars)
+        else:
+            mapper.append(k)
+        segmap[np.logical_and(link_score==1, text_score==0)] = 0
+        x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
+        w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
+        niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
+        sx, ex, sy, ey = x - niter, x + w + niter + 1, y - niter, y + h + niter + 1
+        if sx < 0 : sx = 0
+        if sy < 0 : sy = 0
+        if ex >= img_w: ex = img_w
+        if ey >= img_h: ey = img_h
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT,(1 + niter, 1 + niter))
+        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+
+        np_contours = np.roll(np.array(np.where(segmap!=0)),1,axis=0).transpose().reshape(-1,2)
+        rectangle = cv2.minAreaRect(np_contours)
+        box = cv2.boxPoints(rectangle)
+
+        w, h = np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[1] - box[2])
+        box_ratio = max(w, h) / (min(w, h) + 1e-5)
+        if abs(1 - box_ratio) <= 0.1:
+            l, r = min(np_contours[:,0]), max(np_contours[:,0])
+            t, b = min(np_contours[:,1]), max(np_contours[:,1])
+            box = np.array([[l, t], [r, t], [r, b], [l, b]], dtype=np.float32)
+
+        startidx = box.sum(axis=1).argmin()
+        box = np.roll(box, 4-startidx, 0)
+        box = np.array(box)
+
+        det.append(box)
+
+    return det, labels, mapper
+
+
+def _getPoly_core_reference(boxes, labels, mapper, linkmap):
+    num_cp = 5
+    max_len_ratio = 0.7
+    expand_ratio = 1.45
+    max_r = 2.0
+    step_r = 0.2
+    polys = []
+    for k, box in enumerate(boxes):
+        w, h = int(np.linalg.norm(box[0] - box[1]) + 1), int(np.linalg.norm(box[1] - box[2]) + 1)
+        if w < 10 or h < 10:
+            polys.append(None); continue
+        tar = np.float32([[0,0],[w,0],[w,h],[0,h]])
+        M = cv2.getPerspectiveTransform(box, tar)
+        word_label = cv2.warpPerspective(labels, M, (w, h), flags=cv2.INTER_NEAREST)
+        try:
+            Minv = np.linalg.inv(M)
+        except:
+            polys.append(None); continue
+        cur_label = mapper[k]
+        word_label[word_label != cur_label] = 0
+        word_label[word_label > 0] = 1
+        cp = []
+        max_len = -1
+        for i in range(w):
+            region = np.where(word_label[:,i] != 0)[0]
+            if len(region) < 2 : continue
+            cp.append((i, region[0], region[-1]))
+            length = region[-1] - region[0] + 1
+            if length > max_len: max_len = length
+        if h * max_len_ratio < max_len:
+            polys.append(None); continue
+        tot_seg = num_cp * 2 + 1
+        seg_w = w / tot_seg
+        pp = [None] * num_cp
+        cp_section = [[0, 0]] * tot_seg
+        seg_height = [0] * num_cp
+        seg_num = 0
+        num_sec = 0
+        prev_h = -1
+        for i in range(0,len(cp)):
+            (x, sy, ey) = cp[i]
+            if (seg_num + 1) * seg_w <= x and seg_num <= tot_seg:
+                if num_sec == 0: break
+                cp_section[seg_num] = [cp_section[seg_num][0] / num_sec, cp_section[seg_num][1] / num_sec]
+                num_sec = 0
+                seg_num += 1
+                prev_h = -1
+            cy = (sy + ey) * 0.5
+            cur_h = ey - sy + 1
+            cp_section[seg_num] = [cp_section[seg_num][0] + x, cp_section[seg_num][1] + cy]
+            num_sec += 1
+            if seg_num % 2 == 0: continue
+            if prev_h < cur_h:
+                pp[int((seg_num - 1)/2)] = (x, cy)
+                seg_height[int((seg_num - 1)/2)] = cur_h
+                prev_h = cur_h
+        if num_sec != 0:
+            cp_section[-1] = [cp_section[-1][0] / num_sec, cp_section[-1][1] / num_sec]
+        if None in pp or seg_w < np.max(seg_height) * 0.25:
+            polys.append(None); continue
+        half_char_h = np.median(seg_height) * expand_ratio / 2
+        new_pp = []
+        for i, (x, cy) in enumerate(pp):
+            dx = cp_section[i * 2 + 2][0] - cp_section[i * 2][0]
+            dy = cp_section[i * 2 + 2][1] - cp_section[i * 2][1]
+            if dx == 0:
+                new_pp.append([x, cy - half_char_h, x, cy + half_char_h])
+                continue
+            rad = - math.atan2(dy, dx)
+            c, s = half_char_h * math.cos(rad), half_char_h * math.sin(rad)
+            new_pp.append([x - s, cy - c, x + s, cy + c])
+        isSppFound, isEppFound = False, False
+        grad_s = (pp[1][1] - pp[0][1]) / (pp[1][0] - pp[0][0]) + (pp[2][1] - pp[1][1]) / (pp[2][0] - pp[1][0])
+        grad_e = (pp[-2][1] - pp[-1][1]) / (pp[-2][0] - pp[-1][0]) + (pp[-3][1] - pp[-2][1]) / (pp[-3][0] - pp[-2][0])
+        for r in np.arange(0.5, max_r, step_r):
+            dx = 2 * half_char_h * r
+            if not isSppFound:
+                line_img = np.zeros(word_label.shape, dtype=np.uint8)
+                dy = grad_s * dx
+                p = np.array(new_pp[0]) - np.array([dx, dy, dx, dy])
+                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
+                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                    spp = p
+                    isSppFound = True
+            if not isEppFound:
+                line_img = np.zeros(word_label.shape, dtype=np.uint8)
+                dy = grad_e * dx
+                p = np.array(new_pp[-1]) + np.array([dx, dy, dx, dy])
+                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
+                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                    epp = p
+                    isEppFound = True
+            if isSppFound and isEppFound:
+                break
+        if not (isSppFound and isEppFound):
+            polys.append(None); continue
+        poly = []
+        poly.append(craft_utils.warpCoord(Minv, (spp[0], spp[1])))
+        for p in new_pp:
+            poly.append(craft_utils.warpCoord(Minv, (p[0], p[1])))
+        poly.append(craft_utils.warpCoord(Minv, (epp[0], epp[1])))
+        poly.append(craft_utils.warpCoord(Minv, (epp[2], epp[3])))
+        for p in reversed(new_pp):
+            poly.append(craft_utils.warpCoord(Minv, (p[2], p[3])))
+        poly.append(craft_utils.warpCoord(Minv, (spp[2], spp[3])))
+        polys.append(np.array(poly))
+    return polys
+
+
+def _reformat_input_reference(image):
+    # path and bytes branches of the old reformat_input
+    if isinstance(image, str):
+        img_cv_grey = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+        img = loadImage(image)
+    else:
+        nparr = np.frombuffer(image, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        img_cv_grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img, img_cv_grey
+
+
+def _decode_beamsearch_reference(converter, mat, beamWidth):
+    return [ctcBeamSearch(mat[i], converter.character, converter.ignore_idx, None, beamWidth=beamWidth)
+            for i in range(mat.shape[0])]
+
+
+def _decode_wordbeamsearch_reference(converter, mat, beamWidth):
+    texts = []
+    argmax = np.argmax(mat, axis=2)
+    for i in range(mat.shape[0]):
+        string = ''
+        if len(converter.separator_list) == 0:
+            space_idx = converter.dict[' ']
+            data = np.argwhere(argmax[i] != space_idx).flatten()
+            group = np.split(data, np.where(np.diff(data) != 1)[0] + 1)
+            group = [list(item) for item in group if len(item) > 0]
+            for j, list_idx in enumerate(group):
+                t = ctcBeamSearch(mat[i, list_idx, :], converter.character, converter.ignore_idx, None,
+                                  beamWidth=beamWidth, dict_list=converter.dict_list)
+                string += t if j == 0 else ' ' + t
+        else:
+            for word in word_segmentation(argmax[i]):
+                dict_list = [] if word[0] == '' else converter.dict_list[word[0]]
+                string += ctcBeamSearch(mat[i, word[1][0]:word[1][1] + 1, :], converter.character,
+                                        converter.ignore_idx, None, beamWidth=beamWidth, dict_list=dict_list)
+        texts.append(string)
+    return texts
+
+
+# ——— inputs ———
+
+def synthetic_maps(n_words=400, height=1600, width=640, seed=0):
+    """
+    CRAFT-like region/affinity maps of a receipt: rows of words, each a run of
+    blurred character blobs (textmap) joined by blurred links (linkmap).
+    """
+    rng = np.random.default_rng(seed)
+    textmap = np.zeros((height, width), np.float32)
+    linkmap = np.zeros((height, width), np.float32)
+    y, x = 10, 10
+    for _ in range(n_words):
+        n_chars = int(rng.integers(1, 12))
+        ch = int(rng.integers(6, 14))
+        cw = int(ch * rng.uniform(0.5, 0.9))
+        if x + n_chars * (cw + 2) > width - 10:
+            y, x = y + ch + int(rng.integers(4, 12)), 10
+        if y + ch > height - 10:
+            break
+        for c in range(n_chars):
+            cx = x + c * (cw + 2)
+            cv2.rectangle(textmap, (cx, y), (cx + cw, y + ch), float(rng.uniform(0.6, 1.0)), -1)
+            if c:
+                cv2.rectangle(linkmap, (cx - 3, y + ch // 4), (cx + 1, y + 3 * ch // 4), float(rng.uniform(0.4, 0.9)), -1)
+        x += n_chars * (cw + 2) + int(rng.integers(8, 30))
+    textmap = cv2.GaussianBlur(textmap, (5, 5), 1.5)
+    linkmap = cv2.GaussianBlur(linkmap, (5, 5), 1.5)
+    return textmap, linkmap
+
+
+def synthetic_curved_maps(n_words=150, height=1280, width=960, seed=0):
+    """
+    Region/affinity maps of text set along arcs (stamps, curved labels, bent receipts),
+    the case poly=True exists for: character blobs and links following a circle.
+    """
+    rng = np.random.default_rng(seed)
+    textmap = np.zeros((height, width), np.float32)
+    linkmap = np.zeros((height, width), np.float32)
+    for _ in range(n_words):
+        n_chars = int(rng.integers(6, 14))
+        ch = int(rng.integers(8, 16))
+        radius = rng.uniform(4, 10) * ch
+        step = 1.2 * ch / radius                           # angle between character centres
+        start = rng.uniform(0, 2 * np.pi)
+        cx, cy = rng.uniform(radius, width - radius), rng.uniform(radius, height - radius)
+        if not (0 < cx - radius and cx + radius < width and 0 < cy - radius and cy + radius < height):
+            continue
+        prev = None
+        for c in range(n_chars):
+            a = start + c * step
+            centre = (int(cx + radius * np.cos(a)), int(cy + radius * np.sin(a)))
+            angle = np.degrees(a) + 90
+            cv2.ellipse(textmap, centre, (ch // 3, ch // 2), angle, 0, 360, float(rng.uniform(0.6, 1.0)), -1)
+            if prev is not None:
+                cv2.line(linkmap, prev, centre, float(rng.uniform(0.4, 0.9)), max(1, ch // 4))
+            prev = centre
+    textmap = cv2.GaussianBlur(textmap, (5, 5), 1.5)
+    linkmap = cv2.GaussianBlur(linkmap, (5, 5), 1.5)
+    return textmap, linkmap
+
+
+def image_maps(path, max_side=2560):
+    """
+    Stand-in CRAFT maps for a real image (no detector weights needed): dark ink at
+    half resolution, blurred, as the region map, and the gaps a horizontal closing
+    bridges between neighbouring glyphs as the affinity map.
+    """
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    scale = min(1.0, max_side / max(img.shape)) / 2
+    img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ink = cv2.adaptiveThreshold(img, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10).astype(np.float32)
+    textmap = cv2.GaussianBlur(ink, (7, 7), 2)
+    textmap /= max(1e-6, float(textmap.max()))
+    joined = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    linkmap = cv2.GaussianBlur(np.clip(joined - ink, 0, 1), (5, 5), 1.5)
+    return textmap, linkmap
+
+
+def synthetic_ctc(converter, words, batch=64, frames=80, seed=0):
+    """
+    Recognizer-like softmax outputs: dictionary words laid out over the frames
+    (1-3 frames per character, blanks in between, spaces between words), with
+    noise and a share of ambiguous frames where a second character competes.
+    Returns the probabilities and the true texts.
+    """
+    rng = np.random.default_rng(seed)
+    n_class = len(converter.character)
+    logits = rng.normal(0, 1, (batch, frames, n_class))
+    texts = []
+    for b in range(batch):
+        path, text = [], []
+        while True:
+            word = words[rng.integers(len(words))]
+            chars = [converter.dict[c] for c in word if c in converter.dict]
+            if text:
+                chars = [converter.dict[' ']] + chars
+            step = [0] * int(rng.integers(0, 2))
+            for c in chars:
+                step += [c] * int(rng.integers(1, 4)) + [0] * int(rng.integers(0, 2))
+            if len(path) + len(step) > frames:
+                break
+            path += step
+            text.append(word)
+        path += [0] * (frames - len(path))
+        texts.append(' '.join(text))
+        for t, c in enumerate(path):
+            logits[b, t, c] += rng.uniform(4, 9)
+            if rng.random() < 0.05:     # ambiguous frame
+                logits[b, t, rng.integers(1, n_class)] += rng.uniform(3, 8)
+    probs = np.exp(logits - logits.max(axis=2, keepdims=True))
+    return (probs / probs.sum(axis=2, keepdims=True)).astype(np.float32), texts
+
+
+FIELD_FORMATS = {
+    "Truck ID": r"TRK ?\d{3,5}",
+    "Warehouse ID": r"WH-\d{2}",
+    "Shipping Dock ID": r"D\d{1,3}",
+    "Loading Time": r"\d{1,2}:\d{2}(:\d{2})? ?[AP]M",
+}
+LOOKALIKES = {"0": "O", "1": "l", "5": "S", "8": "B", "2": "Z", "O": "0", "D": "0", "M": "N", "T": "7"}
+
+
+def synthetic_fields(converter, batch=256, seed=0):
+    """
+    Recognizer-like outputs for field values in the FIELD_FORMATS formats, where a
+    share of the characters lose out to a look-alike (0/O, 1/l, 8/B, ...) the way
+    `8:00:O0 AM` does. Returns [(field, probabilities, true text)].
+    """
+    rng = np.random.default_rng(seed)
+    n_class = len(converter.character)
+    digits = lambda n: "".join(str(d) for d in rng.integers(0, 10, n))
+    makers = {
+        "Truck ID": lambda: "TRK " + digits(4),
+        "Warehouse ID": lambda: "WH-" + digits(2),
+        "Shipping Dock ID": lambda: "D" + digits(int(rng.integers(1, 4))),
+        "Loading Time": lambda: f"{rng.integers(1, 13)}:{rng.integers(0, 6)}0:00 {'AP'[rng.integers(2)]}M",
+    }
+    fields = list(FIELD_FORMATS)
+    samples = []
+    for b in range(batch):
+        field = fields[b % len(fields)]
+        text = makers[field]()
+        path, confused = [0], [None]
+        for k, c in enumerate(text):
+            lookalike = LOOKALIKES.get(c) if rng.random() < 0.15 else None
+            # a blank always separates repeated characters, otherwise CTC would merge them
+            blanks = 1 if k + 1 < len(text) and text[k + 1] == c else int(rng.integers(0, 2))
+            n = int(rng.integers(1, 3))
+            path += [converter.dict[c]] * n + [0] * blanks
+            confused += [lookalike] * n + [None] * blanks
+        path += [0, 0]; confused += [None, None]
+        logits = rng.normal(0, 1, (len(path), n_class))
+        for t, (c, lookalike) in enumerate(zip(path, confused)):
+            logits[t, c] += rng.uniform(5, 9)
+            if lookalike:
+                logits[t, converter.dict[lookalike]] = logits[t, c] + rng.uniform(0.2, 1.5)
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        samples.append((field, (probs / probs.sum(axis=1, keepdims=True)).astype(np.float32), text))
+    return samples
+
+
+RECEIPT_WORDS = ["Order", "ID", "Truck", "Date", "WH-01", "Dock", "Bay", "12", "Widgets", "Priority",
+                 "08:00:00", "AM", "2025-05-19", "987654112349587825G", "Carrier", "Stow", "A-3"]
+
+
+def synthetic_receipts(n=64, lines=20, seed=0):
+    """Rendered grey receipts with one horizontal_list box per text line, and the line texts."""
+    rng = np.random.default_rng(seed)
+    font, scale, thick = cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2
+    receipts = []
+    for _ in range(n):
+        grey = np.full((lines * 40 + 20, 640), 255, np.uint8)
+        boxes, texts = [], []
+        for i in range(lines):
+            text = " ".join(rng.choice(RECEIPT_WORDS, int(rng.integers(1, 5))))
+            (w, _), _ = cv2.getTextSize(text, font, scale, thick)
+            y = 10 + i * 40
+            cv2.putText(grey, text, (10, y + 26), font, scale, 0, thick)
+            boxes.append([4, min(16 + w, 639), y, y + 36])
+            texts.append(text)
+        receipts.append((grey, boxes, texts))
+    return receipts
+
+
+def _ctc_log_prob(mat, text, converter):
+    """Exact log P(text | mat) with the CTC forward algorithm."""
+    labels = [converter.dict[c] for c in text]
+    ext = [0]
+    for l in labels:
+        ext += [l, 0]
+    logp = np.log(np.maximum(mat.astype(np.float64), 1e-300))
+    alpha = np.full(len(ext), -np.inf)
+    alpha[0] = logp[0, 0]
+    if len(ext) > 1:
+        alpha[1] = logp[0, ext[1]]
+    for t in range(1, len(mat)):
+        prev = alpha
+        alpha = prev.copy()
+        alpha[1:] = np.logaddexp(alpha[1:], prev[:-1])
+        skip = np.array([s >= 2 and ext[s] != 0 and ext[s] != ext[s - 2] for s in range(len(ext))])
+        alpha[2:] = np.where(skip[2:], np.logaddexp(alpha[2:], prev[:-2]), alpha[2:])
+        alpha = alpha + logp[t, ext]
+    return np.logaddexp(alpha[-1], alpha[-2]) if len(ext) > 1 else alpha[-1]
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+# ——— benchmarks ———
+
+def bench_detboxes(args):
+    if args.maps:
+        data = np.load(args.maps)
+        textmap, linkmap = data["textmap"], data["linkmap"]
+    else:
+        textmap, linkmap = synthetic_maps(args.words)
+    params = (0.7, 0.4, 0.4)
+
+    ok = True
+    for estimate_num_chars in (False, True):
+        call = lambda f: f(textmap, linkmap, *params, estimate_num_chars)
+        (ref_boxes, ref_labels, ref_mapper), t_ref = _time(lambda: call(_getDetBoxes_core_reference), args.repeat)
+        (boxes, labels, mapper), t_new = _time(lambda: call(craft_utils.getDetBoxes_core), args.repeat)
+
+        same = (len(ref_boxes) == len(boxes) and ref_mapper == mapper
+                and np.array_equal(ref_labels, labels)
+                and all(np.array_equal(a, b) for a, b in zip(ref_boxes, boxes)))
+        ok &= same
+        print(f"getDetBoxes_core estimate_num_chars={estimate_num_chars}: {len(boxes)} boxes on "
+              f"{textmap.shape[1]}x{textmap.shape[0]} | reference {t_ref * 1000:.1f} ms, "
+              f"current {t_new * 1000:.1f} ms ({t_ref / t_new:.1f}x) | identical: {same}")
+    return ok
+
+
+def bench_poly(args):
+    images = args.images or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples", "*")))
+    inputs = [("synthetic curved", synthetic_curved_maps(args.words))]
+    inputs += [(os.path.basename(path), image_maps(path)) for path in images]
+
+    ok = True
+    total_ref = total_new = 0.
+    for name, (textmap, linkmap) in inputs:
+        boxes, labels, mapper = craft_utils.getDetBoxes_core(textmap, linkmap, 0.7, 0.4, 0.4)
+        ref, t_ref = _time(lambda: _getPoly_core_reference(boxes, labels, mapper, linkmap), args.repeat)
+        new, t_new = _time(lambda: craft_utils.getPoly_core(boxes, labels, mapper, linkmap), args.repeat)
+        same = len(ref) == len(new) and all((a is None and b is None) or
+                                            (a is not None and b is not None and np.array_equal(a, b))
+                                            for a, b in zip(ref, new))
+        ok &= same
+        total_ref += t_ref; total_new += t_new
+        print(f"getPoly_core {name:24s}: {len(boxes):4d} boxes, {sum(p is not None for p in new):4d} polygons | "
+              f"reference {t_ref * 1000:7.1f} ms, current {t_new * 1000:6.1f} ms ({t_ref / t_new:4.1f}x) | identical: {same}")
+    print(f"total: reference {total_ref * 1000:.1f} ms, current {total_new * 1000:.1f} ms ({total_ref / total_new:.1f}x)")
+    return ok
+
+
+def _peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_ingest(args):
+    paths = args.images or sorted(glob.glob("examples/*.png") + glob.glob("examples/*.jpg"))
+    rows = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        cases = {
+            # old: two decodes (cv2 grey + skimage colour) / new: one mmap'd decode
+            "path": (lambda: _reformat_input_reference(path),
+                     lambda: (lambda d: (d.color, d.grey))(decode_image(path))),
+            # old app_ai.py: imdecode, then readtext reconverts the BGR array
+            "upload": (lambda: (lambda a: (a, cv2.cvtColor(a, cv2.COLOR_BGR2GRAY)))(
+                           cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)),
+                       lambda: (lambda d: (d.color, d.grey))(decode_image(data))),
+            # cache hit / detect only: the grey view is never built
+            "colour-only": (lambda: _reformat_input_reference(data)[0],
+                            lambda: decode_image(data).color),
+        }
+        for case, (old, new) in cases.items():
+            _, t_old = _time(old, args.repeat)
+            _, t_new = _time(new, args.repeat)
+            rows.append((path, case, t_old, t_new, _peak_bytes(old), _peak_bytes(new)))
+
+    print(f"{'image':40s} {'case':12s} {'old ms':>8s} {'new ms':>8s} {'old peak MB':>12s} {'new peak MB':>12s}")
+    for path, case, t_old, t_new, m_old, m_new in rows:
+        print(f"{path[-40:]:40s} {case:12s} {t_old * 1000:8.2f} {t_new * 1000:8.2f} "
+              f"{m_old / 2**20:12.2f} {m_new / 2**20:12.2f}")
+    for case in ("path", "upload", "colour-only"):
+        sel = [r for r in rows if r[1] == case]
+        t_old, t_new = sum(r[2] for r in sel), sum(r[3] for r in sel)
+        m_old, m_new = max(r[4] for r in sel), max(r[5] for r in sel)
+        print(f"{case}: {t_old / t_new:.2f}x faster, peak {m_old / 2**20:.1f} MB -> {m_new / 2**20:.1f} MB")
+    return True
+
+
+HEAVY_MODULES = ("torch", "torchvision", "scipy", "skimage", "bidi", "yaml")
+
+# run in a fresh interpreter: time to `import easyocr` and get at easyocr.Reader
+_STARTUP_PROBE = """
+import sys, time
+start = time.perf_counter()
+import easyocr
+easyocr.Reader
+print(time.perf_counter() - start)
+print(" ".join(m for m in %r if m in sys.modules))
+"""
+
+
+def _probe_startup(package_parent, repeat):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_parent, os.environ.get("PYTHONPATH")])))
+    best = float("inf")
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE % (HEAVY_MODULES,)], env=env,
+                             capture_output=True, text=True, check=True).stdout.splitlines()
+        best = min(best, float(out[0]))
+    return best, out[1].split() if len(out) > 1 else []
+
+
+def bench_startup(args):
+    current = os.path.dirname(os.path.dirname(os.path.abspath(easyocr_utils.__file__)))
+    runs = [("baseline", args.baseline)] if args.baseline else []
+    runs.append(("current", current))
+    for name, parent in runs:
+        t, loaded = _probe_startup(parent, args.repeat)
+        print(f"{name:8s} import easyocr + Reader: {t * 1000:7.0f} ms | loaded: {', '.join(loaded) or '-'}")
+
+    models = args.models or sorted(glob.glob(os.path.expanduser("~/.EasyOCR/model/*.pth")))
+    for path in models:
+        easyocr_utils.calculate_md5(path)     # make sure the size+mtime entry exists
+        _, t_hash = _time(lambda: easyocr_utils.calculate_md5(path, use_cache=False), args.repeat)
+        _, t_cached = _time(lambda: easyocr_utils.calculate_md5(path), args.repeat)
+        print(f"md5 {os.path.basename(path):30s} hashed {t_hash * 1000:8.1f} ms | cached {t_cached * 1000:6.2f} ms")
+    return True
+
+
+def bench_beamsearch(args):
+    model = recognition_models['gen2']['english_g2']
+    converter = CTCLabelConverter(model['characters'], {}, {'en': os.path.join(BASE_PATH, 'dict', 'en.txt')})
+    words = [w for w in converter.dict_list if w and all(c in converter.dict for c in w)]
+    mat, truth = synthetic_ctc(converter, words, args.batch, args.frames)
+    converter.get_dict_trie()     # built (or loaded from the disk cache) outside the timing
+
+    ok = True
+    cases = (("beamsearch", _decode_beamsearch_reference, converter.decode_beamsearch),
+             ("wordbeamsearch", _decode_wordbeamsearch_reference, converter.decode_wordbeamsearch))
+    for name, reference, current in cases:
+        ref, t_ref = _time(lambda: reference(converter, mat, args.beam), args.repeat)
+        new, t_new = _time(lambda: current(mat, beamWidth=args.beam), args.repeat)
+        same = sum(a == b for a, b in zip(ref, new))
+        print(f"{name}: {len(mat)} x {mat.shape[1]} frames, beam {args.beam} | reference {t_ref * 1000:.1f} ms, "
+              f"current {t_new * 1000:.1f} ms ({t_ref / t_new:.1f}x) | same text {same}/{len(mat)}")
+        if name == "beamsearch":
+            # where the texts differ, the better decode is the one with the higher CTC probability
+            diff = [(_ctc_log_prob(m, a, converter), _ctc_log_prob(m, b, converter))
+                    for m, a, b in zip(mat, ref, new) if a != b]
+            worse = sum(lb < la - 1e-6 for la, lb in diff)
+            gain = sum(lb - la for la, lb in diff)
+            print(f"  differing: {len(diff)}, current more probable in {len(diff) - worse}, "
+                  f"less probable in {worse} (total log-prob gain {gain:+.2f})")
+            ok &= gain >= 0
+        else:
+            def word_accuracy(texts):
+                pairs = [(a, b) for text, true in zip(texts, truth) for a, b in zip(text.split(' '), true.split(' '))]
+                return sum(a == b for a, b in pairs) / max(1, sum(len(t.split(' ')) for t in truth))
+            print(f"  word accuracy vs. ground truth: reference {word_accuracy(ref):.1%}, current {word_accuracy(new):.1%}")
+            ok &= word_accuracy(new) >= word_accuracy(ref)
+    return ok
+
+
+def bench_constrained(args):
+    import re
+    model = recognition_models['gen2']['english_g2']
+    converter = CTCLabelConverter(model['characters'], {}, {})
+    samples = synthetic_fields(converter, args.batch)
+    for pattern in FIELD_FORMATS.values():
+        converter.compile_constraint(pattern)     # compiled once per process, outside the timing
+
+    def run(decode):
+        texts = [None] * len(samples)
+        for field, pattern in FIELD_FORMATS.items():
+            idx = [i for i, s in enumerate(samples) if s[0] == field]
+            for i, text in zip(idx, decode([samples[i][1] for i in idx], pattern)):
+                texts[i] = text
+        return texts
+
+    free, t_free = _time(lambda: run(lambda mats, _: converter.decode_beamsearch(mats, beamWidth=args.beam)), args.repeat)
+    constrained, t_con = _time(lambda: run(lambda mats, pattern: [text for text, _ in
+                                   converter.decode_constrained(mats, pattern, beamWidth=args.beam)]), args.repeat)
+    truth = [s[2] for s in samples]
+    ok = True
+    print(f"constrained: {len(samples)} field crops, beam {args.beam} | beamsearch {t_free * 1000:.1f} ms, "
+          f"constrained {t_con * 1000:.1f} ms")
+    for field, pattern in FIELD_FORMATS.items():
+        idx = [i for i, s in enumerate(samples) if s[0] == field]
+        acc_free = sum(free[i] == truth[i] for i in idx) / len(idx)
+        acc_con = sum(constrained[i] == truth[i] for i in idx) / len(idx)
+        valid = sum(bool(re.fullmatch(pattern, constrained[i])) for i in idx)
+        print(f"  {field:18s} exact: beamsearch {acc_free:6.1%}, constrained {acc_con:6.1%} | "
+              f"format-valid {valid}/{len(idx)}")
+        ok &= acc_con >= acc_free and valid == len(idx)
+    return ok
+
+
+def _box_iou(a, b):
+    # horizontal_list boxes: [x_min, x_max, y_min, y_max]
+    w = min(a[1], b[1]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[2], b[2])
+    if w <= 0 or h <= 0:
+        return 0.
+    inter = w * h
+    return inter / float((a[1] - a[0]) * (a[3] - a[2]) + (b[1] - b[0]) * (b[3] - b[2]) - inter)
+
+
+def bench_canvas(args):
+    import easyocr
+    paths = args.images or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "large-receipt-image-dataset-SRD", "*.jpg")))
+    paths = paths[:args.limit]
+    reader = easyocr.Reader(["en"], gpu=False, verbose=False)
+    get_textbox = reader.get_textbox
+
+    total_fixed = total_auto = 0.
+    n_boxes = n_found = n_words = n_same = 0
+    canvases = collections.Counter()
+    for path in paths:
+        image = decode_image(path)
+        detect = lambda canvas: reader.detect(image.color, canvas_size=canvas, reformat=False,
+                                              target_text_height=args.target)
+        (fixed_h, fixed_f), t_fixed = _time(lambda: detect(args.canvas), args.repeat)
+        # also record which canvas auto settled on: the probe's, or the one it reran at
+        chosen = []
+        reader.get_textbox = lambda *a, **kw: chosen.append(kw["canvas_size"]) or get_textbox(*a, **kw)
+        try:
+            (auto_h, auto_f), t_auto = _time(lambda: detect("auto"), args.repeat)
+        finally:
+            reader.get_textbox = get_textbox
+        canvases[chosen[-1]] += 1
+        fixed_h, fixed_f, auto_h, auto_f = fixed_h[0], fixed_f[0], auto_h[0], auto_f[0]
+        total_fixed += t_fixed; total_auto += t_auto
+
+        found = sum(any(_box_iou(a, b) >= 0.5 for b in auto_h) for a in fixed_h)
+        read = lambda h, f: collections.Counter(reader.recognize(image.grey, h, f, detail=0, reformat=False))
+        fixed_words, auto_words = read(fixed_h, fixed_f), read(auto_h, auto_f)
+        same = sum((fixed_words & auto_words).values())
+        n_boxes += len(fixed_h); n_found += found
+        n_words += sum(fixed_words.values()); n_same += same
+
+        print(f"{os.path.basename(path)[-28:]:28s} {image.color.shape[1]:5d}x{image.color.shape[0]:<5d} "
+              f"auto canvas {chosen[-1]:5d} | detect {t_fixed * 1000:6.0f} ms -> {t_auto * 1000:6.0f} ms | "
+              f"boxes {found}/{len(fixed_h)} | words {same}/{sum(fixed_words.values())}")
+
+    print(f"canvas {args.canvas} vs auto (target {args.target} px) on {len(paths)} images: detect "
+          f"{total_fixed:.1f} s -> {total_auto:.1f} s ({1 - total_auto / max(total_fixed, 1e-9):.1%} saved) | "
+          f"box recall {n_found / max(n_boxes, 1):.1%} | word agreement {n_same / max(n_words, 1):.1%}")
+    print("auto canvases: " + ", ".join(f"{c}: {n}" for c, n in sorted(canvases.items())))
+    return True
+
+
+def bench_batching(args):
+    import torch
+    import easyocr
+    from recognition_batcher import RecognitionBatcher
+    receipts = synthetic_receipts(args.receipts, args.lines)
+    # the thread split ReaderPool applies: the cores divided between its Readers
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // args.workers))
+    load = lambda: easyocr.Reader(["en"], gpu=False, detector=False, verbose=False)
+
+    def drive(recognize):
+        with ThreadPoolExecutor(args.clients) as clients:
+            return list(clients.map(recognize, receipts))
+
+    readers = Queue()
+    for _ in range(args.workers):
+        readers.put(load())
+
+    def pooled(receipt):
+        reader = readers.get()
+        try:
+            return reader.recognize(receipt[0], receipt[1], [], reformat=False)
+        finally:
+            readers.put(reader)
+
+    pool_out, t_pool = _time(lambda: drive(pooled), args.repeat)
+    batcher = RecognitionBatcher(readers.get(), max_batch=args.max_batch, max_wait_ms=args.wait)
+    try:
+        batch_out, t_batch = _time(lambda: drive(lambda r: batcher.recognize(r[0], r[1], [])), args.repeat)
+    finally:
+        batcher.close()
+
+    n_lines = sum(len(boxes) for _, boxes, _ in receipts)
+    same = sum(a[1] == b[1] for pool_res, batch_res in zip(pool_out, batch_out) for a, b in zip(pool_res, batch_res))
+    print(f"{len(receipts)} receipts x {args.lines} lines, {args.clients} concurrent clients, "
+          f"{os.cpu_count()} cores, torch threads {torch.get_num_threads()}")
+    print(f"{args.workers} Readers        : {t_pool:6.2f} s  {len(receipts) / t_pool:6.1f} receipts/s")
+    print(f"batcher ({args.wait:g} ms, {args.max_batch}): {t_batch:6.2f} s  {len(receipts) / t_batch:6.1f} receipts/s "
+          f"({t_pool / t_batch:.2f}x) | same text on {same}/{n_lines} lines")
+    return True
+
+
+def bench_widthbucket(args):
+    import easyocr
+    from easyocr.easyocr import imgH
+    from easyocr.utils import get_image_list
+    from easyocr.recognition import get_text
+    reader = easyocr.Reader(["en"], gpu=False, detector=False, verbose=False)
+    receipts = synthetic_receipts(args.receipts, args.lines)
+    ignore_char = "".join(set(reader.character) - set(reader.lang_char))
+
+    def batched(bucketing):
+        out = []
+        for grey, boxes, _ in receipts:
+            image_list, max_width = get_image_list(boxes, [], grey, model_height=imgH)
+            out.append([text for _, text, _ in get_text(reader.character, imgH, int(max_width), reader.recognizer,
+                                                         reader.converter, image_list, ignore_char,
+                                                         batch_size=args.batch, device=reader.device,
+                                                         width_bucketing=bucketing)])
+        return out
+
+    def per_box():
+        return [reader.recognize(grey, boxes, [], detail=0, reformat=False) for grey, boxes, _ in receipts]
+
+    truth = [line for _, _, texts in receipts for line in texts]
+    n_chars = sum(len(line) for line in truth)
+    print(f"{len(receipts)} receipts x {args.lines} lines, batch {args.batch}, torch on {reader.device}")
+    for name, fn in [("batched, padded to widest", lambda: batched(False)),
+                     ("batched, width buckets  ", lambda: batched(True)),
+                     ("one box at a time (CPU) ", per_box)]:
+        out, t = _time(fn, args.repeat)
+        read = [line for lines in out for line in lines]
+        exact = sum(a == b for a, b in zip(read, truth))
+        # matched characters per rendered character
+        chars = sum(m.size for a, b in zip(read, truth) for m in difflib.SequenceMatcher(None, a, b).get_matching_blocks())
+        print(f"{name}: {t:6.2f} s | lines exact {exact}/{len(truth)} | chars {chars / max(n_chars, 1):.1%}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EasyOCR post-processing benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("detboxes", help="craft_utils.getDetBoxes_core")
+    p.add_argument("--words", type=int, default=400, help="words on the synthetic receipt")
+    p.add_argument("--maps", help="npz with real textmap/linkmap arrays instead of synthetic ones")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_detboxes)
+
+    p = sub.add_parser("poly", help="craft_utils.getPoly_core (readtext with poly / curved text)")
+    p.add_argument("images", nargs="*", help="images to build stand-in CRAFT maps from (default: examples/)")
+    p.add_argument("--words", type=int, default=150, help="curved words on the synthetic map")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_poly)
+
+    p = sub.add_parser("ingest", help="image decode: old reformat_input vs decode_image")
+    p.add_argument("images", nargs="*", help="images to decode (default: examples/)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("startup", help="cold `import easyocr` time and model md5 verification")
+    p.add_argument("--baseline", help="directory containing an older `easyocr` package to compare against")
+    p.add_argument("--models", nargs="*", help="model files to hash (default: ~/.EasyOCR/model/*.pth)")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("beamsearch", help="CTC beam search: per-image dict beams vs batched prefix search")
+    p.add_argument("--batch", type=int, default=64, help="crops per batch")
+    p.add_argument("--frames", type=int, default=80, help="recognizer time steps per crop")
+    p.add_argument("--beam", type=int, default=5)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_beamsearch)
+
+    p = sub.add_parser("constrained", help="field crops: free beam search vs regex-constrained decoding")
+    p.add_argument("--batch", type=int, default=256, help="field crops")
+    p.add_argument("--beam", type=int, default=5)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_constrained)
+
+    p = sub.add_parser("canvas", help="detection: fixed canvas_size vs canvas_size='auto' (needs the models)")
+    p.add_argument("images", nargs="*", help="images to detect (default: large-receipt-image-dataset-SRD/)")
+    p.add_argument("--limit", type=int, default=40, help="at most this many images")
+    p.add_argument("--target", type=int, default=16, help="target_text_height for 'auto'")
+    p.add_argument("--canvas", type=int, default=2560, help="the fixed canvas_size to compare against")
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_canvas)
+
+    p = sub.add_parser("batching", help="recognition: Reader pool vs cross-request batcher (needs the model)")
+    p.add_argument("--receipts", type=int, default=64, help="synthetic receipts to recognize")
+    p.add_argument("--lines", type=int, default=20, help="text lines per receipt")
+    p.add_argument("--clients", type=int, default=8, help="concurrent requests")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="pool Readers (OCR_WORKERS)")
+    p.add_argument("--wait", type=float, default=10, help="batcher max wait in ms (OCR_BATCH_WAIT_MS)")
+    p.add_argument("--max_batch", type=int, default=64, help="crops per batcher pass (OCR_MAX_BATCH)")
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_batching)
+
+    p = sub.add_parser("widthbucket", help="recognition: batches with / without width bucketing (needs the model)")
+    p.add_argument("--receipts", type=int, default=16, help="synthetic receipts to recognize")
+    p.add_argument("--lines", type=int, default=20, help="text lines per receipt")
+    p.add_argument("--batch", type=int, default=32, help="crops per recognizer batch")
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_widthbucket)
+
+    args = parser.parse_args()
+    sys.exit(0 if args.func(args) else 1)
+
+
+if __name__ == "__main__":
+    main()
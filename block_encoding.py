@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import sys
+import csv
+import json
+
+from field_extractor import row_tolerance
+
+# ——— CONFIG ———
+MIN_BLOCK_CONF = 0.1    # blocks below this confidence are treated as OCR noise
+# —————————————————
+
+# how the compact encoding is described to the LLM, shared by every prompt
+BLOCK_FORMAT = ("One text row per line, top to bottom: `y | x text (conf) | x text (conf) ...` "
+                "where x/y are the pixel centre of each block and conf is the OCR confidence.")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model("gpt-4")
+
+    def count_tokens(text):
+        return len(_encoding.encode(text))
+except ImportError:
+    def count_tokens(text):
+        """Rough GPT token estimate (~4 chars/token) when tiktoken is not installed."""
+        return max(1, len(text) // 4)
+
+
+def group_rows(blocks):
+    """Cluster blocks into text rows by y, each row sorted left to right."""
+    if not blocks:
+        return []
+    tol = row_tolerance(blocks)
+    rows = []
+    for b in sorted(blocks, key=lambda b: b["y"]):
+        if rows and b["y"] - rows[-1][-1]["y"] <= tol:
+            rows[-1].append(b)
+        else:
+            rows.append([b])
+    return [sorted(row, key=lambda b: b["x"]) for row in rows]
+
+
+def paragraph_blocks(raw_result, x_ths=1.0, y_ths=0.0):
+    """
+    Merge readtext (bbox, text, conf) results that sit side by side on one line
+    into single blocks using easyocr's get_paragraph. conf is the mean of the
+    merged pieces.
+    """
+    from easyocr.utils import get_paragraph
+
+    merged = []
+    for box, text in get_paragraph(raw_result, x_ths=x_ths, y_ths=y_ths):
+        (x0, y0), _, (x1, y1), _ = box
+        confs = [conf for bbox, _, conf in raw_result
+                 if x0 <= (bbox[0][0] + bbox[2][0]) / 2 <= x1 and y0 <= (bbox[0][1] + bbox[2][1]) / 2 <= y1]
+        merged.append({"text": text, "conf": float(sum(confs) / len(confs)) if confs else 1.0,
+                       "x": (x0 + x1) / 2, "y": (y0 + y1) / 2})
+    return merged
+
+
+def encode_blocks(blocks, min_conf=MIN_BLOCK_CONF):
+    """Line-grouped, rounded, low-confidence-filtered text rendering of OCR blocks (see BLOCK_FORMAT)."""
+    kept = [b for b in blocks if b["text"].strip() and b["conf"] >= min_conf]
+    lines = []
+    for row in group_rows(kept):
+        y = round(sum(b["y"] for b in row) / len(row))
+        cells = [f'{round(b["x"])} {b["text"].strip().replace("|", "/")} ({b["conf"]:.2f})' for b in row]
+        lines.append(f"{y} | " + " | ".join(cells))
+    return "\n".join(lines)
+
+
+def token_report(blocks, min_conf=MIN_BLOCK_CONF):
+    """Prompt tokens for the old indented-JSON block dump vs. the compact encoding."""
+    before = count_tokens(json.dumps(blocks, indent=2))
+    after = count_tokens(encode_blocks(blocks, min_conf))
+    return {"json_tokens": before, "compact_tokens": after,
+            "saved_pct": round(100.0 * (before - after) / before, 1) if before else 0.0}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python block_encoding.py raw_ocr.csv", file=sys.stderr)
+        sys.exit(1)
+    with open(sys.argv[1], newline="", encoding="utf-8") as f:
+        blocks = [{"text": r["text"], "conf": float(r["confidence"]),
+                   "x": float(r["x"]), "y": float(r["y"])} for r in csv.DictReader(f)]
+    print(encode_blocks(blocks))
+    print()
+    report = token_report(blocks)
+    print(f"🔢 {report['json_tokens']} → {report['compact_tokens']} prompt tokens "
+          f"({report['saved_pct']}% saved)")
@@ -1,19 +1,30 @@
 #!/usr/bin/env python3
+import os
 import sys
 import csv
 import cv2
 import easyocr
+from easyocr.utils import decode_image, DecodedImage
 import numpy as np               # ← Ensure numpy is imported
 from pathlib import Path
 
-def extract_blocks(image_path: Path):
-    """Load image and return EasyOCR blocks: list of (bbox, text, conf)."""
-    img = cv2.imread(str(image_path))
-    if img is None:
-        raise FileNotFoundError(f"Cannot open image: {image_path}")
-    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    reader = easyocr.Reader(["en"], gpu=False)
-    return reader.readtext(rgb, detail=1)
+# ——— CONFIG ———
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite")   # "" disables the OCR result cache
+# —————————————————
+
+_reader = None
+
+def get_reader():
+    """Build the EasyOCR Reader once (with the on-disk result cache) and reuse it."""
+    global _reader
+    if _reader is None:
+        _reader = easyocr.Reader(["en"], gpu=False, cache=OCR_CACHE_PATH or None)
+    return _reader
+
+def extract_blocks(image):
+    """Return EasyOCR blocks: list of (bbox, text, conf). `image` is a path or a DecodedImage."""
+    reader = get_reader()
+    return reader.readtext(image if isinstance(image, DecodedImage) else str(image), detail=1)
 
 def dump_raw_csv(blocks, out_csv="raw_ocr.csv"):
     """Write raw OCR blocks to CSV for inspection."""
@@ -33,9 +44,9 @@ def dump_raw_csv(blocks, out_csv="raw_ocr.csv"):
             })
     print(f"✅ Raw OCR data written to {out_csv}")
 
-def annotate_image(blocks, image_path: Path, out_image="annotated.jpg"):
+def annotate_image(blocks, image: DecodedImage, out_image="annotated.jpg"):
     """Draw bounding boxes + text onto the image and save for visual check."""
-    img = cv2.imread(str(image_path))
+    img = image.bgr.copy()
     for bbox, text, _ in blocks:
         # Draw the polygon
         pts = np.array(bbox, np.int32).reshape((-1,1,2))
@@ -66,14 +77,15 @@ def main():
         print(f"❌ File not found: {img_path}", file=sys.stderr)
         sys.exit(1)
 
-    # 1) extract raw blocks
-    blocks = extract_blocks(img_path)
+    # 1) decode once, extract raw blocks
+    image = decode_image(str(img_path))
+    blocks = extract_blocks(image)
 
     # 2) dump them to CSV
     dump_raw_csv(blocks, out_csv="raw_ocr.csv")
 
     # 3) create annotated image
-    annotate_image(blocks, img_path, out_image="annotated.jpg")
+    annotate_image(blocks, image, out_image="annotated.jpg")
 
 if __name__ == "__main__":
     main()
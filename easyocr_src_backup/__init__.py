@@ -1,3 +1,16 @@
-from .easyocr import Reader
-
 __version__ = '1.7.2'
+
+# Reader pulls in torch; it is imported on first access so `import easyocr` (CLI
+# argument parsing, easyocr.OCRCache, easyocr.utils helpers) stays cheap
+_lazy_attrs = {'Reader': '.easyocr', 'OCRCache': '.cache'}
+
+def __getattr__(name):
+    if name in _lazy_attrs:
+        import importlib
+        value = getattr(importlib.import_module(_lazy_attrs[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attrs))
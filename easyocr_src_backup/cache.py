@@ -0,0 +1,92 @@
+import os
+import re
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+def _stable(value):
+    # JSON stand-ins for parameter values; anything else (e.g. an object whose repr is
+    # its memory address) raises TypeError and that call is not cached
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return ['ndarray', value.shape, value.dtype.str, hashlib.blake2b(np.ascontiguousarray(value)).hexdigest()]
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    if isinstance(value, re.Pattern):
+        return ['re', value.pattern, value.flags]
+    raise TypeError('no stable cache key for %r' % type(value).__name__)
+
+class OCRCache(object):
+    """ Persistent readtext result cache, stored in SQLite with LRU eviction by total size.
+
+    Keys are a hash of the decoded image, the readtext parameters, the md5 of
+    the models that produced the result and the Reader settings that change its
+    output (Reader.cache_settings), so changing any of them is a miss.
+    """
+
+    def __init__(self, path='ocr_cache.sqlite', max_bytes=256 * 1024 * 1024):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS ocr_cache ('
+                          'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                          'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ocr_cache_last_used ON ocr_cache(last_used)')
+
+    @staticmethod
+    def make_key(img, params, model_md5s=(), settings=None):
+        """ Cache key, or None when a parameter has no stable value to key on. """
+        img = np.ascontiguousarray(img)
+        h = hashlib.blake2b(digest_size=20)
+        h.update(str((img.shape, img.dtype.str)).encode())
+        h.update(memoryview(img).cast('B'))
+        try:
+            h.update(json.dumps([params, settings], sort_keys=True, default=_stable).encode())
+        except TypeError:
+            return None
+        h.update(','.join(model_md5s).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM ocr_cache WHERE key=?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute('UPDATE ocr_cache SET last_used=? WHERE key=?', (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key, result):
+        value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO ocr_cache VALUES (?,?,?,?)',
+                              (key, value, len(value), time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM ocr_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute('SELECT key, size FROM ocr_cache ORDER BY last_used').fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self.conn.executemany('DELETE FROM ocr_cache WHERE key=?', stale)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM ocr_cache')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,5 +1,22 @@
+import os
+import sys
+import csv
+import glob
+import json
+import queue
 import argparse
+import threading
+import multiprocessing
 import easyocr
+from easyocr.utils import decode_image
+
+STREAM_FIELDS = ["file", "text", "confidence", "x", "y"]
+# readtext options readtext_batched has no equivalent for
+SINGLE_IMAGE_KWARGS = ("tile_height", "tile_overlap", "target_text_height")
+
+
+def canvas_size_arg(value):
+    return value if value == 'auto' else int(value)
 
 
 def parse_args():
@@ -72,12 +89,74 @@ def parse_args():
         default=True,
         help="Use dynamic quantization",
     )
-    parser.add_argument(
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument(
         "-f",
         "--file",
-        required=True,
         type=str,
-        help="input file",
+        help="input file, or - to read an encoded image from stdin",
+    )
+    inputs.add_argument(
+        "--input_dir",
+        "--input-dir",
+        type=str,
+        help="stream every image in this directory (see --pattern)",
+    )
+    inputs.add_argument(
+        "--glob",
+        type=str,
+        help="stream every image matching this glob, e.g. 'scans/**/*.jpg'",
+    )
+    inputs.add_argument(
+        "--input_list",
+        "--input-list",
+        type=str,
+        help="stream the image paths listed in this file, one per line (- for stdin)",
+    )
+    parser.add_argument(
+        "--pattern",
+        type=str,
+        default="*.png,*.jpg,*.jpeg,*.bmp,*.tif,*.tiff",
+        help="comma separated file patterns used with --input_dir",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="-",
+        help="streaming mode: file the results are appended to (default: stdout)",
+    )
+    parser.add_argument(
+        "--stream_format",
+        type=str,
+        choices=["jsonl", "csv"],
+        default="jsonl",
+        help="streaming mode: one file/text/confidence/x/y record per text box",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="streaming mode: list of finished images; they are skipped on the next run (default: <output>.done)",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="streaming mode: number of OCR processes, each with its own Reader",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=4,
+        help="streaming mode: images decoded ahead of OCR",
+    )
+    parser.add_argument(
+        "--detect_batch",
+        type=int,
+        default=8,
+        help="streaming mode: at most this many images per readtext_batched call (1: one readtext per image; "
+             "--tile_height and --canvas_size auto always read image by image)",
     )
     parser.add_argument(
         "--decoder",
@@ -174,9 +253,28 @@ def parse_args():
     )
     parser.add_argument(
         "--canvas_size",
-        type=int,
+        type=canvas_size_arg,
         default=2560,
-        help="Maximum image size. Image bigger than this value will be resized down.",
+        help="Maximum image size. Image bigger than this value will be resized down. "
+             "'auto' sizes it from the text on each image (see --target_text_height).",
+    )
+    parser.add_argument(
+        "--target_text_height",
+        type=int,
+        default=16,
+        help="With --canvas_size auto: pixel height the smaller text is detected at",
+    )
+    parser.add_argument(
+        "--tile_height",
+        type=int,
+        default=None,
+        help="Detect images taller than this as overlapping full-width tiles of this height instead of shrinking them to canvas_size",
+    )
+    parser.add_argument(
+        "--tile_overlap",
+        type=float,
+        default=0.15,
+        help="Overlap between detection tiles, as a fraction of tile_height",
     )
     parser.add_argument(
         "--mag_ratio",
@@ -226,6 +324,14 @@ def parse_args():
         default=0.1,
         help="Extend bounding boxes in all direction by certain value. This is important for language with complex script (E.g. Thai).",
     )
+    parser.add_argument(
+        "--width_bucketing",
+        type=bool,
+        choices=[True, False],
+        default=False,
+        help="Group text boxes by width so each recognition batch is padded only to its widest box "
+             "(GPU with --batch_size > 1 only: on CPU boxes are recognized one at a time)",
+    )
     parser.add_argument(
         "--output_format",
         type=str,
@@ -238,44 +344,257 @@ def parse_args():
     return args
 
 
+def iter_inputs(args):
+    if args.input_dir:
+        paths = set()
+        for pattern in args.pattern.split(','):
+            pattern = pattern.strip()
+            if pattern:
+                paths.update(glob.glob(os.path.join(args.input_dir, pattern)))
+                paths.update(glob.glob(os.path.join(args.input_dir, pattern.upper())))
+        for path in sorted(paths):
+            yield path
+    elif args.glob:
+        for path in sorted(glob.glob(args.glob, recursive=True)):
+            yield path
+    else:
+        f = sys.stdin if args.input_list == '-' else open(args.input_list, encoding='utf-8')
+        with f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+def manifest_key(path):
+    st = os.stat(path)
+    return '{}\t{}\t{}'.format(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+def result_rows(path, result):
+    # same text/confidence/x/y layout as raw_ocr.csv, plus the source file
+    rows = []
+    for item in result:
+        bbox, text = item[0], item[1]
+        rows.append({'file': path,
+                     'text': text,
+                     'confidence': round(float(item[2]), 3) if len(item) > 2 else '',
+                     'x': round(sum(float(pt[0]) for pt in bbox) / len(bbox), 1),
+                     'y': round(sum(float(pt[1]) for pt in bbox) / len(bbox), 1)})
+    return rows
+
+def _error(e):
+    return '{}: {}'.format(type(e).__name__, e)
+
+def ocr_images(reader, items, readtext_kwargs, batched):
+    """ [(path, image)] -> [(path, rows, error)]. With `batched`, the images go through one
+    readtext_batched call (shape-bucketed detection); if that fails they are redone one
+    by one, so a single bad image only fails itself.
+    """
+    if batched and len(items) > 1:
+        batched_kwargs = {k: v for k, v in readtext_kwargs.items() if k not in SINGLE_IMAGE_KWARGS}
+        try:
+            results = reader.readtext_batched([image for _, image in items], **batched_kwargs)
+            return [(path, result_rows(path, result), None) for (path, _), result in zip(items, results)]
+        except Exception:
+            pass
+    done = []
+    for path, image in items:
+        try:
+            done.append((path, result_rows(path, reader.readtext(image, **readtext_kwargs)), None))
+        except Exception as e:
+            done.append((path, None, _error(e)))
+    return done
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+_stream_reader = None
+
+def _init_stream_worker(reader_kwargs, n_processes):
+    global _stream_reader
+    import torch
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // n_processes))
+    _stream_reader = easyocr.Reader(**reader_kwargs)
+
+def _ocr_paths(paths, readtext_kwargs, batched):
+    items, failed = [], []
+    for path in paths:
+        try:
+            items.append((path, decode_image(path)))
+        except Exception as e:
+            failed.append((path, None, _error(e)))
+    return failed + ocr_images(_stream_reader, items, readtext_kwargs, batched)
+
+def _prefetch(paths, q):
+    # decode ahead of the OCR loop; the bounded queue caps how many images are held
+    for path in paths:
+        try:
+            q.put((path, decode_image(path), None))
+        except Exception as e:
+            q.put((path, None, _error(e)))
+    q.put(None)
+
+def _prefetched_chunks(q, size):
+    # whatever is decoded already, up to `size` images: never wait for a chunk to fill up
+    while True:
+        item = q.get()
+        if item is None:
+            return
+        chunk = [item]
+        while len(chunk) < size:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                yield chunk
+                return
+            chunk.append(item)
+        yield chunk
+
+def _iter_results_local(paths, reader_kwargs, readtext_kwargs, prefetch, detect_batch, batched):
+    reader = easyocr.Reader(**reader_kwargs)
+    q = queue.Queue(maxsize=max(1, prefetch, detect_batch))
+    threading.Thread(target=_prefetch, args=(paths, q), daemon=True).start()
+    for chunk in _prefetched_chunks(q, detect_batch if batched else 1):
+        for path, _, error in chunk:
+            if error is not None:
+                yield path, None, error
+        for result in ocr_images(reader, [(path, image) for path, image, error in chunk if error is None],
+                                 readtext_kwargs, batched):
+            yield result
+
+def _ocr_paths_star(args):
+    return _ocr_paths(*args)
+
+def _iter_results_pool(paths, reader_kwargs, readtext_kwargs, processes, detect_batch, batched):
+    with multiprocessing.Pool(processes, initializer=_init_stream_worker,
+                              initargs=(reader_kwargs, processes)) as pool:
+        chunks = ((chunk, readtext_kwargs, batched) for chunk in _chunks(paths, detect_batch if batched else 1))
+        for results in pool.imap_unordered(_ocr_paths_star, chunks):
+            for result in results:
+                yield result
+
+def run_stream(args, reader_kwargs, readtext_kwargs):
+    """ OCR many images with warm Readers and append one record per text box as
+    each image finishes. Prefetched images are read in chunks of up to --detect_batch
+    through readtext_batched. Finished images go to the manifest and are skipped
+    when the same (unchanged) file comes up again.
+    """
+    readtext_kwargs = dict(readtext_kwargs, detail=1, output_format='standard')
+    manifest_path = args.manifest or (args.output + '.done' if args.output != '-' else None)
+    done = set()
+    if manifest_path and os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            done = set(line.rstrip('\n') for line in f)
+
+    def pending():
+        for path in iter_inputs(args):
+            try:
+                if manifest_key(path) in done:
+                    continue
+            except OSError:
+                pass    # missing file: let the OCR step report it
+            yield path
+
+    # tiles and per-image auto canvases only exist in readtext
+    batched = args.detect_batch > 1 and not args.tile_height and args.canvas_size != 'auto'
+    if args.processes > 1:
+        results = _iter_results_pool(pending(), reader_kwargs, readtext_kwargs, args.processes,
+                                     args.detect_batch, batched)
+    else:
+        results = _iter_results_local(pending(), reader_kwargs, readtext_kwargs, args.prefetch,
+                                      args.detect_batch, batched)
+
+    to_stdout = args.output == '-'
+    out = sys.stdout if to_stdout else open(args.output, 'a', newline='', encoding='utf-8')
+    manifest = open(manifest_path, 'a', encoding='utf-8') if manifest_path else None
+    n_done = n_failed = 0
+    try:
+        if args.stream_format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=STREAM_FIELDS)
+            if to_stdout or out.tell() == 0:
+                writer.writeheader()
+        for path, rows, error in results:
+            if error is not None:
+                n_failed += 1
+                print('failed: {} ({})'.format(path, error), file=sys.stderr)
+                continue
+            if args.stream_format == 'csv':
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    out.write(json.dumps(row, ensure_ascii=False) + '\n')
+            out.flush()
+            if manifest:
+                manifest.write(manifest_key(path) + '\n')
+                manifest.flush()
+            n_done += 1
+            if args.verbose:
+                print('[{}] {} ({} boxes)'.format(n_done, path, len(rows)), file=sys.stderr)
+    finally:
+        if not to_stdout:
+            out.close()
+        if manifest:
+            manifest.close()
+    if args.verbose:
+        print('done: {} images, {} failed'.format(n_done, n_failed), file=sys.stderr)
+
 def main():
     args = parse_args()
-    reader = easyocr.Reader(lang_list=args.lang,\
-                            gpu=args.gpu,\
-                            model_storage_directory=args.model_storage_directory,\
-                            user_network_directory=args.user_network_directory,\
-                            recog_network=args.recog_network,\
-                            download_enabled=args.download_enabled,\
-                            detector=args.detector,\
-                            recognizer=args.recognizer,\
-                            verbose=args.verbose,\
-                            quantize=args.quantize)
-    for line in reader.readtext(args.file,\
-                                decoder=args.decoder,\
-                                beamWidth=args.beamWidth,\
-                                batch_size=args.batch_size,\
-                                workers=args.workers,\
-                                allowlist=args.allowlist,\
-                                blocklist=args.blocklist,\
-                                detail=args.detail,\
-                                rotation_info=args.rotation_info,\
-                                paragraph=args.paragraph,\
-                                min_size=args.min_size,\
-                                contrast_ths=args.contrast_ths,\
-                                adjust_contrast=args.adjust_contrast,\
-                                text_threshold=args.text_threshold,\
-                                low_text=args.low_text,\
-                                link_threshold=args.link_threshold,\
-                                canvas_size=args.canvas_size,\
-                                mag_ratio=args.mag_ratio,\
-                                slope_ths=args.slope_ths,\
-                                ycenter_ths=args.ycenter_ths,\
-                                height_ths=args.height_ths,\
-                                width_ths=args.width_ths,\
-                                y_ths=args.y_ths,\
-                                x_ths=args.x_ths,\
-                                add_margin=args.add_margin,\
-                                output_format=args.output_format):
+    reader_kwargs = dict(lang_list=args.lang,\
+                         gpu=args.gpu,\
+                         model_storage_directory=args.model_storage_directory,\
+                         user_network_directory=args.user_network_directory,\
+                         recog_network=args.recog_network,\
+                         download_enabled=args.download_enabled,\
+                         detector=args.detector,\
+                         recognizer=args.recognizer,\
+                         verbose=args.verbose,\
+                         quantize=args.quantize)
+    readtext_kwargs = dict(decoder=args.decoder,\
+                           beamWidth=args.beamWidth,\
+                           batch_size=args.batch_size,\
+                           workers=args.workers,\
+                           allowlist=args.allowlist,\
+                           blocklist=args.blocklist,\
+                           detail=args.detail,\
+                           rotation_info=args.rotation_info,\
+                           paragraph=args.paragraph,\
+                           min_size=args.min_size,\
+                           contrast_ths=args.contrast_ths,\
+                           adjust_contrast=args.adjust_contrast,\
+                           text_threshold=args.text_threshold,\
+                           low_text=args.low_text,\
+                           link_threshold=args.link_threshold,\
+                           canvas_size=args.canvas_size,\
+                           mag_ratio=args.mag_ratio,\
+                           slope_ths=args.slope_ths,\
+                           ycenter_ths=args.ycenter_ths,\
+                           height_ths=args.height_ths,\
+                           width_ths=args.width_ths,\
+                           y_ths=args.y_ths,\
+                           x_ths=args.x_ths,\
+                           add_margin=args.add_margin,\
+                           output_format=args.output_format,\
+                           width_bucketing=args.width_bucketing,\
+                           tile_height=args.tile_height,\
+                           tile_overlap=args.tile_overlap,\
+                           target_text_height=args.target_text_height)
+
+    if args.file is None:
+        run_stream(args, reader_kwargs, readtext_kwargs)
+        return
+
+    reader = easyocr.Reader(**reader_kwargs)
+    # path / stdin bytes are decoded exactly once inside readtext
+    image = sys.stdin.buffer.read() if args.file == '-' else args.file
+    for line in reader.readtext(image, **readtext_kwargs):
         print(line)
 
 
@@ -7,7 +7,6 @@ MIT License
 import numpy as np
 import cv2
 import math
-from scipy.ndimage import label
 
 """ auxiliary functions """
 # unwarp corodinates
@@ -19,8 +18,6 @@ def warpCoord(Minv, pt):
 
 def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text, estimate_num_chars=False):
     # prepare data
-    linkmap = linkmap.copy()
-    textmap = textmap.copy()
     img_h, img_w = textmap.shape
 
     """ labeling method """
@@ -32,24 +29,26 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text,
 
     det = []
     mapper = []
+    if nLabels < 2:
+        return det, labels, mapper
+
+    # per-label max score in one pass, and the link-only area once for all components
+    fg = labels > 0
+    max_scores = np.full(nLabels, -np.inf, dtype=textmap.dtype)
+    np.maximum.at(max_scores, labels[fg], textmap[fg])
+    link_area = np.logical_and(link_score==1, text_score==0)
+    if estimate_num_chars:
+        from scipy.ndimage import label # scipy is only needed for character counting
+        char_score = textmap - linkmap
+
     for k in range(1,nLabels):
         # size filtering
         size = stats[k, cv2.CC_STAT_AREA]
         if size < 10: continue
 
         # thresholding
-        if np.max(textmap[labels==k]) < text_threshold: continue
+        if max_scores[k] < text_threshold: continue
 
-        # make segmentation map
-        segmap = np.zeros(textmap.shape, dtype=np.uint8)
-        segmap[labels==k] = 255
-        if estimate_num_chars:
-            _, character_locs = cv2.threshold((textmap - linkmap) * segmap /255., text_threshold, 1, 0)
-            _, n_chars = label(character_locs)
-            mapper.append(n_chars)
-        else:
-            mapper.append(k)
-        segmap[np.logical_and(link_score==1, text_score==0)] = 0   # remove link area
         x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
         w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
         niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
@@ -59,11 +58,23 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text,
         if sy < 0 : sy = 0
         if ex >= img_w: ex = img_w
         if ey >= img_h: ey = img_h
+
+        # make segmentation map, only over the component's (dilation-padded) window
+        segmap = np.zeros((ey - sy, ex - sx), dtype=np.uint8)
+        segmap[labels[sy:ey, sx:ex]==k] = 255
+        if estimate_num_chars:
+            _, character_locs = cv2.threshold(char_score[sy:ey, sx:ex] * segmap /255., text_threshold, 1, 0)
+            _, n_chars = label(character_locs)
+            mapper.append(n_chars)
+        else:
+            mapper.append(k)
+        segmap[link_area[sy:ey, sx:ex]] = 0   # remove link area
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT,(1 + niter, 1 + niter))
-        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+        segmap = cv2.dilate(segmap, kernel)
 
         # make box
         np_contours = np.roll(np.array(np.where(segmap!=0)),1,axis=0).transpose().reshape(-1,2)
+        np_contours += (sx, sy)
         rectangle = cv2.minAreaRect(np_contours)
         box = cv2.boxPoints(rectangle)
 
@@ -84,6 +95,38 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text,
 
     return det, labels, mapper
 
+def column_contours(word_label):
+    """ First / last nonzero row of every column with at least two pixels of a bool mask. """
+    counts = cv2.reduce(word_label.view(np.uint8), 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[0]
+    cols = np.flatnonzero(counts >= 2)
+    top = word_label.argmax(axis=0)[cols]
+    bottom = word_label.shape[0] - 1 - word_label[::-1].argmax(axis=0)[cols]
+    return cols, top, bottom
+
+def segment_starts(xs, seg_w, tot_seg):
+    # a segment ends at the first column at or past its right edge, at most one step per column;
+    # None if the first column is already past the first edge (nothing in segment 0)
+    if xs[0] >= seg_w:
+        return None
+    starts = [0]
+    for seg_num in range(1, tot_seg):
+        j = max(starts[-1] + 1, int(np.searchsorted(xs, seg_num * seg_w, side='left')))
+        if j >= len(xs):
+            break
+        starts.append(j)
+    return starts
+
+def line_hits(word_label, line_img, p):
+    """ Whether the 1px line p = (x0, y0, x1, y1) crosses the label mask. line_img is a zeroed
+    scratch image of the same shape; the line is drawn, tested and erased within its bounding box. """
+    x0, y0, x1, y1 = int(p[0]), int(p[1]), int(p[2]), int(p[3])
+    cv2.line(line_img, (x0, y0), (x1, y1), 1, thickness=1)
+    sx, ex = max(0, min(x0, x1)), max(0, max(x0, x1) + 1)
+    sy, ey = max(0, min(y0, y1)), max(0, max(y0, y1) + 1)
+    hit = np.logical_and(word_label[sy:ey, sx:ex], line_img[sy:ey, sx:ex]).any()
+    line_img[sy:ey, sx:ex] = 0
+    return hit
+
 def getPoly_core(boxes, labels, mapper, linkmap):
     # configs
     num_cp = 5
@@ -110,19 +153,14 @@ def getPoly_core(boxes, labels, mapper, linkmap):
 
         # binarization for selected label
         cur_label = mapper[k]
-        word_label[word_label != cur_label] = 0
-        word_label[word_label > 0] = 1
+        word_label = word_label == cur_label # component ids start at 1
 
         """ Polygon generation """
         # find top/bottom contours
-        cp = []
-        max_len = -1
-        for i in range(w):
-            region = np.where(word_label[:,i] != 0)[0]
-            if len(region) < 2 : continue
-            cp.append((i, region[0], region[-1]))
-            length = region[-1] - region[0] + 1
-            if length > max_len: max_len = length
+        xs, tops, bottoms = column_contours(word_label)
+        if len(xs) == 0:
+            polys.append(None); continue
+        max_len = int((bottoms - tops).max()) + 1
 
         # pass if max_len is similar to h
         if h * max_len_ratio < max_len:
@@ -131,40 +169,33 @@ def getPoly_core(boxes, labels, mapper, linkmap):
         # get pivot points with fixed length
         tot_seg = num_cp * 2 + 1
         seg_w = w / tot_seg     # segment width
+        starts = segment_starts(xs, seg_w, tot_seg)
+        if starts is None:
+            polys.append(None); continue
         pp = [None] * num_cp    # init pivot points
         cp_section = [[0, 0]] * tot_seg
         seg_height = [0] * num_cp
-        seg_num = 0
-        num_sec = 0
-        prev_h = -1
-        for i in range(0,len(cp)):
-            (x, sy, ey) = cp[i]
-            if (seg_num + 1) * seg_w <= x and seg_num <= tot_seg:
-                # average previous segment
-                if num_sec == 0: break
-                cp_section[seg_num] = [cp_section[seg_num][0] / num_sec, cp_section[seg_num][1] / num_sec]
-                num_sec = 0
-
-                # reset variables
-                seg_num += 1
-                prev_h = -1
-
-            # accumulate center points
-            cy = (sy + ey) * 0.5
-            cur_h = ey - sy + 1
-            cp_section[seg_num] = [cp_section[seg_num][0] + x, cp_section[seg_num][1] + cy]
-            num_sec += 1
+        cys = (tops + bottoms) * 0.5
+        cur_hs = bottoms - tops + 1
+        ends = starts[1:] + [len(xs)]
+        for seg_num, (s, e) in enumerate(zip(starts, ends)):
+            # center points: averaged for finished segments, the last one keeps its sums
+            sum_x, sum_cy = int(xs[s:e].sum()), cys[s:e].sum()
+            if seg_num < len(starts) - 1:
+                cp_section[seg_num] = [sum_x / (e - s), sum_cy / (e - s)]
+            else:
+                cp_section[seg_num] = [sum_x, sum_cy]
 
             if seg_num % 2 == 0: continue # No polygon area
 
-            if prev_h < cur_h:
-                pp[int((seg_num - 1)/2)] = (x, cy)
-                seg_height[int((seg_num - 1)/2)] = cur_h
-                prev_h = cur_h
+            # tallest column of the segment (the first one on ties)
+            j = s + int(np.argmax(cur_hs[s:e]))
+            pp[int((seg_num - 1)/2)] = (int(xs[j]), cys[j])
+            seg_height[int((seg_num - 1)/2)] = cur_hs[j]
 
         # processing last segment
-        if num_sec != 0:
-            cp_section[-1] = [cp_section[-1][0] / num_sec, cp_section[-1][1] / num_sec]
+        num_sec = ends[-1] - starts[-1]
+        cp_section[-1] = [cp_section[-1][0] / num_sec, cp_section[-1][1] / num_sec]
 
         # pass if num of pivots is not sufficient or segment width is smaller than character height 
         if None in pp or seg_w < np.max(seg_height) * 0.25:
@@ -189,22 +220,19 @@ def getPoly_core(boxes, labels, mapper, linkmap):
         isSppFound, isEppFound = False, False
         grad_s = (pp[1][1] - pp[0][1]) / (pp[1][0] - pp[0][0]) + (pp[2][1] - pp[1][1]) / (pp[2][0] - pp[1][0])
         grad_e = (pp[-2][1] - pp[-1][1]) / (pp[-2][0] - pp[-1][0]) + (pp[-3][1] - pp[-2][1]) / (pp[-3][0] - pp[-2][0])
+        line_img = np.zeros(word_label.shape, dtype=np.uint8)
         for r in np.arange(0.5, max_r, step_r):
             dx = 2 * half_char_h * r
             if not isSppFound:
-                line_img = np.zeros(word_label.shape, dtype=np.uint8)
                 dy = grad_s * dx
                 p = np.array(new_pp[0]) - np.array([dx, dy, dx, dy])
-                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
-                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                if not line_hits(word_label, line_img, p) or r + 2 * step_r >= max_r:
                     spp = p
                     isSppFound = True
             if not isEppFound:
-                line_img = np.zeros(word_label.shape, dtype=np.uint8)
                 dy = grad_e * dx
                 p = np.array(new_pp[-1]) + np.array([dx, dy, dx, dy])
-                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
-                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                if not line_hits(word_label, line_img, p) or r + 2 * step_r >= max_r:
                     epp = p
                     isEppFound = True
             if isSppFound and isEppFound:
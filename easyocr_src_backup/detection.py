@@ -5,10 +5,12 @@ from PIL import Image
 from collections import OrderedDict
 
 import cv2
+import math
 import numpy as np
 from .craft_utils import getDetBoxes, adjustResultCoordinates
 from .imgproc import resize_aspect_ratio, normalizeMeanVariance
 from .craft import CRAFT
+from .weights import load_compiled
 
 def copyStateDict(state_dict):
     if list(state_dict.keys())[0].startswith("module"):
@@ -21,57 +23,119 @@ def copyStateDict(state_dict):
         new_state_dict[name] = v
     return new_state_dict
 
-def test_net(canvas_size, mag_ratio, net, image, text_threshold, link_threshold, low_text, poly, device, estimate_num_chars=False):
+BUCKET_MAX_PADDING = 0.25 # padding a shape bucket may add, as a share of its images' own canvas area
+
+def get_shape_buckets(shapes, max_padding=BUCKET_MAX_PADDING, max_batch_size=None):
+    """
+    Group canvas shapes (h, w) into batches padded to one common shape. Shapes are
+    taken in aspect-ratio order and a bucket grows while its padded area stays within
+    (1 + max_padding) of its images' own area. Returns [(H, W, [indices])].
+    """
+    order = sorted(range(len(shapes)), key=lambda i: (shapes[i][0] / shapes[i][1], tuple(shapes[i])))
+    buckets = []
+    for i in order:
+        h, w = shapes[i]
+        if buckets:
+            H, W, idx, area = buckets[-1]
+            new_H, new_W = max(H, h), max(W, w)
+            if (max_batch_size is None or len(idx) < max_batch_size) and \
+               new_H * new_W * (len(idx) + 1) <= (1 + max_padding) * (area + h * w):
+                buckets[-1] = (new_H, new_W, idx + [i], area + h * w)
+                continue
+        buckets.append((h, w, [i], h * w))
+    return [(H, W, idx) for H, W, idx, _ in buckets]
+
+def test_net(canvas_size, mag_ratio, net, image, text_threshold, link_threshold, low_text, poly, device, estimate_num_chars=False, batch_size=None):
     if isinstance(image, np.ndarray) and len(image.shape) == 4:  # image is batch of np arrays
         image_arrs = image
+    elif isinstance(image, (list, tuple)):                       # images of any sizes
+        image_arrs = image
     else:                                                        # image is single numpy array
         image_arrs = [image]
 
     img_resized_list = []
+    ratios = []
     # resize
     for img in image_arrs:
         img_resized, target_ratio, size_heatmap = resize_aspect_ratio(img, canvas_size,
                                                                       interpolation=cv2.INTER_LINEAR,
                                                                       mag_ratio=mag_ratio)
         img_resized_list.append(img_resized)
-    ratio_h = ratio_w = 1 / target_ratio
-    # preprocessing
-    x = [np.transpose(normalizeMeanVariance(n_img), (2, 0, 1))
-         for n_img in img_resized_list]
-    x = torch.from_numpy(np.array(x))
-    x = x.to(device)
-
-    # forward pass
-    with torch.no_grad():
-        y, feature = net(x)
-
-    boxes_list, polys_list = [], []
-    for out in y:
-        # make score and link map
-        score_text = out[:, :, 0].cpu().data.numpy()
-        score_link = out[:, :, 1].cpu().data.numpy()
-
-        # Post-processing
-        boxes, polys, mapper = getDetBoxes(
-            score_text, score_link, text_threshold, link_threshold, low_text, poly, estimate_num_chars)
-
-        # coordinate adjustment
-        boxes = adjustResultCoordinates(boxes, ratio_w, ratio_h)
-        polys = adjustResultCoordinates(polys, ratio_w, ratio_h)
-        if estimate_num_chars:
-            boxes = list(boxes)
-            polys = list(polys)
-        for k in range(len(polys)):
+        ratios.append(1 / target_ratio)
+
+    boxes_list, polys_list = [None] * len(img_resized_list), [None] * len(img_resized_list)
+    # one forward pass per shape bucket; images are padded (like resize_aspect_ratio pads
+    # to a multiple of 32) to the bucket's shape and the padding is cut off the heatmaps
+    for H, W, idx in get_shape_buckets([img.shape[:2] for img in img_resized_list], max_batch_size=batch_size):
+        x = []
+        for i in idx:
+            img = img_resized_list[i]
+            if img.shape[:2] != (H, W):
+                padded = np.zeros((H, W, img.shape[2]), dtype=img.dtype)
+                padded[:img.shape[0], :img.shape[1]] = img
+                img = padded
+            # preprocessing
+            x.append(np.transpose(normalizeMeanVariance(img), (2, 0, 1)))
+        x = torch.from_numpy(np.array(x))
+        x = x.to(device)
+
+        # forward pass
+        with torch.no_grad():
+            y, feature = net(x)
+
+        for i, out in zip(idx, y):
+            h, w = img_resized_list[i].shape[:2]
+            ratio_h = ratio_w = ratios[i]
+            # make score and link map
+            score_text = out[:h // 2, :w // 2, 0].cpu().data.numpy()
+            score_link = out[:h // 2, :w // 2, 1].cpu().data.numpy()
+
+            # Post-processing
+            boxes, polys, mapper = getDetBoxes(
+                score_text, score_link, text_threshold, link_threshold, low_text, poly, estimate_num_chars)
+
+            # coordinate adjustment
+            boxes = adjustResultCoordinates(boxes, ratio_w, ratio_h)
+            polys = adjustResultCoordinates(polys, ratio_w, ratio_h)
             if estimate_num_chars:
-                boxes[k] = (boxes[k], mapper[k])
-            if polys[k] is None:
-                polys[k] = boxes[k]
-        boxes_list.append(boxes)
-        polys_list.append(polys)
+                boxes = list(boxes)
+                polys = list(polys)
+            for k in range(len(polys)):
+                if estimate_num_chars:
+                    boxes[k] = (boxes[k], mapper[k])
+                if polys[k] is None:
+                    polys[k] = boxes[k]
+            boxes_list[i] = boxes
+            polys_list[i] = polys
 
     return boxes_list, polys_list
 
-def get_detector(trained_model, device='cpu', quantize=True, cudnn_benchmark=False):
+AUTO_CANVAS_PROBE = 640    # canvas of the low-resolution pass that measures the text
+AUTO_CANVAS_MAX = 2560
+AUTO_TEXT_PERCENTILE = 20  # size the canvas for the smaller text on the page, not the average
+
+def text_box_heights(text_boxes):
+    """ Heights of get_textbox boxes (8 values, clockwise from the top-left corner). """
+    boxes = np.asarray(text_boxes, dtype=np.float64).reshape(-1, 4, 2)
+    return np.linalg.norm(boxes[:, 2] - boxes[:, 1], axis=1)
+
+def choose_canvas_size(text_boxes, image_shape, target_text_height, max_size=AUTO_CANVAS_MAX):
+    """
+    Smallest canvas (long side, multiple of 32) at which the smaller detected text
+    is still target_text_height pixels tall, capped at max_size. None when no text
+    was detected to measure.
+    """
+    if len(text_boxes) == 0:
+        return None
+    height = max(1., float(np.percentile(text_box_heights(text_boxes), AUTO_TEXT_PERCENTILE)))
+    canvas = int(math.ceil(max(image_shape[:2]) * target_text_height / height / 32.)) * 32
+    return int(min(max(canvas, 32), max_size))
+
+def get_detector(trained_model, device='cpu', quantize=True, cudnn_benchmark=False, use_compiled=True):
+    if device == 'cpu' and use_compiled:
+        net = load_compiled(trained_model, CRAFT, quantize)
+        if net is not None:
+            return net
     net = CRAFT()
 
     if device == 'cpu':
@@ -89,13 +153,13 @@ def get_detector(trained_model, device='cpu', quantize=True, cudnn_benchmark=Fal
     net.eval()
     return net
 
-def get_textbox(detector, image, canvas_size, mag_ratio, text_threshold, link_threshold, low_text, poly, device, optimal_num_chars=None, **kwargs):
+def get_textbox(detector, image, canvas_size, mag_ratio, text_threshold, link_threshold, low_text, poly, device, optimal_num_chars=None, detect_batch_size=None, **kwargs):
     result = []
     estimate_num_chars = optimal_num_chars is not None
     bboxes_list, polys_list = test_net(canvas_size, mag_ratio, detector,
                                        image, text_threshold,
                                        link_threshold, low_text, poly,
-                                       device, estimate_num_chars)
+                                       device, estimate_num_chars, detect_batch_size)
     if estimate_num_chars:
         polys_list = [[p for p, _ in sorted(polys, key=lambda x: abs(optimal_num_chars - x[1]))]
                       for polys in polys_list]
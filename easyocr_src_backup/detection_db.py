@@ -67,40 +67,51 @@ def test_net(image,
     '''
     if isinstance(image, np.ndarray) and len(image.shape) == 4:  # image is batch of np arrays
         image_arrs = image
+    elif isinstance(image, (list, tuple)):                       # images of any sizes
+        image_arrs = image
     else:                                                        # image is single numpy array
         image_arrs = [image]
     
     # resize
-    images, original_shapes = zip(*[detector.resize_image(img, canvas_size) for img in image_arrs])
-    # preprocessing
-    images = [np.transpose(detector.normalize_image(n_img), (2, 0, 1)) for n_img in images]
-    image_tensor = torch.from_numpy(np.array(images)).to(device)
-    # forward pass
-    with torch.no_grad():
-        hmap = detector.image2hmap(image_tensor.to(device))
-        bboxes, _ = detector.hmap2bbox(
-                            image_tensor, 
-                            original_shapes,
-                            hmap, 
-                            text_threshold = threshold, 
-                            bbox_min_score = bbox_min_score, 
-                            bbox_min_size = bbox_min_size, 
-                            max_candidates = max_candidates, 
-                            as_polygon=False)
-        if poly:
-            polys, _ = detector.hmap2bbox(
+    resized, original_shapes = zip(*[detector.resize_image(img, canvas_size) for img in image_arrs])
+    # one forward pass per resized shape (the heatmap is mapped back from its own size)
+    groups = {}
+    for i, img in enumerate(resized):
+        groups.setdefault(img.shape, []).append(i)
+    all_bboxes, all_polys = [None] * len(resized), [None] * len(resized)
+    for idx in groups.values():
+        # preprocessing
+        images = [np.transpose(detector.normalize_image(resized[i]), (2, 0, 1)) for i in idx]
+        shapes = [original_shapes[i] for i in idx]
+        image_tensor = torch.from_numpy(np.array(images)).to(device)
+        # forward pass
+        with torch.no_grad():
+            hmap = detector.image2hmap(image_tensor.to(device))
+            bboxes, _ = detector.hmap2bbox(
                                 image_tensor, 
-                                original_shapes,
+                                shapes,
                                 hmap, 
                                 text_threshold = threshold, 
                                 bbox_min_score = bbox_min_score, 
                                 bbox_min_size = bbox_min_size, 
                                 max_candidates = max_candidates, 
-                                as_polygon=True)
-        else:
-            polys = bboxes
+                                as_polygon=False)
+            if poly:
+                polys, _ = detector.hmap2bbox(
+                                    image_tensor, 
+                                    shapes,
+                                    hmap, 
+                                    text_threshold = threshold, 
+                                    bbox_min_score = bbox_min_score, 
+                                    bbox_min_size = bbox_min_size, 
+                                    max_candidates = max_candidates, 
+                                    as_polygon=True)
+            else:
+                polys = bboxes
+        for i, b, p in zip(idx, bboxes, polys):
+            all_bboxes[i], all_polys[i] = b, p
 
-    return bboxes, polys
+    return all_bboxes, all_polys
 
 def get_detector(trained_model, backbone = 'resnet18', device='cpu', quantize=True, cudnn_benchmark=False):
     '''
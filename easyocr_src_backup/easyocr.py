@@ -2,19 +2,19 @@
 
 from .recognition import get_recognizer, get_text
 from .utils import group_text_box, get_image_list, calculate_md5, get_paragraph,\
-                   download_and_unzip, printProgressBar, diff, reformat_input,\
+                   download_and_unzip, printProgressBar, diff, reformat_input, decode_image,\
                    make_rotated_img_list, set_result_with_confidence,\
-                   reformat_input_batched, merge_to_free
+                   reformat_input_batched, merge_to_free, get_tiles, merge_tile_boxes,\
+                   CTCLabelConverter
 from .config import *
-from bidi import get_display
+from .cache import OCRCache
+from .onnx_backend import OnnxModule, onnx_model_path
 import numpy as np
 import cv2
 import torch
 import os
 import sys
-from PIL import Image
 from logging import getLogger
-import yaml
 import json
 
 if sys.version_info[0] == 2:
@@ -33,7 +33,9 @@ class Reader(object):
                  user_network_directory=None, detect_network="craft", 
                  recog_network='standard', download_enabled=True, 
                  detector=True, recognizer=True, verbose=True, 
-                 quantize=True, cudnn_benchmark=False):
+                 quantize=True, cudnn_benchmark=False, cache=None,
+                 backend='torch', onnx_intra_op_threads=0, onnx_inter_op_threads=0,
+                 use_compiled=True):
         """Create an EasyOCR Reader
 
         Parameters:
@@ -50,9 +52,30 @@ class Reader(object):
             EASYOCR_MODULE_PATH (preferred), MODULE_PATH (if defined), or ~/.EasyOCR/.
 
             download_enabled (bool): Enabled downloading of model data via HTTP (default).
+
+            cache (string or OCRCache): Path of an on-disk readtext result cache, or a shared
+            OCRCache instance. Repeated readtext calls on the same image and parameters are then
+            answered from the cache (default: no cache).
+
+            backend (string): 'torch' (default) or 'onnx'. With 'onnx' the CRAFT detector and the
+            recognizer run as onnxruntime CPU sessions loaded from <model name>.onnx files in the
+            model storage directory (create them with `python -m easyocr.export`).
+
+            onnx_intra_op_threads, onnx_inter_op_threads (int): onnxruntime thread pool sizes for the
+            'onnx' backend (0 = onnxruntime default).
+
+            use_compiled (bool): On CPU, load the detector / recognizer from the memory-mapped
+            compiled weights written by `python -m easyocr.weights` when they exist and match
+            the downloaded model (default: True).
         """
         self.verbose = verbose
         self.download_enabled = download_enabled
+        self.cache = OCRCache(cache) if isinstance(cache, str) else cache
+        self.model_md5s = []
+        if backend not in ('torch', 'onnx'):
+            raise ValueError("backend must be 'torch' or 'onnx'")
+        self.backend = backend
+        onnx_threads = dict(intra_op_threads=onnx_intra_op_threads, inter_op_threads=onnx_inter_op_threads)
 
         self.model_storage_directory = MODULE_PATH + '/model'
         if model_storage_directory:
@@ -80,16 +103,28 @@ class Reader(object):
                     LOGGER.warning('Neither CUDA nor MPS are available - defaulting to CPU. Note: This module is much faster with a GPU.')
         else:
             self.device = gpu
+        if backend == 'onnx':
+            self.device = 'cpu' # onnxruntime CPU sessions; keep pre/post-processing tensors on CPU
 
         self.detection_models = detection_models
         self.recognition_models = recognition_models
 
         # check and download detection model
         self.support_detection_network = ['craft', 'dbnet18']
-        self.quantize=quantize, 
+        self.quantize=quantize
+        self.use_compiled=use_compiled
         self.cudnn_benchmark=cudnn_benchmark
-        if detector:
+        if detector and backend == 'onnx':
+            if detect_network != 'craft':
+                raise RuntimeError("The onnx backend supports the craft detector only.")
+            from .detection import get_textbox
+            self.detect_network = detect_network
+            self.get_textbox = get_textbox
+            detector_path = onnx_model_path(self.model_storage_directory, self.detection_models['craft']['filename'])
+        elif detector:
             detector_path = self.getDetectorPath(detect_network)
+        if detector:
+            self.detector_path = detector_path
         
         # recognition model
         separator_list = {}
@@ -166,10 +201,13 @@ class Reader(object):
                     model = recognition_models['gen2']['latin_g2']
                     recog_network = 'generation2'
             self.character = model['characters']
+            self.model_md5s.append(model['md5sum'])
 
             model_path = os.path.join(self.model_storage_directory, model['filename'])
             # check recognition model file
-            if recognizer:
+            if recognizer and backend == 'onnx':
+                model_path = onnx_model_path(self.model_storage_directory, model['filename'])
+            elif recognizer:
                 if os.path.isfile(model_path) == False:
                     if not self.download_enabled:
                         raise FileNotFoundError("Missing %s and downloads disabled" % model_path)
@@ -191,6 +229,7 @@ class Reader(object):
             self.setLanguageList(lang_list, model)
 
         else: # user-defined model
+            import yaml
             with open(os.path.join(self.user_network_directory, recog_network+ '.yaml'), encoding='utf8') as file:
                 recog_config = yaml.load(file, Loader=yaml.FullLoader)
             
@@ -202,17 +241,23 @@ class Reader(object):
             self.setModelLanguage(recog_network, lang_list, available_lang, str(available_lang))
             #char_file = os.path.join(self.user_network_directory, recog_network+ '.txt')
             self.character = recog_config['character_list']
-            model_file = recog_network+ '.pth'
+            model_file = recog_network+ ('.onnx' if backend == 'onnx' else '.pth')
             model_path = os.path.join(self.model_storage_directory, model_file)
+            if cache is not None:
+                self.model_md5s.append(calculate_md5(model_path))
             self.setLanguageList(lang_list, recog_config)
 
         dict_list = {}
         for lang in lang_list:
             dict_list[lang] = os.path.join(BASE_PATH, 'dict', lang + ".txt")
 
-        if detector:
+        if detector and backend == 'onnx':
+            self.detector = OnnxModule(detector_path, **onnx_threads)
+            if cache is not None:
+                self.model_md5s.append(calculate_md5(detector_path))
+        elif detector:
             self.detector = self.initDetector(detector_path)
-            
+
         if recognizer:
             if recog_network == 'generation1':
                 network_params = {
@@ -228,9 +273,24 @@ class Reader(object):
                     }
             else:
                 network_params = recog_config['network_params']
-            self.recognizer, self.converter = get_recognizer(recog_network, network_params,\
-                                                         self.character, separator_list,\
-                                                         dict_list, model_path, device = self.device, quantize=quantize)
+            if backend == 'onnx':
+                self.converter = CTCLabelConverter(self.character, separator_list, dict_list)
+                self.recognizer = OnnxModule(model_path, **onnx_threads)
+                if cache is not None:
+                    self.model_md5s.append(calculate_md5(model_path))
+            else:
+                self.recognizer, self.converter = get_recognizer(recog_network, network_params,\
+                                                             self.character, separator_list,\
+                                                             dict_list, model_path, device = self.device, quantize=quantize,\
+                                                             use_compiled=use_compiled)
+            self.recognizer_path = model_path
+
+        # Reader settings that change the output without changing the model files, e.g.
+        # ['fr'] and ['fr', 'de'] share latin_g2 but ignore different characters
+        self.cache_settings = {'lang_list': list(lang_list),
+                               'lang_char': ''.join(sorted(getattr(self, 'lang_char', ''))),
+                               'dict_list': sorted(dict_list.values()),
+                               'quantize': quantize, 'backend': backend}
 
     def getDetectorPath(self, detect_network):
         if detect_network in self.support_detection_network:
@@ -245,6 +305,7 @@ class Reader(object):
             self.get_detector = get_detector
             corrupt_msg = 'MD5 hash mismatch, possible file corruption'
             detector_path = os.path.join(self.model_storage_directory, self.detection_models[self.detect_network]['filename'])
+            self.model_md5s.append(self.detection_models[self.detect_network]['md5sum'])
             if os.path.isfile(detector_path) == False:
                 if not self.download_enabled:
                     raise FileNotFoundError("Missing %s and downloads disabled" % detector_path)
@@ -268,14 +329,18 @@ class Reader(object):
         return detector_path
 
     def initDetector(self, detector_path):
+        # compiled weights are only written for craft
+        compiled_kwargs = {'use_compiled': self.use_compiled} if self.detect_network == 'craft' else {}
         return self.get_detector(detector_path, 
                                  device = self.device, 
                                  quantize = self.quantize, 
-                                 cudnn_benchmark = self.cudnn_benchmark
+                                 cudnn_benchmark = self.cudnn_benchmark,
+                                 **compiled_kwargs
                                  )
     
     def setDetector(self, detect_network):
         detector_path = self.getDetectorPath(detect_network)
+        self.detector_path = detector_path
         self.detector = self.initDetector(detector_path)
     
     def setModelLanguage(self, language, lang_list, list_lang, list_lang_string):
@@ -313,26 +378,63 @@ class Reader(object):
                slope_ths = 0.1, ycenter_ths = 0.5, height_ths = 0.5,\
                width_ths = 0.5, add_margin = 0.1, reformat=True, optimal_num_chars=None,
                threshold = 0.2, bbox_min_score = 0.2, bbox_min_size = 3, max_candidates = 0,
+               tile_height = None, tile_overlap = 0.15, tile_batch_size = 4,
+               detect_batch_size = None, target_text_height = 16,
                ):
+        '''
+        canvas_size: long side the image is scaled to for detection (never above
+        mag_ratio x its own size), or 'auto': a cheap low-resolution pass measures
+        the text first, and the smallest canvas that keeps the smaller text about
+        target_text_height pixels tall is used (see _auto_canvas).
+        img: an image, a 4D batch of same-sized images, or (with reformat=False) a
+        list of images of any sizes; batches are grouped into aspect-ratio buckets,
+        each padded to one multiple-of-32 shape and detected in one forward pass.
+        tile_height: if set, images taller than this (in pixels) are detected as
+        overlapping full-width tiles of this height, tile_batch_size tiles per
+        forward pass, instead of being shrunk to canvas_size as a whole.
+        tile_overlap: overlap between neighbouring tiles, as a fraction of
+        tile_height; should exceed the tallest text line.
+        detect_batch_size: at most this many images per detector forward pass
+        (default: a whole bucket on GPU, one image on CPU).
+        '''
 
         if reformat:
-            img, img_cv_grey = reformat_input(img)
-
-        text_box_list = self.get_textbox(self.detector, 
-                                    img, 
-                                    canvas_size = canvas_size, 
-                                    mag_ratio = mag_ratio,
-                                    text_threshold = text_threshold, 
-                                    link_threshold = link_threshold, 
-                                    low_text = low_text,
-                                    poly = False, 
-                                    device = self.device, 
-                                    optimal_num_chars = optimal_num_chars,
-                                    threshold = threshold, 
-                                    bbox_min_score = bbox_min_score, 
-                                    bbox_min_size = bbox_min_size, 
-                                    max_candidates = max_candidates,
-                                    )
+            img = decode_image(img).color
+        if detect_batch_size is None and self.device == 'cpu':
+            # like recognize: batching gains nothing on CPU and multiplies activation memory
+            detect_batch_size = 1
+
+        textbox_kwargs = dict(canvas_size = canvas_size, 
+                              mag_ratio = mag_ratio,
+                              text_threshold = text_threshold, 
+                              link_threshold = link_threshold, 
+                              low_text = low_text,
+                              poly = False, 
+                              device = self.device, 
+                              optimal_num_chars = optimal_num_chars,
+                              threshold = threshold, 
+                              bbox_min_score = bbox_min_score, 
+                              bbox_min_size = bbox_min_size, 
+                              max_candidates = max_candidates,
+                              detect_batch_size = detect_batch_size,
+                              )
+
+        tiled = tile_height and isinstance(img, np.ndarray) and img.ndim == 3 and img.shape[0] > tile_height
+        text_box_list = None
+        if canvas_size == 'auto':
+            canvas_size, mag_ratio, text_box_list = self._auto_canvas(img, textbox_kwargs, target_text_height, probe = not tiled)
+            textbox_kwargs.update(canvas_size = canvas_size, mag_ratio = mag_ratio)
+
+        if tiled:
+            tile_height = int(tile_height)
+            tiles = get_tiles(img.shape[0], tile_height, int(tile_height * tile_overlap))
+            tile_boxes = []
+            for i in range(0, len(tiles), tile_batch_size):
+                batch = np.stack([img[top:top + tile_height] for top, _, _ in tiles[i:i + tile_batch_size]])
+                tile_boxes += self.get_textbox(self.detector, batch, **textbox_kwargs)
+            text_box_list = [merge_tile_boxes(tile_boxes, tiles)]
+        elif text_box_list is None:
+            text_box_list = self.get_textbox(self.detector, img, **textbox_kwargs)
 
         horizontal_list_agg, free_list_agg = [], []
         for text_box in text_box_list:
@@ -350,15 +452,51 @@ class Reader(object):
 
         return horizontal_list_agg, free_list_agg
 
+    def _auto_canvas(self, img, textbox_kwargs, target_text_height, probe=True):
+        '''
+        canvas_size='auto': detect on an AUTO_CANVAS_PROBE canvas, measure the detected
+        text and pick the smallest canvas that scales it to target_text_height pixels
+        (never magnifying past mag_ratio). Returns (canvas_size, mag_ratio, text boxes);
+        the boxes are the probe's own when it was already fine enough, else None.
+        '''
+        from .detection import choose_canvas_size, AUTO_CANVAS_PROBE, AUTO_CANVAS_MAX
+        if self.detect_network != 'craft':
+            raise ValueError("canvas_size='auto' is only supported with the craft detector")
+        max_mag = textbox_kwargs['mag_ratio']
+        if not probe:
+            return AUTO_CANVAS_MAX, max_mag, None
+        images = [img] if isinstance(img, np.ndarray) and img.ndim == 3 else list(img)
+        long_sides = [max(image.shape[:2]) for image in images]
+        probe_boxes = self.get_textbox(self.detector, img, **dict(textbox_kwargs, canvas_size = AUTO_CANVAS_PROBE, mag_ratio = 1.))
+
+        wanted = []
+        for boxes, image, long_side in zip(probe_boxes, images, long_sides):
+            max_size = min(AUTO_CANVAS_MAX, int(max_mag * long_side))
+            canvas = choose_canvas_size(boxes, image.shape, target_text_height, max_size)
+            wanted.append(max_size if canvas is None else canvas) # nothing found: full resolution
+        if all(w <= min(AUTO_CANVAS_PROBE, l) for w, l in zip(wanted, long_sides)):
+            return AUTO_CANVAS_PROBE, 1., probe_boxes
+        # one canvas for a batch: the finest scale any of its images needs
+        return max(wanted), max(w / float(l) for w, l in zip(wanted, long_sides)), None
+
     def recognize(self, img_cv_grey, horizontal_list=None, free_list=None,\
                   decoder = 'greedy', beamWidth= 5, batch_size = 1,\
                   workers = 0, allowlist = None, blocklist = None, detail = 1,\
                   rotation_info = None,paragraph = False,\
                   contrast_ths = 0.1,adjust_contrast = 0.5, filter_ths = 0.003,\
-                  y_ths = 0.5, x_ths = 1.0, reformat=True, output_format='standard'):
-
+                  y_ths = 0.5, x_ths = 1.0, reformat=True, output_format='standard',\
+                  width_bucketing = False, constraint = None):
+        '''
+        constraint: restrict every crop to a field format - a regex the whole text must match
+        (e.g. r'WH-\d{2}'), a list of allowed strings, or an automaton from
+        self.converter.compile_constraint. Crops with no valid reading keep the free reading
+        with confidence 0; crops that fit skip the contrast-adjusted second pass.
+        width_bucketing: only used when boxes are recognized in batches (batch_size > 1
+        on a GPU, or rotation_info). On CPU every box is recognized on its own at its own
+        width, so there is nothing to bucket and the flag has no effect.
+        '''
         if reformat:
-            img, img_cv_grey = reformat_input(img_cv_grey)
+            img_cv_grey = decode_image(img_cv_grey).grey
 
         if allowlist:
             ignore_char = ''.join(set(self.character)-set(allowlist))
@@ -383,7 +521,7 @@ class Reader(object):
                 image_list, max_width = get_image_list(h_list, f_list, img_cv_grey, model_height = imgH)
                 result0 = get_text(self.character, imgH, int(max_width), self.recognizer, self.converter, image_list,\
                               ignore_char, decoder, beamWidth, batch_size, contrast_ths, adjust_contrast, filter_ths,\
-                              workers, self.device)
+                              workers, self.device, constraint = constraint)
                 result += result0
             for bbox in free_list:
                 h_list = []
@@ -391,7 +529,7 @@ class Reader(object):
                 image_list, max_width = get_image_list(h_list, f_list, img_cv_grey, model_height = imgH)
                 result0 = get_text(self.character, imgH, int(max_width), self.recognizer, self.converter, image_list,\
                               ignore_char, decoder, beamWidth, batch_size, contrast_ths, adjust_contrast, filter_ths,\
-                              workers, self.device)
+                              workers, self.device, constraint = constraint)
                 result += result0
         # default mode will try to process multiple boxes at the same time
         else:
@@ -403,7 +541,7 @@ class Reader(object):
 
             result = get_text(self.character, imgH, int(max_width), self.recognizer, self.converter, image_list,\
                           ignore_char, decoder, beamWidth, batch_size, contrast_ths, adjust_contrast, filter_ths,\
-                          workers, self.device)
+                          workers, self.device, width_bucketing, constraint)
 
             if rotation_info and (horizontal_list+free_list):
                 # Reshape result to be a list of lists, each row being for 
@@ -412,6 +550,7 @@ class Reader(object):
                     [result[image_len*i:image_len*(i+1)] for i in range(len(rotation_info) + 1)])
 
         if self.model_lang == 'arabic':
+            from bidi import get_display # only Arabic output needs bidi reordering
             direction_mode = 'rtl'
             result = [list(item) for item in result]
             for item in result:
@@ -446,12 +585,29 @@ class Reader(object):
                  slope_ths = 0.1, ycenter_ths = 0.5, height_ths = 0.5,\
                  width_ths = 0.5, y_ths = 0.5, x_ths = 1.0, add_margin = 0.1, 
                  threshold = 0.2, bbox_min_score = 0.2, bbox_min_size = 3, max_candidates = 0,
-                 output_format='standard'):
+                 output_format='standard', width_bucketing = False,
+                 tile_height = None, tile_overlap = 0.15, tile_batch_size = 4,
+                 target_text_height = 16):
         '''
         Parameters:
-        image: file path or numpy-array or a byte stream object
+        image: file path, numpy-array, bytes / memoryview / mmap of an encoded image,
+        or an easyocr.utils.DecodedImage; it is decoded exactly once
+        canvas_size: detection canvas, or 'auto' to size it from the text on the
+        image (target_text_height pixels for the smaller text, see detect)
+        width_bucketing: when recognizing boxes in batches, group crops by width
+        so each group is padded only to its own widest crop (no effect on CPU, see recognize)
+        tile_height: detect images taller than this as overlapping tiles (see detect)
         '''
-        img, img_cv_grey = reformat_input(image)
+        params = dict(locals()) # every readtext argument is part of the cache key
+        del params['self'], params['image']
+        image = decode_image(image)
+        img = image.color
+
+        if self.cache is not None:
+            cache_key = self.cache.make_key(img, params, self.model_md5s, self.cache_settings)
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                return cached
 
         horizontal_list, free_list = self.detect(img, 
                                                  min_size = min_size, text_threshold = text_threshold,\
@@ -461,16 +617,22 @@ class Reader(object):
                                                  height_ths = height_ths, width_ths= width_ths,\
                                                  add_margin = add_margin, reformat = False,\
                                                  threshold = threshold, bbox_min_score = bbox_min_score,\
-                                                 bbox_min_size = bbox_min_size, max_candidates = max_candidates
+                                                 bbox_min_size = bbox_min_size, max_candidates = max_candidates,\
+                                                 tile_height = tile_height, tile_overlap = tile_overlap,\
+                                                 tile_batch_size = tile_batch_size,\
+                                                 target_text_height = target_text_height
                                                  )
         # get the 1st result from hor & free list as self.detect returns a list of depth 3
         horizontal_list, free_list = horizontal_list[0], free_list[0]
-        result = self.recognize(img_cv_grey, horizontal_list, free_list,\
+        result = self.recognize(image.grey, horizontal_list, free_list,\
                                 decoder, beamWidth, batch_size,\
                                 workers, allowlist, blocklist, detail, rotation_info,\
                                 paragraph, contrast_ths, adjust_contrast,\
-                                filter_ths, y_ths, x_ths, False, output_format)
+                                filter_ths, y_ths, x_ths, False, output_format,\
+                                width_bucketing)
 
+        if self.cache is not None and cache_key is not None:
+            self.cache.put(cache_key, result)
         return result
     
     def readtextlang(self, image, decoder = 'greedy', beamWidth= 5, batch_size = 1,\
@@ -545,14 +707,18 @@ class Reader(object):
                          slope_ths = 0.1, ycenter_ths = 0.5, height_ths = 0.5,\
                          width_ths = 0.5, y_ths = 0.5, x_ths = 1.0, add_margin = 0.1, 
                          threshold = 0.2, bbox_min_score = 0.2, bbox_min_size = 3, max_candidates = 0,
-                         output_format='standard'):
+                         output_format='standard', width_bucketing = False,
+                         detect_batch_size = None):
         '''
         Parameters:
-        image: file path or numpy-array or a byte stream object
-        When sending a list of images, they all must of the same size,
-        the following parameters will automatically resize if they are not None
+        image: file path or numpy-array or a byte stream object, or a list of them
+        Images in a list may have different sizes: detection groups them into
+        aspect-ratio buckets (see detect), so nothing is distorted. The following
+        parameters resize every image to one size if they are not None
         n_width: int, new width
         n_height: int, new height
+        detect_batch_size: at most this many images per detector forward pass
+        width_bucketing: see recognize (no effect on CPU)
         '''
         img, img_cv_grey = reformat_input_batched(image, n_width, n_height)
 
@@ -564,16 +730,18 @@ class Reader(object):
                                                  height_ths = height_ths, width_ths= width_ths,\
                                                  add_margin = add_margin, reformat = False,\
                                                  threshold = threshold, bbox_min_score = bbox_min_score,\
-                                                 bbox_min_size = bbox_min_size, max_candidates = max_candidates
+                                                 bbox_min_size = bbox_min_size, max_candidates = max_candidates,\
+                                                 detect_batch_size = detect_batch_size
                                                  )
         result_agg = []
         # put img_cv_grey in a list if its a single img
-        img_cv_grey = [img_cv_grey] if len(img_cv_grey.shape) == 2 else img_cv_grey
+        img_cv_grey = [img_cv_grey] if isinstance(img_cv_grey, np.ndarray) and img_cv_grey.ndim == 2 else img_cv_grey
         for grey_img, horizontal_list, free_list in zip(img_cv_grey, horizontal_list_agg, free_list_agg):
             result_agg.append(self.recognize(grey_img, horizontal_list, free_list,\
                                             decoder, beamWidth, batch_size,\
                                             workers, allowlist, blocklist, detail, rotation_info,\
                                             paragraph, contrast_ths, adjust_contrast,\
-                                            filter_ths, y_ths, x_ths, False, output_format))
+                                            filter_ths, y_ths, x_ths, False, output_format,\
+                                            width_bucketing))
 
         return result_agg
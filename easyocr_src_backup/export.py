@@ -1,3 +1,5 @@
+import copy
+import inspect
 import argparse
 
 import onnx
@@ -6,6 +8,12 @@ import easyocr
 import numpy as np
 
 
+def torchscript_export_kwargs():
+    # newer torch defaults to the dynamo exporter (needs onnxscript, and can't trace
+    # the recognizer's LSTM with a dynamic width); keep the TorchScript one
+    return {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+
+
 def export_detector(detector_onnx_save_path,
                     in_shape=[1, 3, 608, 800],
                     lang_list=["en"],
@@ -50,7 +58,8 @@ def export_detector(detector_onnx_save_path,
                               dynamic_axes={'input': {0: 'batch_size', 2: "height", 3: "width"},
                                             'output': {0: 'batch_size', 1: "dim1", 2: "dim2"}
                                             } if dynamic else None,
-                              verbose=False)
+                              verbose=False,
+                              **torchscript_export_kwargs())
 
         # verify exported onnx model
         detector_onnx = onnx.load(detector_onnx_save_path)
@@ -83,6 +92,81 @@ def export_detector(detector_onnx_save_path,
         print(f"Model exported to {detector_onnx_save_path} and tested with ONNXRuntime, and the result looks good!")
 
 
+class MeanOverLastDim(torch.nn.Module):
+    # stands in for AdaptiveAvgPool2d((None, 1)), which has no ONNX form with a dynamic width;
+    # with an output size of 1 on the last axis it is exactly a mean over that axis
+    def forward(self, x):
+        return x.mean(dim=3, keepdim=True)
+
+
+class RecognizerExportWrapper(torch.nn.Module):
+    # the recognizer's `text` argument is unused by CTC models, so the graph takes the image only
+    def __init__(self, model):
+        super(RecognizerExportWrapper, self).__init__()
+        self.model = model
+
+    def forward(self, input):
+        return self.model(input, None)
+
+
+def export_recognizer(recognizer_onnx_save_path,
+                      in_shape=[1, 1, 64, 320],
+                      lang_list=["en"],
+                      model_storage_directory=None,
+                      user_network_directory=None,
+                      recog_network='standard',
+                      download_enabled=True):
+    # quantize=False: dynamically quantized torch modules cannot be exported
+    ocr_reader = easyocr.Reader(lang_list,
+                                gpu=False,
+                                detector=False,
+                                recognizer=True,
+                                quantize=False,
+                                recog_network=recog_network,
+                                model_storage_directory=model_storage_directory,
+                                user_network_directory=user_network_directory,
+                                download_enabled=download_enabled)
+
+    model = copy.deepcopy(ocr_reader.recognizer)
+    for name, module in model.named_children():
+        if isinstance(module, torch.nn.AdaptiveAvgPool2d) and tuple(module.output_size) == (None, 1):
+            setattr(model, name, MeanOverLastDim())
+    wrapper = RecognizerExportWrapper(model).eval()
+
+    dummy_input = torch.rand(in_shape)
+    with torch.no_grad():
+        torch.onnx.export(wrapper,
+                          dummy_input,
+                          recognizer_onnx_save_path,
+                          export_params=True,
+                          do_constant_folding=True,
+                          opset_version=12,
+                          input_names=['input'],
+                          output_names=['output'],
+                          # any number of crops, any (padded) crop width
+                          dynamic_axes={'input': {0: 'batch_size', 3: 'width'},
+                                        'output': {0: 'batch_size', 1: 'sequence'}},
+                          verbose=False,
+                          **torchscript_export_kwargs())
+
+    recognizer_onnx = onnx.load(recognizer_onnx_save_path)
+    onnx.checker.check_model(recognizer_onnx)
+
+    # onnx inference validation, at the export width and at another batch size / width
+    import onnxruntime
+
+    ort_session = onnxruntime.InferenceSession(recognizer_onnx_save_path, providers=['CPUExecutionProvider'])
+    for shape in (in_shape, [in_shape[0] + 2, in_shape[1], in_shape[2], in_shape[3] * 2]):
+        test_input = torch.rand(shape)
+        with torch.no_grad():
+            y_torch_out = ocr_reader.recognizer(test_input, None).numpy()
+        y_onnx_out = ort_session.run(None, {'input': test_input.numpy()})[0]
+        print(f"input {shape}: torch {y_torch_out.shape} onnx {y_onnx_out.shape}")
+        np.testing.assert_allclose(y_torch_out, y_onnx_out, rtol=1e-03, atol=1e-05)
+
+    print(f"Recognizer exported to {recognizer_onnx_save_path} and tested with ONNXRuntime, and the result looks good!")
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-l', '--lang_list',
@@ -93,6 +177,10 @@ def parse_args():
                         default="detector_craft.onnx",
                         help="export detector onnx file path ending in .onnx" +
                         "Do not pass in this flag to avoid exporting detector")
+    parser.add_argument('-r', '--recognizer_onnx_save_path', type=str,
+                        default=None,
+                        help="export recognizer onnx file path ending in .onnx (dynamic batch and width). " +
+                        "Reader(backend='onnx') looks for <model_storage_directory>/<model name>.onnx, e.g. english_g2.onnx")
     parser.add_argument('-d', '--dynamic',
                         action='store_true',
                         help="Dynamic  input output shapes for detector")
@@ -115,12 +203,18 @@ def parse_args():
 
 def main():
     args = parse_args()
-    export_detector(detector_onnx_save_path=args.detector_onnx_save_path,
-                    in_shape=args.in_shape,
-                    lang_list=args.lang_list,
-                    model_storage_directory=args.model_storage_directory,
-                    user_network_directory=args.user_network_directory,
-                    dynamic=args.dynamic)
+    if args.detector_onnx_save_path:
+        export_detector(detector_onnx_save_path=args.detector_onnx_save_path,
+                        in_shape=args.in_shape,
+                        lang_list=args.lang_list,
+                        model_storage_directory=args.model_storage_directory,
+                        user_network_directory=args.user_network_directory,
+                        dynamic=args.dynamic)
+    if args.recognizer_onnx_save_path:
+        export_recognizer(recognizer_onnx_save_path=args.recognizer_onnx_save_path,
+                          lang_list=args.lang_list,
+                          model_storage_directory=args.model_storage_directory,
+                          user_network_directory=args.user_network_directory)
 
 
 if __name__ == "__main__":
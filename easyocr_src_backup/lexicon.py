@@ -0,0 +1,323 @@
+import os
+import re
+import hashlib
+import numpy as np
+
+from .config import MODULE_PATH
+
+DICT_CACHE_DIR = os.path.join(MODULE_PATH, 'dict_cache')
+
+class CharTrie(object):
+    """ Prefix trie over recognizer class indices, stored as flat arrays.
+
+    Edges are kept as sorted keys (parent * n_class + char) with their child node,
+    so a whole (batch, beam, char) array of transitions is looked up with one
+    np.searchsorted. Node 0 is the root (the empty prefix).
+    """
+
+    def __init__(self, edge_keys, edge_child, terminal, n_class):
+        self.edge_keys = edge_keys
+        self.edge_child = edge_child
+        self.terminal = terminal
+        self.n_class = int(n_class)
+
+    @classmethod
+    def from_words(cls, words, char_index, n_class):
+        """ words: iterable of strings; char_index: character -> class index.
+        Words with characters outside the recognizer's set are skipped. """
+        children = [{}]
+        terminal = [False]
+        for word in words:
+            if not word or any(c not in char_index for c in word):
+                continue
+            node = 0
+            for c in word:
+                idx = char_index[c]
+                nxt = children[node].get(idx)
+                if nxt is None:
+                    nxt = len(children)
+                    children[node][idx] = nxt
+                    children.append({})
+                    terminal.append(False)
+                node = nxt
+            terminal[node] = True
+        edges = [(parent * n_class + idx, child) for parent, kids in enumerate(children) for idx, child in kids.items()]
+        edges.sort()
+        edge_keys = np.array([k for k, _ in edges], dtype=np.int64)
+        edge_child = np.array([c for _, c in edges], dtype=np.int32)
+        return cls(edge_keys, edge_child, np.array(terminal, dtype=bool), n_class)
+
+    def __len__(self):
+        return len(self.terminal)
+
+    def child(self, nodes, chars):
+        """ Child node of each (node, char) pair, -1 where there is none (or node is -1). """
+        nodes = np.asarray(nodes)
+        if len(self.edge_keys) == 0:
+            return np.full(np.broadcast(nodes, chars).shape, -1, dtype=np.int64)
+        keys = nodes.astype(np.int64) * self.n_class + chars
+        pos = np.minimum(np.searchsorted(self.edge_keys, keys), len(self.edge_keys) - 1)
+        found = (self.edge_keys[pos] == keys) & (nodes >= 0)
+        return np.where(found, self.edge_child[pos], -1)
+
+    def is_terminal(self, nodes):
+        nodes = np.asarray(nodes)
+        return (nodes >= 0) & self.terminal[np.maximum(nodes, 0)]
+
+    def contains(self, labeling):
+        node = 0
+        for c in labeling:
+            node = int(self.child(node, c))
+            if node < 0:
+                return False
+        return bool(self.terminal[node])
+
+    def save(self, path):
+        tmp_path = '%s.%d.tmp.npz' % (path, os.getpid())
+        np.savez(tmp_path, edge_keys=self.edge_keys, edge_child=self.edge_child,
+                 terminal=self.terminal, n_class=self.n_class)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['edge_keys'], data['edge_child'], data['terminal'], data['n_class'])
+
+MAX_DFA_STATES = 20000
+
+class RegexDFA(object):
+    """ Deterministic automaton for a regular expression over the recognizer's characters,
+    with the same lookup interface as CharTrie (child / is_terminal / contains). The whole
+    decoded string has to match.
+
+    Supported: literals, escapes (\\d, \\w, \\s, \\.), [classes], ., grouping ( ) and (?: ),
+    alternation |, and the quantifiers * + ? {m} {m,} {m,n}; ^ and $ are accepted and ignored.
+    Every atom is evaluated with Python's re (using `flags`) against each character.
+    """
+
+    def __init__(self, pattern, character, flags=0):
+        self.pattern = pattern
+        self.n_class = len(character)
+        ast = _RegexParser(pattern, character, flags).parse()
+        eps, trans, start, end = _build_nfa(ast)
+        self.transitions, self.terminal = _determinize(eps, trans, start, end, self.n_class)
+
+    def __len__(self):
+        return len(self.terminal)
+
+    def child(self, nodes, chars):
+        nodes = np.asarray(nodes)
+        return np.where(nodes >= 0, self.transitions[np.maximum(nodes, 0), chars], -1)
+
+    def is_terminal(self, nodes):
+        nodes = np.asarray(nodes)
+        return (nodes >= 0) & self.terminal[np.maximum(nodes, 0)]
+
+    def contains(self, labeling):
+        node = 0
+        for c in labeling:
+            node = self.transitions[node, c]
+            if node < 0:
+                return False
+        return bool(self.terminal[node])
+
+class _RegexParser(object):
+    # recursive descent into ('set', frozenset) / ('cat', [..]) / ('alt', [..]) / ('rep', node, min, max)
+
+    def __init__(self, pattern, character, flags):
+        self.pattern = pattern
+        self.pos = 0
+        self.flags = flags
+        self.character = character
+
+    def parse(self):
+        node = self.alternation()
+        if self.pos != len(self.pattern):
+            raise ValueError("Unbalanced ')' at %d in %r" % (self.pos, self.pattern))
+        return node
+
+    def peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def alternation(self):
+        branches = [self.concatenation()]
+        while self.peek() == '|':
+            self.pos += 1
+            branches.append(self.concatenation())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def concatenation(self):
+        items = []
+        while self.peek() not in (None, '|', ')'):
+            items.append(self.repetition())
+        return ('cat', items)
+
+    def repetition(self):
+        node = self.atom()
+        while self.peek() in ('*', '+', '?', '{'):
+            c = self.peek()
+            if c == '{':
+                m = re.match(r'\{(\d*)(,?)(\d*)\}', self.pattern[self.pos:])
+                if not m or not (m.group(1) or m.group(3)):
+                    raise ValueError("Bad repetition at %d in %r" % (self.pos, self.pattern))
+                low = int(m.group(1) or 0)
+                high = low if not m.group(2) else (int(m.group(3)) if m.group(3) else None)
+                self.pos += len(m.group(0))
+            else:
+                low, high = {'*': (0, None), '+': (1, None), '?': (0, 1)}[c]
+                self.pos += 1
+            if self.peek() == '?': # lazy: same language
+                self.pos += 1
+            node = ('rep', node, low, high)
+        return node
+
+    def atom(self):
+        c = self.peek()
+        start = self.pos
+        if c == '(':
+            self.pos += 1
+            if self.pattern.startswith('?:', self.pos):
+                self.pos += 2
+            node = self.alternation()
+            if self.peek() != ')':
+                raise ValueError("Missing ')' in %r" % self.pattern)
+            self.pos += 1
+            return node
+        if c in ('^', '$'):
+            self.pos += 1
+            return ('cat', [])
+        if c == '[':
+            end = self.pos + 1
+            if end < len(self.pattern) and self.pattern[end] == '^': end += 1
+            if end < len(self.pattern) and self.pattern[end] == ']': end += 1
+            while end < len(self.pattern) and self.pattern[end] != ']':
+                end += 2 if self.pattern[end] == '\\' else 1
+            if end >= len(self.pattern):
+                raise ValueError("Missing ']' in %r" % self.pattern)
+            self.pos = end + 1
+        elif c == '\\':
+            self.pos += 2
+        elif c in ('*', '+', '?', '{'):
+            raise ValueError("Nothing to repeat at %d in %r" % (self.pos, self.pattern))
+        else:
+            self.pos += 1
+        regex = re.compile(self.pattern[start:self.pos], self.flags)
+        return ('set', frozenset(i for i, ch in enumerate(self.character) if i > 0 and regex.fullmatch(ch)))
+
+def _build_nfa(ast):
+    # Thompson construction: per state a list of epsilon targets and of (class set, target)
+    eps, trans = [], []
+    def new_state():
+        eps.append([]); trans.append([])
+        return len(eps) - 1
+    def build(node):
+        kind = node[0]
+        if kind == 'set':
+            s, e = new_state(), new_state()
+            trans[s].append((node[1], e))
+        elif kind == 'cat':
+            s = e = new_state()
+            for item in node[1]:
+                s2, e2 = build(item)
+                eps[e].append(s2)
+                e = e2
+        elif kind == 'alt':
+            s, e = new_state(), new_state()
+            for item in node[1]:
+                s2, e2 = build(item)
+                eps[s].append(s2)
+                eps[e2].append(e)
+        else: # rep
+            _, item, low, high = node
+            s = e = new_state()
+            for _ in range(low):
+                s2, e2 = build(item)
+                eps[e].append(s2)
+                e = e2
+            if high is None:
+                s2, e2 = build(item)
+                eps[e].append(s2)
+                eps[e2].append(s2)
+                eps[e2].append(e)
+                end = new_state()
+                eps[e].append(end)
+                eps[e2].append(end)
+                e = end
+            else:
+                end = new_state()
+                for _ in range(high - low):
+                    s2, e2 = build(item)
+                    eps[e].append(s2)
+                    eps[e].append(end)
+                    e = e2
+                eps[e].append(end)
+                e = end
+        return s, e
+    start, end = build(ast)
+    return eps, trans, start, end
+
+def _determinize(eps, trans, start, end, n_class):
+    def closure(states):
+        stack, seen = list(states), set(states)
+        while stack:
+            for t in eps[stack.pop()]:
+                if t not in seen:
+                    seen.add(t)
+                    stack.append(t)
+        return frozenset(seen)
+    first = closure([start])
+    index, rows, terminal, queue = {first: 0}, [], [end in first], [first]
+    while queue:
+        current = queue.pop(0)
+        moves = {}
+        for s in current:
+            for chars, t in trans[s]:
+                for c in chars:
+                    moves.setdefault(c, set()).add(t)
+        row = np.full(n_class, -1, dtype=np.int32)
+        for c, targets in moves.items():
+            target = closure(targets)
+            if target not in index:
+                if len(index) >= MAX_DFA_STATES:
+                    raise ValueError('Pattern needs more than %d automaton states' % MAX_DFA_STATES)
+                index[target] = len(index)
+                terminal.append(end in target)
+                queue.append(target)
+            row[c] = index[target]
+        rows.append(row)
+    return np.stack(rows), np.array(terminal, dtype=bool)
+
+def dict_trie_cache_path(dict_paths, character, cache_dir=DICT_CACHE_DIR):
+    # keyed on the recognizer's character set and on each dictionary file's size + mtime
+    key = hashlib.sha1(character.encode('utf-8'))
+    for path in dict_paths:
+        st = os.stat(path)
+        key.update(('\0%s\0%d\0%d' % (os.path.abspath(path), st.st_size, st.st_mtime_ns)).encode('utf-8'))
+    name = '_'.join(os.path.splitext(os.path.basename(p))[0] for p in dict_paths)[:64]
+    return os.path.join(cache_dir, '%s_%s.npz' % (name, key.hexdigest()[:16]))
+
+def load_dict_trie(dict_paths, character, cache_dir=DICT_CACHE_DIR):
+    """ Trie of the words in dict_paths over the class indices of `character`
+    (CTCLabelConverter.character, blank first), built once and cached on disk.
+    Returns None if none of the files can be read. """
+    dict_paths = [p for p in dict_paths if os.path.isfile(p)]
+    if not dict_paths:
+        return None
+    cache_path = dict_trie_cache_path(dict_paths, ''.join(character), cache_dir)
+    if os.path.isfile(cache_path):
+        try:
+            return CharTrie.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            pass
+    words = []
+    for path in dict_paths:
+        with open(path, 'r', encoding='utf-8-sig') as input_file:
+            words += input_file.read().splitlines()
+    char_index = {char: i for i, char in enumerate(character) if i > 0}
+    trie = CharTrie.from_words(words, char_index, len(character))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        trie.save(cache_path)
+    except OSError:
+        pass # read-only cache location: rebuild next time
+    return trie
@@ -1,10 +1,7 @@
 import torch
 import torch.nn as nn
 import torch.nn.init as init
-import torchvision
-from torchvision import models
 from collections import namedtuple
-from packaging import version
 
 
 def init_weights(modules):
@@ -23,6 +20,10 @@ def init_weights(modules):
 class vgg16_bn(torch.nn.Module):
     def __init__(self, pretrained=True, freeze=True):
         super(vgg16_bn, self).__init__()
+        # imported here: torchvision takes ~1.5s to import and only the CRAFT backbone needs it
+        import torchvision
+        from torchvision import models
+        from packaging import version
         if version.parse(torchvision.__version__) >= version.parse('0.13'):
             vgg_pretrained_features = models.vgg16_bn(
                 weights=models.VGG16_BN_Weights.DEFAULT if pretrained else None
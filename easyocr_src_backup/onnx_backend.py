@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import torch
+
+def get_session_options(intra_op_threads=0, inter_op_threads=0):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    return options
+
+class OnnxModule(object):
+    """ onnxruntime CPU session that can stand in for the torch detector / recognizer.
+
+    Called like the torch module it replaces: takes tensors (or arrays), feeds
+    the graph's inputs in order (extra arguments such as the recognizer's unused
+    `text` are dropped) and returns torch tensors sharing the output buffers.
+    """
+
+    def __init__(self, onnx_path, intra_op_threads=0, inter_op_threads=0):
+        import onnxruntime
+        if not os.path.isfile(onnx_path):
+            raise FileNotFoundError("Missing %s, export it first with: python -m easyocr.export" % onnx_path)
+        self.onnx_path = onnx_path
+        self.session = onnxruntime.InferenceSession(onnx_path,
+                                                    sess_options=get_session_options(intra_op_threads, inter_op_threads),
+                                                    providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def eval(self):
+        return self
+
+    def __call__(self, *inputs):
+        feed = {}
+        for name, value in zip(self.input_names, inputs):
+            if isinstance(value, torch.Tensor):
+                value = value.detach().cpu().numpy()
+            feed[name] = np.ascontiguousarray(value, dtype=np.float32)
+        outputs = [torch.from_numpy(out) for out in self.session.run(None, feed)]
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+def onnx_model_path(model_storage_directory, model_filename):
+    # craft_mlt_25k.pth -> <model_storage_directory>/craft_mlt_25k.onnx
+    return os.path.join(model_storage_directory, os.path.splitext(model_filename)[0] + '.onnx')
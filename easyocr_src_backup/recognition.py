@@ -3,11 +3,11 @@ import torch
 import torch.backends.cudnn as cudnn
 import torch.utils.data
 import torch.nn.functional as F
-import torchvision.transforms as transforms
 import numpy as np
 from collections import OrderedDict
 import importlib
 from .utils import CTCLabelConverter
+from .weights import load_compiled
 import math
 
 def custom_mean(x):
@@ -27,10 +27,15 @@ def adjust_contrast_grey(img, target = 0.4):
         img = np.maximum(np.full(img.shape, 0) ,np.minimum(np.full(img.shape, 255), img)).astype(np.uint8)
     return img
 
+def to_tensor(img):
+    # same as torchvision.transforms.ToTensor() for 'L' images: (1, H, W) float32 in [0, 1]
+    img = np.asarray(img, dtype=np.float32) / 255.
+    return torch.from_numpy(img[None] if img.ndim == 2 else img.transpose(2, 0, 1).copy())
+
 class NormalizePAD(object):
 
     def __init__(self, max_size, PAD_type='right'):
-        self.toTensor = transforms.ToTensor()
+        self.toTensor = to_tensor
         self.max_size = max_size
         self.max_width_half = math.floor(max_size[2] / 2)
         self.PAD_type = PAD_type
@@ -97,7 +102,7 @@ class AlignCollate(object):
         return image_tensors
 
 def recognizer_predict(model, converter, test_loader, batch_max_length,\
-                       ignore_idx, char_group_idx, decoder = 'greedy', beamWidth= 5, device = 'cpu'):
+                       ignore_idx, char_group_idx, decoder = 'greedy', beamWidth= 5, device = 'cpu', constraint = None):
     model.eval()
     result = []
     with torch.no_grad():
@@ -121,7 +126,12 @@ def recognizer_predict(model, converter, test_loader, batch_max_length,\
             preds_prob = preds_prob/np.expand_dims(pred_norm, axis=-1)
             preds_prob = torch.from_numpy(preds_prob).float().to(device)
 
-            if decoder == 'greedy':
+            gaps = None
+            if constraint is not None:
+                # format-constrained search (regex / lexicon), replaces the chosen decoder
+                k = preds_prob.cpu().detach().numpy()
+                preds_str, gaps = zip(*converter.decode_constrained(k, constraint, beamWidth=beamWidth))
+            elif decoder == 'greedy':
                 # Select max probabilty (greedy decoding) then decode index to character
                 _, preds_index = preds_prob.max(2)
                 preds_index = preds_index.view(-1)
@@ -144,15 +154,19 @@ def recognizer_predict(model, converter, test_loader, batch_max_length,\
                 else:
                     preds_max_prob.append(np.array([0]))
 
-            for pred, pred_max_prob in zip(preds_str, preds_max_prob):
+            for n, (pred, pred_max_prob) in enumerate(zip(preds_str, preds_max_prob)):
                 confidence_score = custom_mean(pred_max_prob)
+                if gaps is not None:
+                    # discount by how much less likely (per character) the valid string is than
+                    # the free reading; 0 when nothing valid was found
+                    confidence_score *= np.exp(gaps[n] / max(1, len(pred)))
                 result.append([pred, confidence_score])
 
     return result
 
 def get_recognizer(recog_network, network_params, character,\
                    separator_list, dict_list, model_path,\
-                   device = 'cpu', quantize = True):
+                   device = 'cpu', quantize = True, use_compiled = True):
 
     converter = CTCLabelConverter(character, separator_list, dict_list)
     num_class = len(converter.character)
@@ -163,7 +177,13 @@ def get_recognizer(recog_network, network_params, character,\
         model_pkg = importlib.import_module("easyocr.model.vgg_model")
     else:
         model_pkg = importlib.import_module(recog_network)
-    model = model_pkg.Model(num_class=num_class, **network_params)
+    build = lambda: model_pkg.Model(num_class=num_class, **network_params)
+
+    if device == 'cpu' and use_compiled:
+        model = load_compiled(model_path, build, quantize)
+        if model is not None:
+            return model, converter
+    model = build()
 
     if device == 'cpu':
         state_dict = torch.load(model_path, map_location=device, weights_only=False)
@@ -183,9 +203,36 @@ def get_recognizer(recog_network, network_params, character,\
 
     return model, converter
 
+def get_width_buckets(image_list, imgH, imgW):
+    """
+    Group crops by the padded width they actually need (a multiple of imgH,
+    capped at imgW). Returns a list of (bucket_imgW, [indices into image_list]),
+    narrowest bucket first. Reader.recognize only batches crops (and so only
+    buckets them) for batch_size > 1 on a GPU or with rotation_info.
+    """
+    buckets = {}
+    for i, item in enumerate(image_list):
+        h, w = item[1].shape[:2]
+        need_w = min(imgW, max(1, math.ceil(w / float(h))) * imgH)
+        buckets.setdefault(need_w, []).append(i)
+    return sorted(buckets.items())
+
 def get_text(character, imgH, imgW, recognizer, converter, image_list,\
              ignore_char = '',decoder = 'greedy', beamWidth =5, batch_size=1, contrast_ths=0.1,\
-             adjust_contrast=0.5, filter_ths = 0.003, workers = 1, device = 'cpu'):
+             adjust_contrast=0.5, filter_ths = 0.003, workers = 1, device = 'cpu', width_bucketing = False,\
+             constraint = None):
+    if width_bucketing and len(image_list) > 1:
+        # run every width bucket with its own imgW so short crops are not padded to the widest one
+        result = [None] * len(image_list)
+        for bucket_w, idx in get_width_buckets(image_list, imgH, imgW):
+            bucket_result = get_text(character, imgH, bucket_w, recognizer, converter,\
+                                     [image_list[i] for i in idx], ignore_char, decoder, beamWidth,\
+                                     batch_size, contrast_ths, adjust_contrast, filter_ths, workers, device,\
+                                     constraint = constraint)
+            for i, item in zip(idx, bucket_result):
+                result[i] = item
+        return result
+
     batch_max_length = int(imgW/10)
 
     char_group_idx = {}
@@ -204,10 +251,14 @@ def get_text(character, imgH, imgW, recognizer, converter, image_list,\
 
     # predict first round
     result1 = recognizer_predict(recognizer, converter, test_loader,batch_max_length,\
-                                 ignore_idx, char_group_idx, decoder, beamWidth, device = device)
+                                 ignore_idx, char_group_idx, decoder, beamWidth, device = device, constraint = constraint)
 
     # predict second round
-    low_confident_idx = [i for i,item in enumerate(result1) if (item[1] < contrast_ths)]
+    if constraint is not None:
+        # a crop that fits the field format is trusted, only retry the ones that don't
+        low_confident_idx = [i for i,item in enumerate(result1) if item[1] == 0]
+    else:
+        low_confident_idx = [i for i,item in enumerate(result1) if (item[1] < contrast_ths)]
     if len(low_confident_idx) > 0:
         img_list2 = [img_list[i] for i in low_confident_idx]
         AlignCollate_contrast = AlignCollate(imgH=imgH, imgW=imgW, keep_ratio_with_pad=True, adjust_contrast=adjust_contrast)
@@ -216,7 +267,8 @@ def get_text(character, imgH, imgW, recognizer, converter, image_list,\
                         test_data, batch_size=batch_size, shuffle=False,
                         num_workers=int(workers), collate_fn=AlignCollate_contrast, pin_memory=True)
         result2 = recognizer_predict(recognizer, converter, test_loader, batch_max_length,\
-                                     ignore_idx, char_group_idx, decoder, beamWidth, device = device)
+                                     ignore_idx, char_group_idx, decoder, beamWidth, device = device,\
+                                     constraint = constraint)
 
     result = []
     for i, zipped in enumerate(zip(coord, result1)):
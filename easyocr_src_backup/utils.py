@@ -1,16 +1,16 @@
 from __future__ import print_function
 
-import torch
+import json
 import pickle
 import numpy as np
 import math
 import cv2
-from PIL import Image, JpegImagePlugin
-from scipy import ndimage
+from PIL import Image
 import hashlib
 import sys, os
+import mmap
 from zipfile import ZipFile
-from .imgproc import loadImage
+from .lexicon import load_dict_trie, CharTrie, RegexDFA
 
 if sys.version_info[0] == 2:
     from six.moves.urllib.request import urlretrieve
@@ -269,6 +269,166 @@ def ctcBeamSearch(mat, classes, ignore_idx, lm, beamWidth=25, dict_list = []):
         res = last.wordsearch(classes, ignore_idx, 20, dict_list)
     return res
 
+def pad_ctc_batch(mats):
+    """ Stack (T_i, C) probability matrices into one (B, T, C) array. Shorter ones are
+    padded with certain-blank frames, which leave every prefix's probability unchanged.
+    """
+    if isinstance(mats, np.ndarray) and mats.ndim == 3:
+        return mats
+    maxT = max([len(m) for m in mats] + [0])
+    nC = mats[0].shape[1] if len(mats) else 1
+    batch = np.zeros((len(mats), maxT, nC), dtype=np.result_type(np.float32, *mats))
+    batch[:, :, 0] = 1
+    for i, m in enumerate(mats):
+        batch[i, :len(m)] = m
+    return batch
+
+PREFIX_HASH_MULT = np.uint64(0x100000001b3) # FNV-64 prime, prefix hashes wrap modulo 2**64
+CONSTRAINED_CHARS_PER_STEP = 16 # with a lexicon or grammar the best characters are often not valid continuations
+LENGTH_BUCKET_RATIO = 1.5 # ragged inputs are searched in buckets whose longest is at most this x the shortest
+
+def ctc_beam_search_batch(mats, beamWidth=5, n_best=1, constraint=None):
+    """ CTC prefix beam search, in log space and vectorized across the batch.
+
+    mats: (B, T, C) softmax outputs (blank = 0), or a list of (T_i, C) arrays.
+    Returns, per item, up to n_best (labeling, log probability) pairs, best first.
+    A labeling is a tuple of class indices (repeats and blanks collapsed).
+
+    Each step extends every beam with the top beamWidth + 1 characters at that frame
+    (argpartition). No other character can create a new prefix that makes the next
+    top-beamWidth (at most one of those characters repeats the beam's last one), and the
+    mass other characters add to prefixes already in the beam is added from the beam's
+    stem, so the result is that of the search over every character. Identical prefixes are
+    merged through a rolling hash, and beams are reconstructed from back-pointers at the end.
+
+    With a constraint (lexicon.CharTrie or lexicon.RegexDFA), the CONSTRAINED_CHARS_PER_STEP best
+    characters are tried at each frame, and a beam can only grow along the automaton. Only accepted
+    strings are returned; an item whose beams all died comes back with a -inf best score.
+    """
+    if not (isinstance(mats, np.ndarray) and mats.ndim == 3):
+        # word segments vary a lot in length; don't run the short ones through the padding
+        lengths = [len(m) for m in mats]
+        if lengths and max(lengths) > LENGTH_BUCKET_RATIO * max(1, min(lengths)):
+            results = [None] * len(mats)
+            order = sorted(range(len(mats)), key=lambda i: lengths[i])
+            start = 0
+            while start < len(order):
+                limit = LENGTH_BUCKET_RATIO * max(1, lengths[order[start]])
+                end = start + 1
+                while end < len(order) and lengths[order[end]] <= limit:
+                    end += 1
+                bucket = order[start:end]
+                for i, beams in zip(bucket, ctc_beam_search_batch([mats[i] for i in bucket], beamWidth, n_best, constraint)):
+                    results[i] = beams
+                start = end
+            return results
+    mats = pad_ctc_batch(mats)
+    B, T, C = mats.shape
+    n_best = max(1, n_best)
+    if B == 0:
+        return []
+    if T == 0:
+        empty_score = 0.0 if constraint is None or constraint.terminal[0] else -np.inf
+        return [[((), empty_score)] for _ in range(B)]
+    with np.errstate(divide='ignore'):
+        logp = np.log(mats.astype(np.float64))
+    K = max(1, beamWidth)
+    M = min(CONSTRAINED_CHARS_PER_STEP, C - 1) if constraint is not None else min(K + 1, C - 1) # characters tried per step
+    rows = np.arange(B)[:, None]
+
+    # beam state, one row per batch item; beam 0 starts as the empty prefix
+    pb = np.full((B, K), -np.inf); pb[:, 0] = 0.
+    pnb = np.full((B, K), -np.inf)
+    last = np.zeros((B, K), dtype=np.int64) # last character, 0 = empty prefix
+    prefix_hash = np.zeros((B, K), dtype=np.uint64)
+    stem_hash = np.zeros((B, K), dtype=np.uint64) # hash of the prefix without its last character
+    node = np.zeros((B, K), dtype=np.int64) # automaton state of the prefix, -1 = rejected
+    parents, chars = [], []
+
+    for t in range(T):
+        lp = logp[:, t]
+        nK = pb.shape[1]
+        total = np.logaddexp(pb, pnb)
+
+        # same prefix: a blank, or a repeat of the last character
+        stay_pb = total + lp[:, :1]
+        stay_pnb = np.where(last > 0, pnb + lp[rows, last], -np.inf)
+        stay_parent = np.broadcast_to(np.arange(nK), (B, nK))
+
+        if M > 0:
+            cand = np.argpartition(-lp[:, 1:], M - 1, axis=1)[:, :M] + 1 # (B, M)
+            # a beam whose last character is not a candidate still gets the mass of its stem beam
+            # (if that is in the beam too) growing into it - exactly what a search over every character adds
+            is_stem = (stem_hash[:, :, None] == prefix_hash[:, None, :]) & (last[:, :, None] > 0) # (B, K, K)
+            stem_src = np.where(last[:, None, :] == last[:, :, None], pb[:, None, :], total[:, None, :])
+            grow = np.where(is_stem, stem_src, -np.inf).max(axis=2) + lp[rows, last]
+            grow[(cand[:, None, :] == last[:, :, None]).any(axis=2) | (last == 0)] = -np.inf
+            stay_pnb = np.logaddexp(stay_pnb, grow)
+            same = cand[:, None, :] == last[:, :, None]                 # (B, K, M)
+            # a repeated character needs a blank in between
+            ext_pnb = np.where(same, pb[:, :, None], total[:, :, None]) + lp[rows, cand][:, None, :]
+            ext_hash = prefix_hash[:, :, None] * PREFIX_HASH_MULT + cand[:, None, :].astype(np.uint64)
+            new_pb = np.concatenate([stay_pb, np.full((B, nK * M), -np.inf)], axis=1)
+            new_pnb = np.concatenate([stay_pnb, ext_pnb.reshape(B, -1)], axis=1)
+            new_hash = np.concatenate([prefix_hash, ext_hash.reshape(B, -1)], axis=1)
+            new_stem = np.concatenate([stem_hash, np.repeat(prefix_hash, M, axis=1)], axis=1)
+            new_last = np.concatenate([last, np.broadcast_to(cand[:, None, :], (B, nK, M)).reshape(B, -1)], axis=1)
+            new_char = np.concatenate([np.zeros((B, nK), dtype=np.int64), new_last[:, nK:]], axis=1)
+            new_parent = np.concatenate([stay_parent, np.broadcast_to(np.repeat(np.arange(nK), M), (B, nK * M))], axis=1)
+            if constraint is not None: # prune extensions the constraint rejects
+                ext_node = constraint.child(node[:, :, None], cand[:, None, :])
+                new_pnb[:, nK:][ext_node.reshape(B, -1) < 0] = -np.inf
+                new_node = np.concatenate([node, ext_node.reshape(B, -1)], axis=1)
+        else: # nothing but blank
+            new_pb, new_pnb, new_hash, new_last, new_stem = stay_pb, stay_pnb, prefix_hash, last, stem_hash
+            new_char, new_parent, new_node = np.zeros((B, nK), dtype=np.int64), stay_parent, node
+        N = new_pb.shape[1]
+
+        # merge candidates with the same prefix (e.g. "ab" + blank and "a" + "b")
+        order = np.argsort(new_hash, axis=1, kind='stable')
+        sorted_hash = np.take_along_axis(new_hash, order, axis=1)
+        dup = sorted_hash[:, 1:] == sorted_hash[:, :-1]
+        if dup.any():
+            flat = (order + rows * N).ravel()
+            starts = np.flatnonzero(np.concatenate([np.ones((B, 1), bool), ~dup], axis=1).ravel())
+            for arr in (new_pb, new_pnb):
+                merged = np.full(B * N, -np.inf)
+                merged[starts] = np.logaddexp.reduceat(arr.ravel()[flat], starts)
+                arr.ravel()[flat] = merged # arr is a fresh contiguous array, ravel() is a view
+
+        # keep the best beams (more at the last step for the n-best list)
+        score = np.logaddexp(new_pb, new_pnb)
+        if constraint is not None and t == T - 1: # only accepted strings can end the search
+            score[~constraint.is_terminal(new_node)] = -np.inf
+        keep = min(N, K if t < T - 1 else max(K, n_best))
+        idx = np.argpartition(-score, keep - 1, axis=1)[:, :keep] if keep < N else np.broadcast_to(np.arange(N), (B, N))
+        pb, pnb = new_pb[rows, idx], new_pnb[rows, idx]
+        last, prefix_hash, stem_hash = new_last[rows, idx], new_hash[rows, idx], new_stem[rows, idx]
+        if constraint is not None:
+            node = new_node[rows, idx]
+        parents.append(new_parent[rows, idx])
+        chars.append(new_char[rows, idx])
+
+    # n-best beams, best first, rebuilt from the back-pointers
+    score = np.logaddexp(pb, pnb)
+    if constraint is not None:
+        score[~constraint.is_terminal(node)] = -np.inf
+    beam = np.argsort(-score, axis=1, kind='stable')[:, :n_best]
+    best_score = score[rows, beam]
+    path = np.zeros((T,) + beam.shape, dtype=np.int64)
+    for t in range(T - 1, -1, -1):
+        path[t] = chars[t][rows, beam]
+        beam = parents[t][rows, beam]
+    results = []
+    for b in range(B):
+        beams = []
+        for n in range(beam.shape[1]):
+            if np.isfinite(best_score[b, n]) or n == 0:
+                labeling = path[:, b, n]
+                beams.append((tuple(labeling[labeling > 0].tolist()), float(best_score[b, n])))
+        results.append(beams)
+    return results
+
 
 class CTCLabelConverter(object):
     """ Convert between text-label and text-index """
@@ -307,6 +467,9 @@ class CTCLabelConverter(object):
                 dict_list[lang] = word_count
 
         self.dict_list = dict_list
+        self.dict_pathlist = dict_pathlist
+        self._dict_tries = {}
+        self._constraints = {}
 
     def encode(self, text, batch_max_length=25):
         """convert text-label into text-index.
@@ -322,6 +485,7 @@ class CTCLabelConverter(object):
         text = ''.join(text)
         text = [self.dict[char] for char in text]
 
+        import torch # training-only path; keeps `import easyocr.utils` free of torch
         return (torch.IntTensor(text), torch.IntTensor(length))
 
     def decode_greedy(self, text_index, length):
@@ -342,19 +506,34 @@ class CTCLabelConverter(object):
             index += l
         return texts
 
+    def get_dict_trie(self, lang=None):
+        """ Dictionary trie for decode_wordbeamsearch: all dictionaries merged (no separators)
+        or one language's. Built on first use and cached on disk (lexicon.load_dict_trie).
+        """
+        if lang not in self._dict_tries:
+            if len(self.separator_list) == 0:
+                paths = list(self.dict_pathlist.values())
+            else:
+                paths = [self.dict_pathlist[lang]]
+            self._dict_tries[lang] = load_dict_trie(paths, self.character)
+        return self._dict_tries[lang]
+
+    def labeling_to_text(self, labeling):
+        return ''.join([self.character[l] for l in labeling if l not in self.ignore_idx])
+
     def decode_beamsearch(self, mat, beamWidth=5):
-        texts = []
-        for i in range(mat.shape[0]):
-            t = ctcBeamSearch(mat[i], self.character, self.ignore_idx, None, beamWidth=beamWidth)
-            texts.append(t)
-        return texts
+        """ Batched prefix beam search over (batch, T, num_class) probabilities. """
+        return [self.labeling_to_text(beams[0][0]) for beams in ctc_beam_search_batch(mat, beamWidth=beamWidth)]
 
-    def decode_wordbeamsearch(self, mat, beamWidth=5):
-        texts = []
+    def decode_wordbeamsearch(self, mat, beamWidth=5, maxCandidate=20):
+        """ Beam search per word segment, all segments of the batch at once. Each segment is
+        also searched constrained to the dictionary trie; that word is used if it is at least
+        as probable as the maxCandidate-th unconstrained candidate, else the best candidate.
+        """
         argmax = np.argmax(mat, axis = 2)
+        segments = [] # (image index, probabilities, dictionary language or '' for none, prefix)
 
         for i in range(mat.shape[0]):
-            string = ''
             # without separators - use space as separator
             if len(self.separator_list) == 0:
                 space_idx = self.dict[' ']
@@ -364,11 +543,7 @@ class CTCLabelConverter(object):
                 group = [ list(item) for item in group if len(item)>0]
 
                 for j, list_idx in enumerate(group):
-                    matrix = mat[i, list_idx,:]
-                    t = ctcBeamSearch(matrix, self.character, self.ignore_idx, None,\
-                                      beamWidth=beamWidth, dict_list=self.dict_list)
-                    if j == 0: string += t
-                    else: string += ' '+t
+                    segments.append((i, mat[i, list_idx,:], None, '' if j == 0 else ' '))
 
             # with separators
             else:
@@ -376,13 +551,69 @@ class CTCLabelConverter(object):
 
                 for word in words:
                     matrix = mat[i, word[1][0]:word[1][1]+1,:]
-                    if word[0] == '': dict_list = []
-                    else: dict_list = self.dict_list[word[0]]
-                    t = ctcBeamSearch(matrix, self.character, self.ignore_idx, None, beamWidth=beamWidth, dict_list=dict_list)
-                    string += t
-            texts.append(string)
+                    segments.append((i, matrix, word[0], ''))
+
+        texts = [''] * mat.shape[0]
+        if not segments:
+            return texts
+        results = ctc_beam_search_batch([seg[1] for seg in segments], beamWidth=beamWidth, n_best=maxCandidate)
+        best = [self.labeling_to_text(beams[0][0]) for beams in results]
+
+        # dictionary-constrained search, one batch per dictionary
+        for lang in set(seg[2] for seg in segments if seg[2] != ''):
+            trie = self.get_dict_trie(lang)
+            if trie is None:
+                continue
+            idx = [j for j, seg in enumerate(segments) if seg[2] == lang]
+            constrained = ctc_beam_search_batch([segments[j][1] for j in idx], beamWidth=beamWidth, constraint=trie)
+            for j, beams in zip(idx, constrained):
+                labeling, score = beams[0]
+                # the word would have made the unconstrained candidate list
+                bar = results[j][-1][1] if len(results[j]) >= maxCandidate else -np.inf
+                if np.isfinite(score) and score >= bar:
+                    best[j] = self.labeling_to_text(labeling)
+
+        for (i, _, _, prefix), text in zip(segments, best):
+            texts[i] += prefix + text
         return texts
 
+    def compile_constraint(self, constraint, flags=0):
+        """ Automaton for decode_constrained, cached per converter.
+        constraint: a regex string (lexicon.RegexDFA, full match, re `flags`), a list / tuple / set of
+        allowed strings (lexicon.CharTrie), or an already built automaton (returned as is).
+        """
+        if constraint is None or hasattr(constraint, 'child'):
+            return constraint
+        if isinstance(constraint, str):
+            key = ('regex', constraint, flags)
+        else:
+            key = ('lexicon', tuple(constraint))
+        if key not in self._constraints:
+            if key[0] == 'regex':
+                self._constraints[key] = RegexDFA(constraint, self.character, flags)
+            else:
+                char_index = {char: i for i, char in enumerate(self.character) if i > 0}
+                self._constraints[key] = CharTrie.from_words(key[1], char_index, len(self.character))
+        return self._constraints[key]
+
+    def decode_constrained(self, mat, constraint, beamWidth=5):
+        """ Beam search restricted to the strings `constraint` accepts (see compile_constraint).
+        Returns (text, gap) per item, gap being the log probability of the constrained text minus
+        that of the best unconstrained one (<= 0). Items with no accepted string get the
+        unconstrained text and a gap of -inf.
+        """
+        automaton = self.compile_constraint(constraint)
+        free = ctc_beam_search_batch(mat, beamWidth=beamWidth)
+        constrained = ctc_beam_search_batch(mat, beamWidth=beamWidth, constraint=automaton)
+        results = []
+        for free_beams, beams in zip(free, constrained):
+            (free_labeling, free_score), (labeling, score) = free_beams[0], beams[0]
+            if np.isfinite(score):
+                results.append((self.labeling_to_text(labeling), min(0., score - free_score)))
+            else:
+                results.append((self.labeling_to_text(free_labeling), -np.inf))
+        return results
+
 def merge_to_free(merge_result, free_list):
     merge_result_buf, mr_buf = [], []
 
@@ -447,6 +678,28 @@ def four_point_transform(image, rect):
 
     return warped
 
+def get_tiles(img_h, tile_height, overlap):
+    # top row of each full-width tile, plus the [own_top, own_bottom) band of rows
+    # whose boxes that tile keeps; bands meet in the middle of each overlap
+    step = max(1, tile_height - overlap)
+    tops = list(range(0, img_h - tile_height + 1, step))
+    if tops[-1] + tile_height < img_h:
+        tops.append(img_h - tile_height)
+    cuts = [0] + [(tops[i] + tops[i-1] + tile_height) / 2 for i in range(1, len(tops))] + [img_h]
+    return [(top, cuts[i], cuts[i+1]) for i, top in enumerate(tops)]
+
+def merge_tile_boxes(tile_boxes, tiles):
+    # shift each tile's polys back to image coordinates and keep only the ones
+    # centred in the tile's own band, so text in an overlap is reported once
+    merged = []
+    for boxes, (top, own_top, own_bottom) in zip(tile_boxes, tiles):
+        for box in boxes:
+            box = np.array(box)
+            box[1::2] += top
+            if own_top <= box[1::2].mean() < own_bottom:
+                merged.append(box)
+    return merged
+
 def group_text_box(polys, slope_ths = 0.1, ycenter_ths = 0.5, height_ths = 0.5, width_ths = 1.0, add_margin = 0.05, sort_output = True):
     # poly top-left, top-right, low-right, low-left
     horizontal_list, free_list,combined_list, merged_list = [],[],[],[]
@@ -630,13 +883,45 @@ def download_and_unzip(url, filename, model_storage_directory, verbose=True):
         zipObj.extract(filename, model_storage_directory)
     os.remove(zip_path)
 
-def calculate_md5(fname):
+MD5_CACHE_FILE = '.md5_cache.json'
+
+def _file_md5(fname):
     hash_md5 = hashlib.md5()
     with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
+        for chunk in iter(lambda: f.read(1 << 20), b""):
             hash_md5.update(chunk)
     return hash_md5.hexdigest()
 
+def calculate_md5(fname, use_cache=True):
+    """ md5 of a file. Hashes are remembered in MD5_CACHE_FILE next to the file, keyed on
+    its size + mtime, so unchanged model files are not re-read on every Reader start.
+    """
+    if not use_cache:
+        return _file_md5(fname)
+    st = os.stat(fname)
+    stamp = [st.st_size, st.st_mtime_ns]
+    cache_path = os.path.join(os.path.dirname(os.path.abspath(fname)), MD5_CACHE_FILE)
+    name = os.path.basename(fname)
+    try:
+        with open(cache_path, encoding='utf8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    entry = cache.get(name)
+    if isinstance(entry, dict) and entry.get('stamp') == stamp:
+        return entry['md5']
+
+    md5 = _file_md5(fname)
+    cache[name] = {'stamp': stamp, 'md5': md5}
+    tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+    try:
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass # read-only model directory: hash again next time
+    return md5
+
 def diff(input_list):
     return max(input_list)-min(input_list)
 
@@ -729,44 +1014,106 @@ def printProgressBar(prefix='', suffix='', decimals=1, length=100, fill='█'):
 
     return progress_hook
 
-def reformat_input(image):
-    if type(image) == str:
+class DecodedImage(object):
+    """ An input image decoded once. The colour view (what the detector gets) and
+    the grey view (what the recognizer gets) are derived from the decoded base
+    array on first use, so a caller that needs only one never pays for the other.
+    """
+
+    def __init__(self, base, color_code=None, grey_code=None, encoded=False):
+        self.base = base                # array as decoded / as given, never copied
+        self.encoded = encoded          # True when base is a BGR decode of file/bytes input (RGB once .color is used)
+        self._color_code = color_code   # cv2 conversion base -> colour, None means base itself
+        self._grey_code = grey_code     # cv2 conversion base -> grey, None means base itself
+        self._color = None
+        self._grey = None
+
+    @property
+    def color(self):
+        if self._color is None:
+            if self._color_code is None:
+                self._color = self.base
+            elif self.encoded:
+                # swap BGR -> RGB inside the decode buffer instead of allocating a second image
+                self._color = cv2.cvtColor(self.base, self._color_code, dst=self.base)
+                self._grey_code = cv2.COLOR_RGB2GRAY
+            else:
+                self._color = cv2.cvtColor(self.base, self._color_code)
+        return self._color
+
+    @property
+    def grey(self):
+        if self._grey is None:
+            self._grey = self.base if self._grey_code is None else cv2.cvtColor(self.base, self._grey_code)
+        return self._grey
+
+    @property
+    def bgr(self):
+        # for drawing / saving with OpenCV
+        if self.encoded and self._color is None:
+            return self.base
+        return cv2.cvtColor(self.color, cv2.COLOR_RGB2BGR) if self.color.ndim == 3 else self.color
+
+    @property
+    def shape(self):
+        return self.base.shape[:2]
+
+def _decode_buffer(buf, source='buffer'):
+    # buf is any object exposing the buffer protocol; np.frombuffer does not copy it
+    arr = np.frombuffer(buf, np.uint8)
+    try:
+        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    finally:
+        del arr     # release the buffer export so an mmap can be closed
+    if img is None:
+        raise ValueError('Cannot decode image from {}'.format(source))
+    return DecodedImage(img, cv2.COLOR_BGR2RGB, cv2.COLOR_BGR2GRAY, encoded=True)
+
+def _decode_file(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError('Cannot decode image from empty file {}'.format(path))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return _decode_buffer(mm, path)
+        finally:
+            mm.close()
+
+def decode_image(image):
+    """ Decode any supported input once into a DecodedImage.
+    image: file path or url, bytes / bytearray / memoryview / mmap of an encoded
+    image, numpy array (grey, BGR or RGBA), PIL image, or a DecodedImage (returned as is).
+    Buffers and arrays are used in place, without copying.
+    """
+    if isinstance(image, DecodedImage):
+        return image
+    if isinstance(image, str):
         if image.startswith('http://') or image.startswith('https://'):
             tmp, _ = urlretrieve(image , reporthook=printProgressBar(prefix = 'Progress:', suffix = 'Complete', length = 50))
-            img_cv_grey = cv2.imread(tmp, cv2.IMREAD_GRAYSCALE)
-            os.remove(tmp)
-        else:
-            img_cv_grey = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
-            image = os.path.expanduser(image)
-        img = loadImage(image)  # can accept URL
-    elif type(image) == bytes:
-        nparr = np.frombuffer(image, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img_cv_grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    elif type(image) == np.ndarray:
+            try:
+                return _decode_file(tmp)
+            finally:
+                os.remove(tmp)
+        return _decode_file(os.path.expanduser(image))
+    if isinstance(image, (bytes, bytearray, memoryview, mmap.mmap)):
+        return _decode_buffer(image)
+    if isinstance(image, np.ndarray):
+        if len(image.shape) == 3 and image.shape[2] == 1:
+            image = np.squeeze(image, axis=2)
         if len(image.shape) == 2: # grayscale
-            img_cv_grey = image
-            img = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-        elif len(image.shape) == 3 and image.shape[2] == 1:
-            img_cv_grey = np.squeeze(image)
-            img = cv2.cvtColor(img_cv_grey, cv2.COLOR_GRAY2BGR)
+            return DecodedImage(image, color_code=cv2.COLOR_GRAY2BGR)
         elif len(image.shape) == 3 and image.shape[2] == 3: # BGRscale
-            img = image
-            img_cv_grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            return DecodedImage(image, grey_code=cv2.COLOR_BGR2GRAY)
         elif len(image.shape) == 3 and image.shape[2] == 4: # RGBAscale
-            img = image[:,:,:3]
-            img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-            img_cv_grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    elif type(image) == JpegImagePlugin.JpegImageFile:
-        image_array = np.array(image)
-        img = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-        img_cv_grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        raise ValueError('Invalid input type. Supporting format = string(file path or url), bytes, numpy array')
+            return DecodedImage(image[:,:,:3], cv2.COLOR_RGB2BGR, cv2.COLOR_RGB2GRAY)
+    if isinstance(image, Image.Image):
+        image_array = np.asarray(image if image.mode == 'RGB' else image.convert('RGB'))
+        return DecodedImage(image_array, cv2.COLOR_RGB2BGR, cv2.COLOR_RGB2GRAY)
+    raise ValueError('Invalid input type. Supporting format = string(file path or url), bytes, memoryview, mmap, numpy array, PIL image')
 
-    return img, img_cv_grey
+def reformat_input(image):
+    image = decode_image(image)
+    return image.color, image.grey
 
 
 def reformat_input_batched(image, n_width=None, n_height=None):
@@ -777,22 +1124,31 @@ def reformat_input_batched(image, n_width=None, n_height=None):
         [file path, numpy-array, byte stream object,
         list of file paths, list of numpy-array, 4D numpy array,
         list of byte stream objects]
+    Same-sized images (or any, resized to n_width x n_height) come back as 4D / 3D
+    arrays; images of different sizes come back as lists of per-image arrays.
     """
     if ((isinstance(image, np.ndarray) and len(image.shape) == 4) or isinstance(image, list)):
-        # process image batches if image is list of image np arr, paths, bytes
-        img, img_cv_grey = [], []
-        for single_img in image:
-            clr, gry = reformat_input(single_img)
+        # process image batches if image is list of image np arr, paths, bytes;
+        # each image is decoded once and written straight into the batch arrays
+        img, img_cv_grey = None, None
+        for i, single_img in enumerate(image):
+            single_img = decode_image(single_img)
+            clr, gry = single_img.color, single_img.grey
             if n_width is not None and n_height is not None:
                 clr = cv2.resize(clr, (n_width, n_height))
                 gry = cv2.resize(gry, (n_width, n_height))
-            img.append(clr)
-            img_cv_grey.append(gry)
-        img, img_cv_grey = np.array(img), np.array(img_cv_grey)
-        # ragged tensors created when all input imgs are not of the same size
-        if len(img.shape) == 1 and len(img_cv_grey.shape) == 1:
-            raise ValueError("The input image array contains images of different sizes. " +
-                             "Please resize all images to same shape or pass n_width, n_height to auto-resize")
+            if img is None:
+                img = np.empty((len(image),) + clr.shape, dtype=clr.dtype)
+                img_cv_grey = np.empty((len(image),) + gry.shape, dtype=gry.dtype)
+            elif isinstance(img, np.ndarray) and clr.shape != img.shape[1:]:
+                # ragged batch: keep per-image arrays (detection buckets them by shape)
+                img, img_cv_grey = list(img[:i]), list(img_cv_grey[:i])
+            if isinstance(img, list):
+                img.append(clr)
+                img_cv_grey.append(gry)
+            else:
+                img[i] = clr
+                img_cv_grey[i] = gry
     else:
         img, img_cv_grey = reformat_input(image)
     return img, img_cv_grey
@@ -805,7 +1161,8 @@ def make_rotated_img_list(rotationInfo, img_list):
 
     # add rotated images to original image_list
     max_ratio=1
-    
+    from scipy import ndimage # only needed (and imported) when rotation_info is used
+
     for angle in rotationInfo:
         for img_info in img_list : 
             rotated = ndimage.rotate(img_info[1], angle, reshape=True) 
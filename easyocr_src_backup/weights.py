@@ -0,0 +1,113 @@
+"""
+Compiled CPU weights: the detector / recognizer state dict with the DataParallel
+prefix stripped, saved as a plain tensor file next to the downloaded .pth files.
+
+Loading one is a torch.load(mmap=True, weights_only=True) - nothing but tensors
+and plain metadata is unpickled - into an architecture built on the meta device,
+so there is no random init or state-dict copy, and the float tensors stay backed
+by the file's page cache: every worker process on a host shares one copy of them.
+Dynamic quantization (LSTM / Linear only) still runs per process.
+
+    python -m easyocr.weights -l en [-m model_dir]
+"""
+import os
+import argparse
+from logging import getLogger
+
+import torch
+
+from .utils import calculate_md5
+
+LOGGER = getLogger(__name__)
+
+COMPILED_FORMAT = 2
+
+def compiled_path(model_path):
+    # craft_mlt_25k.pth -> craft_mlt_25k.compiled.pt
+    return os.path.splitext(model_path)[0] + '.compiled.pt'
+
+def compiled_header(model_path):
+    # a compiled file is only valid for the exact source weights
+    return {'format': COMPILED_FORMAT, 'source_md5': calculate_md5(model_path)}
+
+def save_compiled(model_path):
+    """ Write the compiled weights of the .pth at model_path; returns the written path. """
+    state_dict = torch.load(model_path, map_location='cpu', weights_only=True)
+    state_dict = {(key[len('module.'):] if key.startswith('module.') else key): value.contiguous()
+                  for key, value in state_dict.items()}
+    path = compiled_path(model_path)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    torch.save({'header': compiled_header(model_path), 'state_dict': state_dict}, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def load_compiled(model_path, build, quantize):
+    """
+    Model for model_path from its memory-mapped compiled weights, or None if there
+    are none or they are stale. build() returns the (float) architecture.
+    """
+    path = compiled_path(model_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        checkpoint = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    except Exception as e:
+        LOGGER.warning('Ignoring unreadable compiled weights %s: %s' % (path, e))
+        return None
+    if checkpoint.get('header') != compiled_header(model_path):
+        LOGGER.warning('Compiled weights %s are stale (weights changed or older format), '
+                       'rebuild them with python -m easyocr.weights' % path)
+        return None
+    with torch.device('meta'):
+        model = build()
+    try:
+        model.load_state_dict(checkpoint['state_dict'], assign=True)
+    except RuntimeError as e:
+        LOGGER.warning('Ignoring compiled weights %s: %s' % (path, e))
+        return None
+    if any(t.is_meta for t in list(model.parameters()) + list(model.buffers())):
+        LOGGER.warning('Ignoring compiled weights %s: tensors missing from the file' % path)
+        return None
+    if quantize:
+        try:
+            torch.quantization.quantize_dynamic(model, dtype=torch.qint8, inplace=True)
+        except:
+            pass
+    return model.eval()
+
+def compile_reader(reader):
+    """ Save the compiled weights of a CPU torch Reader; returns the written paths. """
+    if reader.device != 'cpu' or reader.backend != 'torch':
+        raise ValueError('Only CPU torch Readers can be compiled')
+    paths = []
+    if getattr(reader, 'detector', None) is not None and reader.detect_network == 'craft':
+        paths.append(save_compiled(reader.detector_path))
+    if getattr(reader, 'recognizer', None) is not None:
+        paths.append(save_compiled(reader.recognizer_path))
+    return paths
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compile EasyOCR CPU weights for fast, shared loading')
+    parser.add_argument('-l', '--lang_list', nargs='+', type=str, default=['en'],
+                        help='-l en ch_sim ... (language lists for easyocr)')
+    parser.add_argument('-m', '--model_storage_directory', type=str,
+                        help='model storage directory (compiled files are written next to the weights)')
+    parser.add_argument('-u', '--user_network_directory', type=str,
+                        help='user model storage directory')
+    parser.add_argument('--recog_network', type=str, default='standard')
+    parser.add_argument('--no_detector', action='store_true', help='skip the detector')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    from .easyocr import Reader
+    reader = Reader(args.lang_list, gpu=False, detector=not args.no_detector,
+                    recog_network=args.recog_network,
+                    model_storage_directory=args.model_storage_directory,
+                    user_network_directory=args.user_network_directory,
+                    use_compiled=False)
+    for path in compile_reader(reader):
+        print('Compiled %s' % path)
+
+if __name__ == '__main__':
+    main()
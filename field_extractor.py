@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import re
+from difflib import SequenceMatcher
+
+# ——— CONFIG ———
+LABEL_MATCH_THS = 0.8    # min fuzzy ratio for an OCR block to count as a label
+BELOW_PENALTY   = 0.9    # values found under a label are slightly less certain than inline/right ones
+# —————————————————
+
+
+def _norm(text):
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text.lower()).split())
+
+
+def row_tolerance(blocks):
+    """A bit under half the tightest common row gap, in the blocks' own pixel scale."""
+    ys = sorted({round(b["y"]) for b in blocks})
+    gaps = sorted(b - a for a, b in zip(ys, ys[1:]) if b - a > 5)
+    return 0.4 * gaps[len(gaps) // 4] if gaps else 10.0
+
+
+def match_labels(blocks, labels):
+    """
+    Map each label to the OCR block that best matches it.
+    Returns {label: (block_index, score, inline_value)}; inline_value is set
+    when the block itself reads "Label: value".
+    """
+    norm_labels = {lab: _norm(lab) for lab in labels}
+    best = {}
+    for i, b in enumerate(blocks):
+        head, sep, tail = b["text"].partition(":")
+        candidates = [(_norm(b["text"]), None)]
+        if sep and tail.strip():
+            candidates.append((_norm(head), tail.strip()))
+        for lab, nlab in norm_labels.items():
+            for ntext, inline in candidates:
+                sm = SequenceMatcher(None, nlab, ntext)
+                if sm.real_quick_ratio() < LABEL_MATCH_THS or sm.quick_ratio() < LABEL_MATCH_THS:
+                    continue
+                score = sm.ratio()
+                if score >= LABEL_MATCH_THS and score > best.get(lab, (None, 0))[1]:
+                    best[lab] = (i, score, inline)
+    return best
+
+
+def extract_fields(blocks, labels):
+    """
+    Spatial key-value extraction over OCR blocks ({text, conf, x, y}).
+
+    A label's value is, in order of preference: the text after "Label:" in
+    the same block, the nearest block to its right on the same row, or the
+    block on the next row down whose column is closest to this label.
+    Returns {label: (value, confidence)} for every label that was resolved.
+    """
+    return {lab: (value, conf) for lab, (value, conf, _, _) in locate_fields(blocks, labels).items()}
+
+
+def locate_fields(blocks, labels):
+    """
+    extract_fields, plus where each field was found:
+    {label: (value, confidence, label_block_index, value_block_index)};
+    value_block_index is None for an inline "Label: value" block.
+    """
+    if not blocks:
+        return {}
+    found = match_labels(blocks, labels)
+    label_idx = {i for i, _, _ in found.values()}
+    label_pos = {lab: (blocks[i]["x"], blocks[i]["y"]) for lab, (i, _, _) in found.items()}
+    tol = row_tolerance(blocks)
+
+    fields = {}
+    for lab, (i, score, inline) in found.items():
+        lb = blocks[i]
+        if inline:
+            fields[lab] = (inline, score * lb["conf"], i, None)
+            continue
+
+        # nearest block to the right on the same row; stop if it is another label
+        right = [j for j, b in enumerate(blocks)
+                 if j != i and abs(b["y"] - lb["y"]) <= tol and b["x"] > lb["x"]]
+        if right:
+            j = min(right, key=lambda j: blocks[j]["x"])
+            if j not in label_idx:
+                fields[lab] = (blocks[j]["text"], score * blocks[j]["conf"], i, j)
+                continue
+
+        # next row down, claimed by whichever label on this row sits closest in x;
+        # if the closest block there is itself a label, this field has no value
+        below = [j for j, b in enumerate(blocks) if tol < b["y"] - lb["y"] <= 4 * tol]
+        if not below:
+            continue
+        next_y = min(blocks[j]["y"] for j in below)
+        row = [j for j in below if blocks[j]["y"] - next_y <= tol]
+        same_row_labels = [l for l, (x, y) in label_pos.items() if abs(y - lb["y"]) <= tol]
+        mine = [j for j in row
+                if min(same_row_labels, key=lambda l: abs(label_pos[l][0] - blocks[j]["x"])) == lab]
+        if mine:
+            j = min(mine, key=lambda j: abs(blocks[j]["x"] - lb["x"]))
+            if j not in label_idx:
+                fields[lab] = (blocks[j]["text"], score * blocks[j]["conf"] * BELOW_PENALTY, i, j)
+    return fields
+
+
+def is_confident(fields, required, min_conf):
+    """True when every required field was found with at least `min_conf`."""
+    return all(lab in fields and fields[lab][1] >= min_conf for lab in required)
+
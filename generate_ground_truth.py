@@ -1,46 +1,65 @@
 #!/usr/bin/env python3
+import os
 import sys
 import csv
 from pathlib import Path
-from universal_receipt_ocr import extract_blocks, call_llm_extract
+from batch_pipeline import BatchPipeline, compact_journal
 
 # ——— CONFIG ———
 RECEIPT_DIR    = Path("large-receipt-image-dataset-SRD")        # folder with your 200 receipt images
 GROUND_TRUTH   = Path("ground_truth.csv")
+JOURNAL        = Path("ground_truth.jsonl")   # append-only, one line per finished receipt; rerun skips them
+OCR_WORKERS    = int(os.getenv("OCR_WORKERS", "0")) or None   # OCR processes (default: half the cores)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))      # LLM calls in flight at once
 # —————————————————
 
-if not RECEIPT_DIR.is_dir():
-    print(f"❌ Folder not found: {RECEIPT_DIR}")
-    sys.exit(1)
-
-all_data = {}
-all_fields = set()
-
-# 1) Process each receipt
-for img_path in sorted(RECEIPT_DIR.iterdir()):
-    if img_path.suffix.lower() not in {".png",".jpg",".jpeg"}:
-        continue
-    print(f"⏳ Processing {img_path.name}…")
-    blocks = extract_blocks(img_path)
-    structured = call_llm_extract(blocks)
-    all_data[img_path.name] = structured
-    all_fields.update(structured.keys())
-
-if not all_data:
-    print("❌ No receipts processed.")
-    sys.exit(1)
-
-# Sort columns for consistency
-fields = sorted(all_fields)
-
-# 2) Write ground_truth.csv
-with GROUND_TRUTH.open("w", newline="", encoding="utf-8") as f:
-    writer = csv.writer(f)
-    # Header row: filename + all fields
-    writer.writerow(["filename"] + fields)
-    # One row per image
-    for fname, data in all_data.items():
-        row = [fname] + [data.get(field, "") for field in fields]
-        writer.writerow(row)
-
-print(f"✅ ground-truth written to {GROUND_TRUTH}")
+
+def main():
+    # imported here so OCR worker processes don't rerun the OpenAI startup check
+    from universal_receipt_ocr import call_llm_extract
+
+    if not RECEIPT_DIR.is_dir():
+        print(f"❌ Folder not found: {RECEIPT_DIR}")
+        sys.exit(1)
+
+    images = [p for p in sorted(RECEIPT_DIR.iterdir())
+              if p.suffix.lower() in {".png",".jpg",".jpeg"}]
+
+    # 1) Process each receipt; every result is flushed to the journal as it finishes
+    pipeline = BatchPipeline(call_llm_extract, journal_path=JOURNAL,
+                             ocr_workers=OCR_WORKERS, llm_concurrency=LLM_CONCURRENCY)
+    records = list(pipeline.run(images))
+    failed = [rec["filename"] for rec in records if "error" in rec]
+    pipeline.print_stats()
+
+    # 2) Compact the journal down to the current version of each receipt
+    done = compact_journal(JOURNAL, {rec["filename"]: rec["sha1"] for rec in records})
+    if not done:
+        print("❌ No receipts processed.")
+        sys.exit(1)
+
+    all_fields = set()
+    for rec in done.values():
+        all_fields.update(rec["pred"].keys())
+
+    # Sort columns for consistency
+    fields = sorted(all_fields)
+
+    # 3) Write ground_truth.csv
+    with GROUND_TRUTH.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        # Header row: filename + all fields
+        writer.writerow(["filename"] + fields)
+        # One row per image
+        for fname, rec in done.items():
+            data = rec["pred"]
+            row = [fname] + [data.get(field, "") for field in fields]
+            writer.writerow(row)
+
+    print(f"✅ ground-truth written to {GROUND_TRUTH}")
+    if failed:
+        print(f"⚠️  {len(failed)} receipt(s) failed and were left out; rerun to retry: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
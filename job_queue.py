@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+import urllib.request
+from contextlib import contextmanager
+
+# ——— CONFIG ———
+JOB_DB_PATH       = os.getenv("JOB_DB_PATH", "jobs.sqlite")
+JOB_VISIBILITY_S  = float(os.getenv("JOB_VISIBILITY_S", 120))  # a claimed job is offered again once its lease runs out
+JOB_MAX_ATTEMPTS  = int(os.getenv("JOB_MAX_ATTEMPTS", 3))      # per stage, then the job fails
+JOB_RETRY_DELAY_S = 5.0     # back-off before the first retry, doubled for each further one
+JOB_POLL_S        = 0.5     # how often idle workers look for new jobs
+WEBHOOK_TIMEOUT_S = 10.0
+WEBHOOK_ATTEMPTS  = 5
+# —————————————————
+
+FINAL_STAGES = ("done", "failed")
+
+
+class JobFailed(Exception):
+    """Raised by a stage handler for errors a retry cannot fix (e.g. an undecodable upload)."""
+
+
+class JobQueue:
+    """
+    Durable job queue in SQLite, shared by the API process and the worker processes.
+
+    A job moves through named stages ("ocr" → "structure" → "done", or "failed").
+    Workers claim the oldest available job of their stage under a lease of
+    `visibility` seconds and renew it while they work, so a job whose worker
+    crashed or hung is offered again once the lease runs out. Failed attempts
+    are retried with exponential back-off, up to `max_attempts` per stage.
+    Every stage records how long the job waited for it and how long it ran.
+    Jobs submitted with a webhook get a (retried) POST of their final state.
+    """
+
+    def __init__(self, path=JOB_DB_PATH, visibility=JOB_VISIBILITY_S, max_attempts=JOB_MAX_ATTEMPTS):
+        self.visibility = visibility
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                          "id TEXT PRIMARY KEY, filename TEXT, webhook TEXT, "
+                          "stage TEXT NOT NULL, stage_since REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                          "available_at REAL NOT NULL, lease_until REAL, worker TEXT, "
+                          "image BLOB, blocks TEXT, result TEXT, error TEXT, timings TEXT NOT NULL DEFAULT '{}', "
+                          "notify TEXT, notify_attempts INTEGER NOT NULL DEFAULT 0, notify_at REAL, notify_lease REAL, "
+                          "created REAL NOT NULL, updated REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage, available_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_notify ON jobs (notify, notify_at)")
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes can't claim the same job
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def submit(self, image, filename="", webhook=None, stage="ocr"):
+        """Queue an encoded image; returns the new job id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT INTO jobs (id, filename, webhook, stage, stage_since, available_at, "
+                              "image, created, updated) VALUES (?,?,?,?,?,?,?,?,?)",
+                              (job_id, filename, webhook, stage, now, now, sqlite3.Binary(image), now, now))
+        return job_id
+
+    def pending(self):
+        """Jobs not finished yet."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE stage NOT IN (?,?)", FINAL_STAGES).fetchone()[0]
+
+    def _move(self, db, job_id, stage, now, timings=None, **columns):
+        row = db.execute("SELECT stage, attempts, created, timings, webhook FROM jobs WHERE id=?",
+                         (job_id,)).fetchone()
+        merged = dict(json.loads(row["timings"]), **(timings or {}))
+        merged.setdefault(f"{row['stage']}_attempts", row["attempts"])   # also when the stage failed
+        values = dict({"error": None}, **columns)   # a retried stage that went through leaves no error behind
+        values.update(stage=stage, stage_since=now, attempts=0, available_at=now,
+                      lease_until=None, worker=None, updated=now)
+        if stage in FINAL_STAGES:
+            values["attempts"] = row["attempts"]    # GET /jobs reports the last stage's attempts
+            merged["total_s"] = round(now - row["created"], 3)
+            values["image"] = None
+            if row["webhook"]:
+                values.update(notify="pending", notify_at=now)
+        values["timings"] = json.dumps(merged)
+        db.execute("UPDATE jobs SET " + ", ".join(f"{k}=?" for k in values) + " WHERE id=?",
+                   (*values.values(), job_id))
+
+    @staticmethod
+    def _owned(db, job):
+        # still ours unless the lease ran out and another worker took the job over
+        return db.execute("SELECT 1 FROM jobs WHERE id=? AND stage=? AND worker=?",
+                          (job["id"], job["stage"], job["worker"])).fetchone() is not None
+
+    def claim(self, stage, worker):
+        """Lease the oldest available job of `stage` to `worker`; a dict of its columns, or None."""
+        now = time.time()
+        with self._transaction() as db:
+            # the lease ran out on the last allowed attempt: its worker died or hung on this job
+            for row in db.execute("SELECT id, attempts FROM jobs WHERE stage=? AND lease_until<=? AND attempts>=?",
+                                  (stage, now, self.max_attempts)).fetchall():
+                self._move(db, row["id"], "failed", now, error=f"{stage}: no result within "
+                           f"{self.visibility:.0f}s visibility timeout after {row['attempts']} attempts")
+            row = db.execute("SELECT * FROM jobs WHERE stage=? AND available_at<=? "
+                             "AND (lease_until IS NULL OR lease_until<=?) ORDER BY created LIMIT 1",
+                             (stage, now, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET attempts=attempts+1, lease_until=?, worker=?, updated=? WHERE id=?",
+                       (now + self.visibility, worker, now, row["id"]))
+        return dict(row, attempts=row["attempts"] + 1, worker=worker, claimed=now)
+
+    def extend(self, job):
+        """Renew the lease on a claimed job; False if it was lost to another worker."""
+        with self.lock:
+            return self.conn.execute("UPDATE jobs SET lease_until=? WHERE id=? AND stage=? AND worker=?",
+                                     (time.time() + self.visibility, job["id"], job["stage"],
+                                      job["worker"])).rowcount > 0
+
+    def advance(self, job, stage, seconds, **columns):
+        """Finish the claimed job's current stage, storing `columns`, and move it on to `stage`."""
+        now = time.time()
+        timings = {f"{job['stage']}_wait_s": round(job["claimed"] - job["stage_since"], 3),
+                   f"{job['stage']}_s": round(seconds, 3), f"{job['stage']}_attempts": job["attempts"]}
+        with self._transaction() as db:
+            if not self._owned(db, job):
+                return False
+            self._move(db, job["id"], stage, now, timings, **columns)
+        return True
+
+    def retry(self, job, error):
+        """Give the claimed job back for another attempt after a back-off, or fail it after the last one."""
+        now = time.time()
+        error = f"{job['stage']}: {error}"
+        with self._transaction() as db:
+            if not self._owned(db, job):
+                return False
+            if job["attempts"] >= self.max_attempts:
+                self._move(db, job["id"], "failed", now, error=error)
+            else:
+                db.execute("UPDATE jobs SET lease_until=NULL, worker=NULL, available_at=?, error=?, updated=? "
+                           "WHERE id=?", (now + JOB_RETRY_DELAY_S * 2 ** (job["attempts"] - 1), error, now, job["id"]))
+        return True
+
+    def fail(self, job, error):
+        with self._transaction() as db:
+            if not self._owned(db, job):
+                return False
+            self._move(db, job["id"], "failed", time.time(), error=f"{job['stage']}: {error}")
+        return True
+
+    def get(self, job_id):
+        """Client view of a job (no image or OCR blocks), or None if unknown."""
+        with self.lock:
+            row = self.conn.execute("SELECT id, filename, stage, attempts, lease_until, result, error, timings, "
+                                    "notify, created, updated FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        if row["stage"] in FINAL_STAGES:
+            status = row["stage"]
+        else:
+            status = "running" if row["lease_until"] and row["lease_until"] > time.time() else "queued"
+        return {"id": row["id"], "status": status, "stage": row["stage"], "attempts": row["attempts"],
+                "filename": row["filename"], "result": json.loads(row["result"]) if row["result"] else None,
+                "error": row["error"], "timings": json.loads(row["timings"]), "webhook": row["notify"],
+                "created": row["created"], "updated": row["updated"]}
+
+    def claim_notification(self, worker):
+        """Lease the next due webhook delivery; the job's columns, or None."""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT * FROM jobs WHERE notify='pending' AND notify_at<=? "
+                             "AND (notify_lease IS NULL OR notify_lease<=?) ORDER BY notify_at LIMIT 1",
+                             (now, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET notify_attempts=notify_attempts+1, notify_lease=? WHERE id=?",
+                       (now + 2 * WEBHOOK_TIMEOUT_S, row["id"]))
+        return dict(row, notify_attempts=row["notify_attempts"] + 1, worker=worker)
+
+    def notified(self, job, error=None):
+        """Record a webhook delivery attempt: sent, retried after a back-off, or given up."""
+        now = time.time()
+        if error is None:
+            state, notify_at = "sent", None
+        elif job["notify_attempts"] >= WEBHOOK_ATTEMPTS:
+            state, notify_at = "failed", None
+        else:
+            state, notify_at = "pending", now + JOB_RETRY_DELAY_S * 2 ** (job["notify_attempts"] - 1)
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET notify=?, notify_at=?, notify_lease=NULL, updated=? WHERE id=?",
+                              (state, notify_at, now, job["id"]))
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # a webhook host must not bounce the POST on to a host that isn't allowed
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+_webhook_opener = urllib.request.build_opener(_NoRedirect)
+
+
+@contextmanager
+def _renewing(queue, job):
+    """Keep renewing the job's lease while the stage handler runs."""
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(queue.visibility / 3):
+            queue.extend(job)
+
+    thread = threading.Thread(target=renew, name="job-lease", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_stage(queue, stage, next_stage, handler, worker, stop=None):
+    """
+    Worker loop for one stage: claim a job, run `handler(job)` → dict of columns
+    to store, and move the job on to `next_stage`. Exceptions are retried,
+    JobFailed fails the job at once. Runs until `stop` (an Event) is set.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        job = queue.claim(stage, worker)
+        if job is None:
+            stop.wait(JOB_POLL_S)
+            continue
+        start = time.perf_counter()
+        try:
+            with _renewing(queue, job):
+                columns = handler(job)
+        except JobFailed as e:
+            print(f"❌ {stage.upper()} failed job {job['id']}: {e}")
+            queue.fail(job, str(e))
+        except Exception as e:
+            print(f"⚠️ {stage.upper()} error on job {job['id']} (attempt {job['attempts']}): {e}")
+            queue.retry(job, f"{type(e).__name__}: {e}")
+        else:
+            queue.advance(job, next_stage, time.perf_counter() - start, **columns)
+
+
+def deliver_webhooks(queue, worker, stop=None):
+    """Worker loop POSTing each finished job's state (GET /jobs/{id} body) to its webhook."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        job = queue.claim_notification(worker)
+        if job is None:
+            stop.wait(JOB_POLL_S)
+            continue
+        request = urllib.request.Request(job["webhook"], data=json.dumps(queue.get(job["id"])).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with _webhook_opener.open(request, timeout=WEBHOOK_TIMEOUT_S) as resp:
+                resp.read()
+        except Exception as e:
+            queue.notified(job, f"{type(e).__name__}: {e}")
+        else:
+            queue.notified(job)
+
+
+def ocr_blocks(raw):
+    """readtext(detail=1) output → blocks of text/conf/x/y, as the structuring step expects them."""
+    return [{"text": text, "conf": float(conf),
+             "x": float((bbox[0][0] + bbox[2][0]) / 2), "y": float((bbox[0][1] + bbox[2][1]) / 2)}
+            for bbox, text, conf in raw]
+
+
+def ocr_worker(db_path, worker, threads=1, stop=None, **reader_kwargs):
+    """One OCR worker process: a warm Reader running the "ocr" stage of queued jobs."""
+    import torch
+    import easyocr
+    from easyocr.utils import decode_image
+    torch.set_num_threads(threads)
+    reader = easyocr.Reader(["en"], gpu=False, verbose=False, **reader_kwargs)
+    queue = JobQueue(db_path)
+
+    def ocr(job):
+        try:
+            image = decode_image(job["image"])
+        except ValueError as e:
+            raise JobFailed(str(e))
+        return {"image": None, "blocks": json.dumps(ocr_blocks(reader.readtext(image)), ensure_ascii=False)}
+
+    print(f"🟢 OCR worker {worker} ready")
+    run_stage(queue, "ocr", "structure", ocr, worker, stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR worker process for the /jobs queue")
+    parser.add_argument("--db", default=JOB_DB_PATH, help="job queue SQLite file")
+    parser.add_argument("--id", default=f"ocr-{socket.gethostname()}-{os.getpid()}", help="worker name")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx"])
+    parser.add_argument("--cache", default="", help="OCR result cache path (empty: none)")
+    args = parser.parse_args()
+    ocr_worker(args.db, args.id, args.threads, backend=args.backend, cache=args.cache or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+import json
+import math
+import time
+import sqlite3
+import threading
+
+import cv2
+import numpy as np
+
+from easyocr.utils import decode_image
+from field_extractor import locate_fields, match_labels
+
+# ——— CONFIG ———
+LAYOUT_DB_PATH     = "layouts.sqlite"   # "" keeps templates in memory only
+LAYOUT_MIN_SAMPLES = 3      # full-page scans of a layout before its template is used
+MIN_ANCHORS        = 4      # labels a scan must show to start / join a template
+MAX_CANDIDATES     = 20     # unconfirmed templates kept, least recently seen dropped first
+ALIGN_WIDTH        = 1000   # scans and template references are matched at this width
+SEARCH_RADIUS      = 0.04   # anchor search window around its expected spot, as a share of the width
+MIN_PATCH_SCORE    = 0.6    # normalized correlation for an anchor label to count as found
+ALIGN_TOL          = 4.0    # px (at ALIGN_WIDTH): anchors further off the fitted transform are outliers
+ALIGN_ZOOMS        = (1., 0.93, 1.07)  # scan scales tried in turn while looking for the anchors
+MAX_SCALE_DIFF     = 0.15   # scans whose content is scaled more than this against the template don't match
+ANCHOR_TOL         = 0.5    # max median anchor offset after alignment, in label heights
+REGION_MARGIN      = 0.25   # padding around cached regions, in box heights
+MAX_SKEW_DEG       = 1.0    # above this, regions are cropped as rotated quads (free_list)
+ANCHOR_MATCH_SHARE = 0.75   # share of anchors that must read as their label to trust a match
+# —————————————————
+
+
+def _prepare(grey):
+    """Grey scan resized to ALIGN_WIDTH, plus the scale factor applied."""
+    scale = ALIGN_WIDTH / float(grey.shape[1])
+    interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(grey, (ALIGN_WIDTH, max(1, int(round(grey.shape[0] * scale)))), interpolation=interp), scale
+
+
+def _page_shift(reference, scan):
+    """Coarse (dx, dy) of the scan against the reference, by phase correlation at 1/4 resolution."""
+    ref = cv2.resize(reference, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+    cur = cv2.resize(scan, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+    h, w = min(ref.shape[0], cur.shape[0]), min(ref.shape[1], cur.shape[1])
+    # ink, not paper: the mostly-white background would otherwise dominate the correlation
+    (dx, dy), _ = cv2.phaseCorrelate(255. - ref[:h, :w].astype(np.float32), 255. - cur[:h, :w].astype(np.float32),
+                                     cv2.createHanningWindow((w, h), cv2.CV_32F))
+    return 4 * dx, 4 * dy
+
+
+def _find_anchors(template, scan):
+    """Similarity transform fitted to the anchor labels found on `scan`, and how many agree with it."""
+    dx, dy = _page_shift(template.reference, scan)
+    radius = int(SEARCH_RADIUS * ALIGN_WIDTH)
+    src, dst = [], []
+    for (x0, y0), patch in template.patches:
+        h, w = patch.shape
+        wx, wy = max(0, int(round(x0 + dx)) - radius), max(0, int(round(y0 + dy)) - radius)
+        window = scan[wy:wy + h + 2 * radius, wx:wx + w + 2 * radius]
+        if window.shape[0] < h or window.shape[1] < w:
+            continue
+        _, score, _, (px, py) = cv2.minMaxLoc(cv2.matchTemplate(window, patch, cv2.TM_CCOEFF_NORMED))
+        if score >= MIN_PATCH_SCORE:
+            src.append((x0 + w / 2., y0 + h / 2.))
+            dst.append((wx + px + w / 2., wy + py + h / 2.))
+    if len(src) < MIN_ANCHORS:
+        return None, len(src)
+    A, inliers = cv2.estimateAffinePartial2D(np.float32(src), np.float32(dst), method=cv2.RANSAC,
+                                             ransacReprojThreshold=ALIGN_TOL)
+    n = 0 if A is None else int(inliers.sum())
+    return (A, n) if n >= MIN_ANCHORS else (None, n)
+
+
+def _align(template, scan):
+    """
+    Similarity transform (2x3) from the template's reference frame onto the scan (both
+    ALIGN_WIDTH wide). Anchor labels are looked up by template matching near where they
+    are expected, first at the scan's own scale, then slightly zoomed out and in.
+    """
+    for zoom in ALIGN_ZOOMS:
+        view = scan if zoom == 1 else cv2.resize(scan, None, fx=zoom, fy=zoom, interpolation=cv2.INTER_LINEAR)
+        A, n = _find_anchors(template, view)
+        if A is not None:
+            A = A / zoom
+            if abs(math.hypot(A[0, 0], A[1, 0]) - 1) <= MAX_SCALE_DIFF:
+                return A, n
+    return None, 0
+
+
+def _corners(box, pad=0.):
+    x0, y0, x1, y1 = box
+    return np.float32([[x0 - pad, y0 - pad], [x1 + pad, y0 - pad], [x1 + pad, y1 + pad], [x0 - pad, y1 + pad]])
+
+
+def _map_box(box, A):
+    """Axis-aligned bounds of `box` ([x0, y0, x1, y1]) after the affine transform A."""
+    quad = cv2.transform(_corners(box)[None], A)[0]
+    return [float(v) for v in (*quad.min(axis=0), *quad.max(axis=0))]
+
+
+def _result_key(bbox):
+    return tuple(int(v) for point in bbox for v in point)
+
+
+class LayoutMatch:
+    """
+    A confirmed template aligned onto one scan: the cached anchor and value
+    regions as Reader.recognize inputs (`horizontal_list` / `free_list`).
+    """
+
+    def __init__(self, template_id, regions, rotated):
+        self.template_id = template_id
+        self.horizontal_list, self.free_list = [], []
+        self._regions = {}
+        for label, is_anchor, box in regions:
+            if rotated:
+                self.free_list.append(box)
+                key = _result_key(box)
+            else:
+                self.horizontal_list.append(box)
+                x_min, x_max, y_min, y_max = box
+                key = (x_min, y_min, x_max, y_min, x_max, y_max, x_min, y_max)
+            self._regions[key] = (label, is_anchor)
+
+    def accept(self, result):
+        """
+        The recognize() output for these regions as readtext-style blocks, or None
+        when too few anchors read as their label (a different or damaged layout).
+        """
+        anchors = sum(is_anchor for _, is_anchor in self._regions.values())
+        hits = 0
+        for bbox, text, _ in result:
+            label, is_anchor = self._regions.get(_result_key(bbox), (None, False))
+            if is_anchor and match_labels([{"text": text}], [label]):
+                hits += 1
+        if not anchors or hits < ANCHOR_MATCH_SHARE * anchors:
+            return None
+        blocks = [r for r in result if r[1].strip()]   # empty value regions: nothing printed there
+        return sorted(blocks, key=lambda r: (r[0][0][1], r[0][0][0]))
+
+
+class _Template:
+    """One layout in its reference scan's frame (ALIGN_WIDTH wide), with the reference's anchor features."""
+
+    def __init__(self, template_id, reference, layout, updated=None):
+        self.id = template_id
+        self.reference = reference
+        self.layout = layout
+        self.updated = updated or time.time()
+        # the labels look the same on every scan: they are what a new scan is aligned by
+        self.patches = []
+        for box in layout["anchors"].values():
+            x0, y0, x1, y1 = (int(round(v)) for v in box)
+            pad = int(REGION_MARGIN * (y1 - y0))
+            x0, y0 = max(0, x0 - pad), max(0, y0 - pad)
+            patch = reference[y0:y1 + pad, x0:x1 + pad]
+            if patch.size and patch.std() > 0:
+                self.patches.append(((x0, y0), patch))
+
+    @property
+    def samples(self):
+        return self.layout["samples"]
+
+    def fits(self, anchors):
+        """Do these anchors (already in this template's frame) sit where the template's do?"""
+        shared = [lab for lab in anchors if lab in self.layout["anchors"]]
+        if len(shared) < MIN_ANCHORS:
+            return False
+        offsets, heights = [], []
+        for lab in shared:
+            a, b = np.float32(anchors[lab]), np.float32(self.layout["anchors"][lab])
+            offsets.append(np.linalg.norm((a[:2] + a[2:]) / 2 - (b[:2] + b[2:]) / 2))
+            heights.append(b[3] - b[1])
+        return np.median(offsets) <= ANCHOR_TOL * np.median(heights)
+
+    def add(self, anchors, values):
+        layout = self.layout
+        layout["samples"] += 1
+        for lab, box in anchors.items():
+            layout["anchors"].setdefault(lab, box)
+        for lab, box in values.items():
+            old = layout["values"].get(lab)
+            layout["values"][lab] = box if old is None else \
+                [min(old[0], box[0]), min(old[1], box[1]), max(old[2], box[2]), max(old[3], box[3])]
+            layout["value_counts"][lab] = layout["value_counts"].get(lab, 0) + 1
+        self.updated = time.time()
+
+    def regions(self):
+        """[(label, is_anchor, [x0, y0, x1, y1])] in the reference frame."""
+        layout = self.layout
+        boxes = [(lab, True, box) for lab, box in layout["anchors"].items()]
+        boxes += [(lab, False, box) for lab, box in layout["values"].items()
+                  if 2 * layout["value_counts"][lab] >= layout["samples"]]
+        right_edge = max(box[2] for _, _, box in boxes)
+        regions = []
+        for lab, is_anchor, (x0, y0, x1, y1) in boxes:
+            if not is_anchor:
+                # room for values longer than any seen so far: up to the next region on the row
+                nxt = [b[0] for _, _, b in boxes if b[0] > x1 and b[1] < y1 and b[3] > y0]
+                x1 = max(x1, min(nxt) - 2 * REGION_MARGIN * (y1 - y0) if nxt else right_edge)
+            regions.append((lab, is_anchor, [x0, y0, x1, y1]))
+        return regions
+
+
+class LayoutRegistry:
+    """
+    Learned layout templates for region-of-interest OCR.
+
+    Every full-page readtext result is passed to `observe`. Scans whose field
+    labels (anchors) line up after alignment are merged into one template,
+    which records the anchor boxes and the union of each field's value boxes in
+    its reference frame. After `min_samples` scans the template is confirmed.
+    `locate` then finds the anchor labels on a new scan by template matching,
+    fits the scan's transform from them and maps the cached regions onto it,
+    so only Reader.recognize runs: no CRAFT detection.
+    Matches whose anchors do not read back as their labels are rejected.
+    """
+
+    def __init__(self, labels, path=LAYOUT_DB_PATH, min_samples=LAYOUT_MIN_SAMPLES):
+        self.labels = list(labels)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+        self.templates = {}
+        self._next_id = 1
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS layouts ("
+                              "id INTEGER PRIMARY KEY, reference BLOB NOT NULL, "
+                              "layout TEXT NOT NULL, updated REAL NOT NULL)")
+            for tid, reference, layout, updated in self.conn.execute("SELECT * FROM layouts"):
+                reference = cv2.imdecode(np.frombuffer(reference, np.uint8), cv2.IMREAD_GRAYSCALE)
+                self.templates[tid] = _Template(tid, reference, json.loads(layout), updated)
+            self._next_id = max(self.templates, default=0) + 1
+
+    def _save(self, template):
+        if self.conn is not None:
+            png = cv2.imencode(".png", template.reference)[1].tobytes()
+            self.conn.execute("INSERT OR REPLACE INTO layouts VALUES (?,?,?,?)",
+                              (template.id, png, json.dumps(template.layout), template.updated))
+
+    def _drop(self, template_id):
+        del self.templates[template_id]
+        if self.conn is not None:
+            self.conn.execute("DELETE FROM layouts WHERE id=?", (template_id,))
+
+    def _best(self, scan, templates):
+        best, best_A, best_n = None, None, 0
+        for template in templates:
+            A, n = _align(template, scan)
+            if A is not None and n > best_n:
+                best, best_A, best_n = template, A, n
+        return best, best_A
+
+    def observe(self, grey, raw):
+        """
+        Learn from a full-page readtext(detail=1) result of the grey scan.
+        Returns the id of the template it was added to (or started), None
+        when the scan shows too few labels to be a template.
+        """
+        blocks = [{"text": text, "conf": float(conf),
+                   "x": float((bbox[0][0] + bbox[2][0]) / 2), "y": float((bbox[0][1] + bbox[2][1]) / 2)}
+                  for bbox, text, conf in raw]
+        found = match_labels(blocks, self.labels)
+        if len(found) < MIN_ANCHORS:
+            return None
+        small, scale = _prepare(grey)
+        boxes = [[float(v) * scale for v in (*np.min(bbox, axis=0), *np.max(bbox, axis=0))] for bbox, _, _ in raw]
+        anchors = {lab: boxes[i] for lab, (i, _, _) in found.items()}
+        values = {lab: boxes[j] for lab, (_, _, _, j) in locate_fields(blocks, self.labels).items() if j is not None}
+
+        # align outside the lock: it is the slow part and must not serialize uploads.
+        # Templates started meanwhile by other uploads get a look before a new one is started.
+        seen, template = set(), None
+        while True:
+            with self.lock:
+                fresh = [t for t in self.templates.values() if t.id not in seen]
+                if template is not None or not fresh:
+                    if template is not None and (template.id not in self.templates or not template.fits(frame_anchors)):
+                        template = None
+                    if template is None:
+                        frame_anchors, frame_values = anchors, values
+                        layout = {"samples": 0, "anchors": {}, "values": {}, "value_counts": {}}
+                        template = _Template(self._next_id, small, dict(layout, anchors=anchors))
+                        self._next_id += 1
+                        self.templates[template.id] = template
+                        candidates = sorted((t for t in self.templates.values() if t.samples < self.min_samples),
+                                            key=lambda t: t.updated)
+                        for old in candidates[:max(0, len(candidates) - MAX_CANDIDATES)]:
+                            self._drop(old.id)
+                    template.add(frame_anchors, frame_values)
+                    self._save(template)
+                    return template.id
+            seen.update(t.id for t in fresh)
+            template, A = self._best(small, fresh)
+            if template is not None:
+                # into the template's frame
+                A_inv = cv2.invertAffineTransform(A)
+                frame_anchors = {lab: _map_box(box, A_inv) for lab, box in anchors.items()}
+                frame_values = {lab: _map_box(box, A_inv) for lab, box in values.items()}
+
+    def locate(self, grey):
+        """LayoutMatch of the best-aligned confirmed template on this grey scan, or None."""
+        small, scale = _prepare(grey)
+        with self.lock:
+            confirmed = [t for t in self.templates.values() if t.samples >= self.min_samples]
+        if not confirmed:
+            return None
+        template, A = self._best(small, confirmed)
+        if template is None:
+            return None
+
+        with self.lock:   # observe may be adding to the template
+            template_regions = template.regions()
+        A = A / scale   # reference frame -> full-resolution scan
+        rotated = abs(math.degrees(math.atan2(A[1, 0], A[0, 0]))) > MAX_SKEW_DEG
+        height, width = grey.shape[:2]
+        regions = []
+        for label, is_anchor, box in template_regions:
+            quad = cv2.transform(_corners(box, REGION_MARGIN * (box[3] - box[1]))[None], A)[0]
+            if rotated:
+                regions.append((label, is_anchor, np.round(quad).astype(int).tolist()))
+                continue
+            x_min, y_min = (max(0, int(math.floor(v))) for v in quad.min(axis=0))
+            x_max, y_max = int(math.ceil(min(quad[:, 0].max(), width))), int(math.ceil(min(quad[:, 1].max(), height)))
+            if x_max > x_min and y_max > y_min:
+                regions.append((label, is_anchor, [x_min, x_max, y_min, y_max]))
+        return LayoutMatch(template.id, regions, rotated) if regions else None
+
+    def readtext(self, reader, image, **kwargs):
+        """
+        Template-region OCR of `image` with `reader` (usable as a ReaderPool
+        method). None when no confirmed template fits: run a full-page readtext
+        and pass its result to `observe` instead.
+        """
+        grey = decode_image(image).grey
+        match = self.locate(grey)
+        if match is None:
+            return None
+        result = reader.recognize(grey, match.horizontal_list, match.free_list, reformat=False, **kwargs)
+        return match.accept(result)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import functools
+from concurrent.futures import Future
+
+# ——— CONFIG ———
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite")   # "" disables the on-disk cache
+COORD_ROUND    = 5      # px grid that x/y are snapped to before hashing
+# —————————————————
+
+
+def canonical_blocks(blocks, coord_round=COORD_ROUND):
+    """
+    Rounded, sorted copy of an OCR block list, so rescans that differ only by
+    a pixel or two of jitter (or by block order) produce the same cache key.
+    """
+    canon = []
+    for b in blocks:
+        canon.append({
+            "text": b["text"],
+            "conf": round(float(b["conf"]), 2),
+            "x": int(round(float(b["x"]) / coord_round) * coord_round),
+            "y": int(round(float(b["y"]) / coord_round) * coord_round),
+        })
+    return sorted(canon, key=lambda b: (b["y"], b["x"], b["text"]))
+
+
+class LLMCache:
+    """SQLite store of structured LLM answers plus in-flight request deduplication."""
+
+    def __init__(self, path=LLM_CACHE_PATH):
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS llm_cache ("
+                              "key TEXT PRIMARY KEY, prompt TEXT NOT NULL, "
+                              "value TEXT NOT NULL, created REAL NOT NULL)")
+
+    @staticmethod
+    def make_key(prompt_id, version, blocks):
+        payload = json.dumps([prompt_id, version, canonical_blocks(blocks)],
+                             ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key):
+        # caller holds self.lock
+        if self.conn is None:
+            return None
+        row = self.conn.execute("SELECT value FROM llm_cache WHERE key=?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, key):
+        if self.conn is None:
+            return None
+        with self.lock:
+            return self._lookup(key)
+
+    def put(self, key, prompt_id, value):
+        if self.conn is None:
+            return
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?,?,?,?)",
+                              (key, prompt_id, json.dumps(value, ensure_ascii=False), time.time()))
+
+    def call(self, prompt_id, version, blocks, fn):
+        """
+        Return the cached answer for `blocks`, or run `fn(blocks)` once.
+        Concurrent callers with the same key wait on the first caller's result
+        instead of sending their own upstream request.
+        """
+        key = self.make_key(prompt_id, version, blocks)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        with self.lock:
+            # an owner may have stored its answer and left between the miss above and here
+            cached = self._lookup(key)
+            future = self.inflight.get(key)
+            owner = cached is None and future is None
+            if owner:
+                future = self.inflight[key] = Future()
+        if cached is not None:
+            return cached
+        if not owner:
+            return future.result()
+
+        try:
+            value = fn(blocks)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(key, prompt_id, value)
+            future.set_result(value)
+            return value
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+    return _default_cache
+
+
+def cached_structuring(prompt_id, version):
+    """
+    Decorator for `fn(blocks) -> dict` LLM calls. Bump `version` whenever the
+    prompt template changes so old answers are not reused.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def wrapper(blocks):
+            return default_cache().call(prompt_id, version, blocks, fn)
+        wrapper.uncached = fn
+        return wrapper
+    return wrap
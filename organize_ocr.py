@@ -7,6 +7,8 @@ import openai
 
 from pathlib import Path
 from json import JSONDecodeError
+from llm_cache import cached_structuring
+from block_encoding import BLOCK_FORMAT, encode_blocks, token_report
 
 # ——— CONFIG ———
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -23,6 +25,7 @@ except Exception as e:
     sys.exit(1)
 
 OUTPUT_CSV = "structured_output.csv"
+LLM_PROMPT_VERSION = 2   # bump whenever the structuring prompt below changes
 # —————————————————
 
 def load_raw_blocks(csv_path: Path):
@@ -39,21 +42,24 @@ def load_raw_blocks(csv_path: Path):
             })
     return blocks
 
+@cached_structuring("organize_ocr.structure_with_llm", LLM_PROMPT_VERSION)
 def structure_with_llm(blocks):
     """
     Ask GPT-4 to extract and organize all relevant fields
     from the raw OCR blocks, returning a flat JSON object.
     """
+    report = token_report(blocks)
+    print(f"🔢 LLM blocks: {report['json_tokens']} → {report['compact_tokens']} tokens")
     prompt = f"""
-You are given a list of OCR text blocks from a receipt.  
-Each block is a JSON object with keys: text, conf, x, y.
+You are given the OCR text blocks from a receipt.
+{BLOCK_FORMAT}
 
 From these blocks, extract every meaningful field (e.g. Date, Total, Item, Price, Tax, Merchant, etc.)
 and organize them into a single JSON object mapping field names to their values.
 Return **only** valid JSON—no extra commentary.
 
 OCR blocks:
-{json.dumps(blocks, indent=2)}
+{encode_blocks(blocks)}
 """
     resp = openai.chat.completions.create(
         model="gpt-4",
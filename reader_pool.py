@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import os
+import asyncio
+import threading
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import easyocr
+from easyocr.utils import decode_image
+from recognition_batcher import RECOGNIZE_KWARGS
+
+# readtext options the detect → batcher path implements; calls with any other
+# option (detail, paragraph, batch_size, ...) run readtext unbatched instead
+DETECT_KWARGS = {"min_size", "text_threshold", "low_text", "link_threshold", "canvas_size", "mag_ratio",
+                 "slope_ths", "ycenter_ths", "height_ths", "width_ths", "add_margin", "threshold",
+                 "bbox_min_score", "bbox_min_size", "max_candidates", "tile_height", "tile_overlap",
+                 "tile_batch_size", "target_text_height"}
+BATCHED_KWARGS = DETECT_KWARGS | RECOGNIZE_KWARGS
+
+
+class PoolFullError(RuntimeError):
+    """Raised when every Reader is busy and the wait queue is full."""
+
+
+class ReaderPool:
+    """
+    A fixed set of warm easyocr.Reader instances shared by all requests.
+
+    Each Reader lives on its own worker thread slot, so N requests can run
+    detection + recognition at once instead of queuing behind one Reader.
+    At most `size + max_queue` calls are admitted; anything beyond that is
+    rejected immediately with PoolFullError so callers can answer 429.
+
+    If a RecognitionBatcher is given, pool Readers only run detection and
+    the crops of concurrent requests are recognized together by the batcher
+    (areadtext calls whose options the batcher can't honour stay unbatched).
+    A `cache` (OCRCache) is handed to every Reader and also consulted on the
+    batched path, so repeated uploads skip detection and recognition.
+    """
+
+    def __init__(self, lang_list=("en",), size=None, max_queue=None, gpu=False, batcher=None,
+                 **reader_kwargs):
+        self.size = size or os.cpu_count() or 1
+        self.max_queue = self.size * 2 if max_queue is None else max_queue
+        self.batcher = batcher
+        self.cache = reader_kwargs.get("cache")
+
+        # split the cores between readers so torch / onnxruntime threads don't oversubscribe
+        threads = max(1, (os.cpu_count() or 1) // self.size)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        if reader_kwargs.get("backend") == "onnx":
+            reader_kwargs.setdefault("onnx_intra_op_threads", threads)
+
+        self._readers = Queue()
+        for _ in range(self.size):
+            self._readers.put(easyocr.Reader(list(lang_list), gpu=gpu, **reader_kwargs))
+
+        self._slots = threading.BoundedSemaphore(self.size + self.max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="ocr")
+
+    def _call(self, method, args, kwargs):
+        reader = self._readers.get()
+        try:
+            if callable(method):
+                return method(reader, *args, **kwargs)
+            return getattr(reader, method)(*args, **kwargs)
+        finally:
+            self._readers.put(reader)
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            raise PoolFullError(f"OCR pool busy ({self.size} running, {self.max_queue} queued)")
+
+    def run(self, method, *args, **kwargs):
+        """Blocking call of `Reader.<method>` on the next free Reader."""
+        self._acquire()
+        try:
+            return self._call(method, args, kwargs)
+        finally:
+            self._slots.release()
+
+    async def arun(self, method, *args, **kwargs):
+        """Await `Reader.<method>` on a pool thread without blocking the event loop."""
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._call, method, args, kwargs)
+        finally:
+            self._slots.release()
+
+    def readtext(self, image, **kwargs):
+        return self.run("readtext", image, **kwargs)
+
+    async def areadtext(self, image, **kwargs):
+        if self.batcher is None or not kwargs.keys() <= BATCHED_KWARGS:
+            return await self.arun("readtext", image, **kwargs)
+
+        # detect + crop on a pool Reader, then recognize together with other requests
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            future = await loop.run_in_executor(self._executor, self._call,
+                                                self._detect_and_submit, (image,), kwargs)
+            return await asyncio.wrap_future(future)
+        finally:
+            self._slots.release()
+
+    def _detect_and_submit(self, reader, image, **kwargs):
+        image = decode_image(image)
+        img = image.color
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(img, dict(kwargs, batched=True), reader.model_md5s,
+                                            reader.cache_settings)
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+
+        horizontal_list, free_list = reader.detect(img, reformat=False,
+                                                   **{k: v for k, v in kwargs.items() if k in DETECT_KWARGS})
+        future = self.batcher.submit(image.grey, horizontal_list[0], free_list[0],
+                                     **{k: v for k, v in kwargs.items() if k in RECOGNIZE_KWARGS})
+
+        if cache_key is not None:
+            def store(done):
+                if done.exception() is None:
+                    self.cache.put(cache_key, done.result())
+            future.add_done_callback(store)
+        return future
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        if self.batcher is not None:
+            self.batcher.close()
+
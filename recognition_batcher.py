@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import threading
+from queue import Queue, Empty
+from concurrent.futures import Future
+
+from easyocr import easyocr as easyocr_core
+from easyocr.utils import get_image_list
+from easyocr.recognition import get_text
+
+# the readtext recognition options submit() implements
+RECOGNIZE_KWARGS = {"allowlist", "blocklist", "decoder", "beamWidth", "contrast_ths", "adjust_contrast", "filter_ths"}
+
+
+class _Job:
+    __slots__ = ("key", "image_list", "max_width", "future")
+
+    def __init__(self, key, image_list, max_width):
+        self.key = key
+        self.image_list = image_list
+        self.max_width = max_width
+        self.future = Future()
+
+
+class RecognitionBatcher:
+    """
+    Cross-request dynamic micro-batching for the recognizer.
+
+    Callers hand over a grey image plus the boxes found by `Reader.detect`.
+    A single scheduler thread waits up to `max_wait_ms` after the first
+    pending job for others to arrive, merges every crop that shares the same
+    decoding parameters into one batch (up to `max_batch` crops), runs one
+    width-bucketed recognizer pass over it and scatters the (bbox, text, conf) results back
+    to each caller's Future.
+    """
+
+    def __init__(self, reader, max_batch=64, max_wait_ms=10):
+        self.reader = reader
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="ocr-batcher", daemon=True)
+        self._thread.start()
+
+    def _ignore_char(self, allowlist, blocklist):
+        character = self.reader.character
+        if allowlist:
+            return ''.join(set(character) - set(allowlist))
+        if blocklist:
+            return ''.join(set(blocklist))
+        return ''.join(set(character) - set(self.reader.lang_char))
+
+    def submit(self, img_cv_grey, horizontal_list, free_list, allowlist=None, blocklist=None,
+               decoder='greedy', beamWidth=5, contrast_ths=0.1, adjust_contrast=0.5, filter_ths=0.003):
+        """
+        Queue one image's boxes for recognition; returns a concurrent Future.
+        Only the RECOGNIZE_KWARGS options are supported, anything else is a TypeError.
+        """
+        if self.reader.model_lang in ['chinese_tra', 'chinese_sim']:
+            decoder = 'greedy'
+        key = (self._ignore_char(allowlist, blocklist), decoder, beamWidth,
+               contrast_ths, adjust_contrast, filter_ths)
+        image_list, max_width = get_image_list(horizontal_list, free_list, img_cv_grey,
+                                               model_height=easyocr_core.imgH)
+        job = _Job(key, image_list, max_width)
+        if not image_list:
+            job.future.set_result([])
+        elif self._closed:
+            job.future.set_exception(RuntimeError("RecognitionBatcher is closed"))
+        else:
+            self._pending.put(job)
+        return job.future
+
+    def recognize(self, img_cv_grey, horizontal_list, free_list, **kwargs):
+        return self.submit(img_cv_grey, horizontal_list, free_list, **kwargs).result()
+
+    async def arecognize(self, img_cv_grey, horizontal_list, free_list, **kwargs):
+        return await asyncio.wrap_future(self.submit(img_cv_grey, horizontal_list, free_list, **kwargs))
+
+    def close(self):
+        self._closed = True
+        self._pending.put(None)
+        self._thread.join()
+
+    def _collect(self, jobs):
+        """Add the jobs that arrive within the wait window to `jobs`, up to max_batch crops."""
+        n_crops = sum(len(job.image_list) for job in jobs)
+        deadline = time.monotonic() + self.max_wait
+        while n_crops < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._pending.get(timeout=timeout)
+            except Empty:
+                break
+            if job is None:
+                self._pending.put(None)
+                break
+            jobs.append(job)
+            n_crops += len(job.image_list)
+
+    def _loop(self):
+        while True:
+            first = self._pending.get()
+            if first is None:
+                return
+            # never let an error escape: with the scheduler thread gone every later submit would hang
+            jobs = [first]
+            try:
+                self._collect(jobs)
+                groups = {}
+                for job in jobs:
+                    groups.setdefault(job.key, []).append(job)
+            except Exception as e:
+                self._fail(jobs, e)
+                continue
+            for key, group in groups.items():
+                try:
+                    self._run_group(key, group)
+                except Exception as e:
+                    self._fail(group, e)
+
+    @staticmethod
+    def _fail(jobs, error):
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(error)
+
+    def _run_group(self, key, jobs):
+        ignore_char, decoder, beamWidth, contrast_ths, adjust_contrast, filter_ths = key
+        image_list = [item for job in jobs for item in job.image_list]
+        max_width = max(job.max_width for job in jobs)
+        result = get_text(self.reader.character, easyocr_core.imgH, int(max_width), self.reader.recognizer,
+                          self.reader.converter, image_list, ignore_char, decoder, beamWidth,
+                          len(image_list), contrast_ths, adjust_contrast, filter_ths,
+                          0, self.reader.device, width_bucketing=True)
+
+        if self.reader.model_lang == 'arabic':
+            from bidi import get_display # only Arabic output needs bidi reordering
+            result = [(box, get_display(text), conf) for box, text, conf in result]
+
+        start = 0
+        for job in jobs:
+            end = start + len(job.image_list)
+            job.future.set_result(result[start:end])
+            start = end
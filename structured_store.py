@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import os
+import re
+import csv
+import json
+import time
+import threading
+from pathlib import Path
+from collections import Counter
+from difflib import SequenceMatcher
+
+# ——— CONFIG ———
+KEY_FIELDS      = ("Order ID", "Order Reference", "Truck ID")   # columns a barcode can match
+NGRAM           = 3       # n-gram size of the fuzzy index
+FUZZY_CANDIDATES = 20     # values reranked with SequenceMatcher after the n-gram vote
+FUZZY_MIN_SCORE = 0.5     # below this a fuzzy candidate is not a match
+COMMON_NGRAM_SHARE = 0.05  # n-grams in more than this share of values don't vote
+RELOAD_CHECK_S  = 1.0     # how often (at most) the source file's mtime is checked
+# —————————————————
+
+
+def normalize(value):
+    """Upper-case alphanumerics only, so "TRK 1285", "trk-1285" and "TRK1285" agree."""
+    return re.sub(r"[^0-9A-Z]", "", (value or "").upper())
+
+
+def ngrams(value, n=NGRAM):
+    padded = f"^{value}$"
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+def load_rows(path):
+    """
+    Rows from a structured CSV (one receipt per row) or JSONL, where each line
+    is either a flat {field: value} dict or a pipeline journal record
+    ({"filename", "pred": {...}}).
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".jsonl":
+        rows = []
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "pred" in rec:
+                    if "error" in rec:
+                        continue
+                    rec = dict(rec["pred"], source_file=rec.get("filename", ""))
+                rows.append({k: "" if v is None else str(v) for k, v in rec.items()})
+        return rows
+    with path.open(newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+class _Index:
+    """Immutable snapshot: rows + exact hash index + n-gram inverted index over key values."""
+
+    def __init__(self, rows, key_fields):
+        self.rows = rows
+        self.exact = {}       # normalized value → [(row, field)]
+        self.values = []      # distinct normalized key values
+        self.postings = {}    # n-gram → [value id]
+        value_ids = {}
+        for r, row in enumerate(rows):
+            for field in key_fields:
+                norm = normalize(row.get(field))
+                if not norm:
+                    continue
+                self.exact.setdefault(norm, []).append((r, field))
+                if norm not in value_ids:
+                    value_ids[norm] = len(self.values)
+                    self.values.append(norm)
+                    for g in ngrams(norm):
+                        self.postings.setdefault(g, []).append(value_ids[norm])
+
+
+class StructuredStore:
+    """
+    All processed receipts from a structured CSV/JSONL, indexed for barcode lookup.
+
+    `match(code)` first tries an exact hash lookup of the normalized code on
+    the key fields, then falls back to an n-gram vote over all key values and
+    reranks the best few with SequenceMatcher. The file is reloaded (and the
+    index rebuilt off to the side, then swapped in) when its mtime or size
+    changes.
+    """
+
+    def __init__(self, path, key_fields=KEY_FIELDS):
+        self.path = Path(path)
+        self.key_fields = tuple(key_fields)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked = 0.0
+        self._index = _Index([], self.key_fields)
+        self.reload()
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def reload(self):
+        stamp = self._file_stamp()
+        index = _Index(load_rows(self.path), self.key_fields)
+        with self._lock:
+            self._index, self._stamp = index, stamp
+        print(f"✅ Loaded {len(index.rows)} receipts from {self.path}")
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_CHECK_S:
+            return
+        self._checked = now
+        try:
+            changed = self._file_stamp() != self._stamp
+        except FileNotFoundError:
+            return    # keep serving the last good snapshot
+        if changed:
+            try:
+                self.reload()
+            except (OSError, csv.Error) as e:
+                print(f"⚠️  Reload of {self.path} failed, keeping previous data: {e}")
+
+    def __len__(self):
+        return len(self._index.rows)
+
+    def match(self, code):
+        """
+        Best receipt for a scanned code → (row, field, score, exact), or None.
+        """
+        self.maybe_reload()
+        index = self._index
+        norm = normalize(code)
+        if not norm:
+            return None
+
+        hits = index.exact.get(norm)
+        if hits:
+            r, field = hits[0]
+            return index.rows[r], field, 1.0, True
+
+        # n-grams shared by a large share of values (e.g. a common "TRK" prefix) barely
+        # discriminate and dominate the vote cost, so only the rarer ones vote
+        lists = sorted((index.postings.get(g, ()) for g in ngrams(norm)), key=len)
+        common = max(COMMON_NGRAM_SHARE * len(index.values), len(lists[0]))
+        votes = Counter()
+        for posting in lists:
+            if len(posting) > common:
+                break
+            votes.update(posting)
+        best, best_score = None, FUZZY_MIN_SCORE
+        for vid, _ in votes.most_common(FUZZY_CANDIDATES):
+            value = index.values[vid]
+            score = SequenceMatcher(None, value, norm).ratio()
+            if score >= best_score:
+                best, best_score = value, score
+        if best is None:
+            return None
+        r, field = index.exact[best][0]
+        return index.rows[r], field, best_score, False
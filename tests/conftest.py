@@ -0,0 +1,17 @@
+import os
+import sys
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)   # the service scripts (reader_pool.py, llm_cache.py, ...)
+
+try:
+    import easyocr
+except ImportError:
+    # not installed: import the library from this tree, where it lives in easyocr_src_backup/
+    package = os.path.join(ROOT, "easyocr_src_backup")
+    spec = importlib.util.spec_from_file_location("easyocr", os.path.join(package, "__init__.py"),
+                                                  submodule_search_locations=[package])
+    easyocr = importlib.util.module_from_spec(spec)
+    sys.modules["easyocr"] = easyocr
+    spec.loader.exec_module(easyocr)
@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+import pytest
+
+from easyocr import craft_utils
+from easyocr.easyocr import Reader
+from easyocr.detection import (choose_canvas_size, text_box_heights,
+                               AUTO_CANVAS_PROBE, AUTO_CANVAS_MAX)
+
+
+def probe_boxes(image_shape, word_heights, canvas=AUTO_CANVAS_PROBE):
+    """
+    Boxes (image coordinates, 8 values each) that get_textbox would return for
+    an image with one word per text height, from synthetic CRAFT score maps at
+    the probe canvas (the maps are half the canvas resolution).
+    """
+    ratio = canvas / float(max(image_shape[:2]))
+    map_h, map_w = int(image_shape[0] * ratio / 2), int(image_shape[1] * ratio / 2)
+    textmap = np.zeros((map_h, map_w), np.float32)
+    y = 4
+    for h in word_heights:
+        h_map = max(2, int(round(h * ratio / 2)))
+        textmap[y:y + h_map, 10:10 + 6 * h_map] = 0.9
+        y += h_map + 8
+    assert y < map_h
+    boxes, _, _ = craft_utils.getDetBoxes(textmap, np.zeros_like(textmap), 0.7, 0.4, 0.4)
+    boxes = craft_utils.adjustResultCoordinates(boxes, 1 / ratio, 1 / ratio)
+    return [np.array(box).astype(np.int32).reshape(-1) for box in boxes]
+
+
+def test_text_box_heights_of_rotated_boxes():
+    box = np.array([[0, 0], [100, 0], [100, 20], [0, 20]], np.float64)
+    angle = math.radians(30)
+    rot = np.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+    boxes = [box.reshape(-1), (box @ rot.T + 50).reshape(-1)]
+    assert np.allclose(text_box_heights(boxes), [20, 20])
+
+
+def test_uniform_text_is_scaled_to_the_target_height():
+    shape = (1200, 1600, 3)
+    boxes = probe_boxes(shape, [40] * 8)
+    assert len(boxes) == 8
+    heights = text_box_heights(boxes)
+    canvas = choose_canvas_size(boxes, shape, 16)
+    assert canvas % 32 == 0
+    assert canvas == int(math.ceil(1600 * 16 / np.percentile(heights, 20) / 32.)) * 32
+    # the detected boxes are dilated around the score blobs: text is never measured
+    # smaller than it is, so the canvas is at most the one the true height asks for
+    assert (heights >= 40).all()
+    assert canvas <= 1600 * 16 / 40
+
+
+def test_the_smaller_text_sets_the_canvas():
+    shape = (1200, 1600, 3)
+    big = choose_canvas_size(probe_boxes(shape, [80] * 8), shape, 16)
+    mixed = choose_canvas_size(probe_boxes(shape, [80] * 6 + [20] * 3), shape, 16)
+    # 3 of 9 words are small, so the 20th percentile height is a small word's
+    assert mixed > 2 * big
+    assert mixed == choose_canvas_size(probe_boxes(shape, [20] * 3), shape, 16)
+
+
+def test_canvas_limits():
+    shape = (1200, 1600, 3)
+    assert choose_canvas_size([], shape, 16) is None
+    assert choose_canvas_size(probe_boxes(shape, [12] * 4), shape, 64) == AUTO_CANVAS_MAX
+    assert choose_canvas_size(probe_boxes(shape, [12] * 4), shape, 64, max_size=1000) == 1000
+    huge = [np.array([0, 0, 1600, 0, 1600, 1200, 0, 1200])]
+    assert choose_canvas_size(huge, shape, 16) == 32
+
+
+class _ProbeReader(Reader):
+    """Just enough of a Reader to run _auto_canvas on precomputed probe boxes."""
+
+    def __init__(self, boxes):
+        self.detect_network = 'craft'
+        self.detector = None
+        self.probes = []
+        self._boxes = boxes
+
+    def get_textbox(self, detector, img, canvas_size, mag_ratio, **kwargs):
+        self.probes.append((canvas_size, mag_ratio))
+        return self._boxes
+
+
+def test_auto_canvas_keeps_the_probe_boxes_when_they_are_fine_enough():
+    shape = (1200, 1600, 3)
+    boxes = [probe_boxes(shape, [80] * 4)]
+    reader = _ProbeReader(boxes)
+    canvas, mag, kept = reader._auto_canvas(np.zeros(shape, np.uint8), {'mag_ratio': 1.}, 16)
+    assert (canvas, mag) == (AUTO_CANVAS_PROBE, 1.) and kept is boxes
+    assert reader.probes == [(AUTO_CANVAS_PROBE, 1.)]
+
+
+@pytest.mark.parametrize("mag_ratio, expected", [(1., 1600), (0.5, 800)])
+def test_auto_canvas_reruns_at_the_chosen_canvas(mag_ratio, expected):
+    shape = (1200, 1600, 3)
+    boxes = [probe_boxes(shape, [12] * 4)]
+    canvas, mag, kept = _ProbeReader(boxes)._auto_canvas(np.zeros(shape, np.uint8), {'mag_ratio': mag_ratio}, 16)
+    # small text wants more than the image has: never magnify past mag_ratio
+    assert (canvas, mag, kept) == (expected, expected / 1600., None)
+
+
+def test_auto_canvas_uses_the_finest_scale_of_a_batch():
+    small, large = (600, 800, 3), (1200, 1600, 3)
+    boxes = [probe_boxes(small, [60] * 4), probe_boxes(large, [20] * 4)]
+    wanted = [choose_canvas_size(b, s, 16, max_size=max(s[:2])) for b, s in zip(boxes, (small, large))]
+    images = [np.zeros(small, np.uint8), np.zeros(large, np.uint8)]
+    canvas, mag, kept = _ProbeReader(boxes)._auto_canvas(images, {'mag_ratio': 1.}, 16)
+    assert kept is None and canvas == max(wanted)
+    assert mag == max(wanted[0] / 800., wanted[1] / 1600.)
@@ -0,0 +1,29 @@
+import json
+
+from batch_pipeline import compact_journal, load_journal
+
+
+def _write(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+def test_compact_keeps_the_latest_record_of_the_current_file(tmp_path):
+    journal = tmp_path / "gt.jsonl"
+    _write(journal, [{"filename": "a.png", "sha1": "1", "pred": {"Total": "1"}},
+                     {"filename": "a.png", "sha1": "2", "pred": {"Total": "2"}},
+                     {"filename": "gone.png", "sha1": "9", "pred": {}}])
+    done = compact_journal(journal, {"a.png": "2"})
+    assert done == {"a.png": {"filename": "a.png", "sha1": "2", "pred": {"Total": "2"}}}
+    assert load_journal(journal) == done
+
+
+def test_compact_drops_records_of_a_changed_file(tmp_path):
+    # the image changed and its rerun failed: the old prediction must not be kept
+    journal = tmp_path / "gt.jsonl"
+    _write(journal, [{"filename": "a.png", "sha1": "old", "pred": {"Total": "1"}},
+                     {"filename": "b.png", "sha1": "b", "pred": {"Total": "3"}}])
+    done = compact_journal(journal, {"a.png": "new", "b.png": "b"})
+    assert list(done) == ["b.png"]
+    assert list(load_journal(journal)) == ["b.png"]
@@ -0,0 +1,26 @@
+from block_encoding import encode_blocks, paragraph_blocks
+
+
+def _box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def test_encode_blocks_groups_rows_and_drops_noise():
+    blocks = [{"text": "Total", "conf": 0.9, "x": 10.2, "y": 100.4},
+              {"text": "88.50", "conf": 0.8, "x": 200.0, "y": 102.0},
+              {"text": "Date", "conf": 0.95, "x": 12.0, "y": 50.0},
+              {"text": "~", "conf": 0.05, "x": 300.0, "y": 50.0},
+              {"text": "   ", "conf": 0.9, "x": 400.0, "y": 50.0}]
+    assert encode_blocks(blocks).splitlines() == ["50 | 12 Date (0.95)",
+                                                  "101 | 10 Total (0.90) | 200 88.50 (0.80)"]
+
+
+def test_paragraph_blocks_merges_words_on_one_line():
+    raw = [(_box(10, 10, 50, 30), "Order", 0.9),
+           (_box(58, 10, 80, 30), "ID", 0.7),
+           (_box(10, 100, 60, 120), "Total", 0.8)]
+    merged = sorted(paragraph_blocks(raw), key=lambda b: b["y"])
+    assert [b["text"] for b in merged] == ["Order ID", "Total"]
+    assert abs(merged[0]["conf"] - 0.8) < 1e-6
+    assert (merged[0]["x"], merged[0]["y"]) == (45.0, 20.0)
+    assert merged[1]["conf"] == 0.8
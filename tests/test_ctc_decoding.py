@@ -0,0 +1,153 @@
+import re
+import itertools
+
+import numpy as np
+import pytest
+
+from easyocr.utils import ctc_beam_search_batch
+from easyocr.lexicon import CharTrie, RegexDFA
+
+
+def random_mats(rng, batch, T, C, sharpness=3.0):
+    logits = rng.normal(size=(batch, T, C)) * sharpness
+    mats = np.exp(logits - logits.max(axis=2, keepdims=True))
+    return mats / mats.sum(axis=2, keepdims=True)
+
+
+def collapse(path):
+    labeling, prev = [], 0
+    for c in path:
+        if c != 0 and c != prev:
+            labeling.append(c)
+        prev = c
+    return tuple(labeling)
+
+
+def exhaustive(mat):
+    """Every alignment of a small matrix: {labeling: log probability}."""
+    T, C = mat.shape
+    probs = {}
+    for path in itertools.product(range(C), repeat=T):
+        labeling = collapse(path)
+        probs[labeling] = probs.get(labeling, 0.) + np.prod(mat[np.arange(T), path])
+    return {labeling: np.log(p) for labeling, p in probs.items()}
+
+
+def reference_prefix_search(mat, beamWidth):
+    """Textbook CTC prefix beam search: every character extends every beam."""
+    T, C = mat.shape
+    logp = np.log(mat)
+    beams = {(): (0., -np.inf)}   # labeling -> (log p ending in blank, log p ending in non-blank)
+    for t in range(T):
+        nxt = {}
+
+        def add(labeling, pb, pnb):
+            old_pb, old_pnb = nxt.get(labeling, (-np.inf, -np.inf))
+            nxt[labeling] = (np.logaddexp(old_pb, pb), np.logaddexp(old_pnb, pnb))
+
+        for labeling, (pb, pnb) in beams.items():
+            total = np.logaddexp(pb, pnb)
+            add(labeling, total + logp[t, 0], -np.inf)
+            if labeling:
+                add(labeling, -np.inf, pnb + logp[t, labeling[-1]])
+            for c in range(1, C):
+                if labeling and labeling[-1] == c:
+                    add(labeling + (c,), -np.inf, pb + logp[t, c])
+                else:
+                    add(labeling + (c,), -np.inf, total + logp[t, c])
+        ranked = sorted(nxt.items(), key=lambda item: -np.logaddexp(*item[1]))
+        beams = dict(ranked[:beamWidth])
+    return sorted(((labeling, np.logaddexp(pb, pnb)) for labeling, (pb, pnb) in beams.items()),
+                  key=lambda item: -item[1])
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_wide_beam_finds_most_probable_labeling(seed):
+    rng = np.random.default_rng(seed)
+    mats = random_mats(rng, 3, 6, 4)
+    for mat, beams in zip(mats, ctc_beam_search_batch(mats, beamWidth=500, n_best=5)):
+        exact = sorted(exhaustive(mat).items(), key=lambda item: -item[1])
+        assert [labeling for labeling, _ in beams] == [labeling for labeling, _ in exact[:5]]
+        np.testing.assert_allclose([score for _, score in beams], [score for _, score in exact[:5]], rtol=1e-9)
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("beamWidth", [1, 2, 3, 5])
+def test_matches_reference_prefix_search(seed, beamWidth):
+    # only the beamWidth + 1 best characters per frame are tried; the full search must agree
+    rng = np.random.default_rng(seed)
+    mats = random_mats(rng, 4, 12, 7, sharpness=rng.uniform(0.5, 4))
+    for mat, beams in zip(mats, ctc_beam_search_batch(mats, beamWidth=beamWidth, n_best=beamWidth)):
+        expected = reference_prefix_search(mat, beamWidth)
+        assert [labeling for labeling, _ in beams] == [labeling for labeling, _ in expected]
+        np.testing.assert_allclose([score for _, score in beams], [score for _, score in expected], rtol=1e-9)
+
+
+def test_ragged_batch_matches_single_items():
+    rng = np.random.default_rng(0)
+    mats = [random_mats(rng, 1, T, 6)[0] for T in (2, 3, 9, 20, 4)]
+    batched = ctc_beam_search_batch(mats, beamWidth=3, n_best=2)
+    for mat, beams in zip(mats, batched):
+        single = ctc_beam_search_batch(mat[None], beamWidth=3, n_best=2)[0]
+        assert [labeling for labeling, _ in beams] == [labeling for labeling, _ in single]
+        np.testing.assert_allclose([s for _, s in beams], [s for _, s in single], rtol=1e-9)
+
+
+CHARACTER = ['[blank]'] + list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-: ")
+INDEX = {c: i for i, c in enumerate(CHARACTER) if i > 0}
+
+
+def encode(text):
+    return tuple(INDEX[c] for c in text)
+
+
+def test_constrained_search_finds_best_accepted_word():
+    words = ["AB", "BA", "A", "ABA", "B0"]
+    trie = CharTrie.from_words(words, INDEX, len(CHARACTER))
+    rng = np.random.default_rng(1)
+    C = 1 + len(set("AB0"))
+    small = [0, INDEX["A"], INDEX["B"], INDEX["0"]]
+    for mat in random_mats(rng, 8, 5, C):
+        full = np.full((5, len(CHARACTER)), 1e-12)
+        full[:, small] = mat
+        full /= full.sum(axis=1, keepdims=True)
+        (labeling, score), = ctc_beam_search_batch(full[None], beamWidth=50, constraint=trie)[0][:1]
+        exact = exhaustive(mat)
+        remap = {encode(w): tuple(small.index(c) for c in encode(w)) for w in words}
+        best = max(words, key=lambda w: exact.get(remap[encode(w)], -np.inf))
+        assert labeling == encode(best)
+
+
+def test_char_trie_prefix_lookup():
+    words = ["WH-01", "WH-02", "WH-1", "DOCK", "D"]
+    trie = CharTrie.from_words(words + ["wh-x"], INDEX, len(CHARACTER))   # lowercase is out of set: skipped
+    prefixes = {w[:i] for w in words for i in range(1, len(w) + 1)}
+    for text in prefixes | {"W1", "WH-03", "DX", "X", "wh-x"}:
+        node = 0
+        for c in text:
+            node = int(trie.child(node, INDEX.get(c, 0)))
+        assert (node >= 0) == (text in prefixes), text
+        assert trie.contains(encode(text) if all(c in INDEX for c in text) else (0,)) == (text in words), text
+
+    # vectorized lookup agrees with walking the trie one pair at a time
+    nodes = np.arange(-1, len(trie))[:, None]
+    chars = np.arange(1, len(CHARACTER))[None, :]
+    table = trie.child(nodes, chars)
+    for i, n in enumerate(nodes[:, 0]):
+        for j, c in enumerate(chars[0]):
+            assert table[i, j] == (-1 if n < 0 else int(trie.child(int(n), int(c))))
+
+
+PATTERNS = [r"\d{1,2}:\d{2}(:\d{2})? ?[AF]M", r"WH-0[1-3]", r"(AB|BA)+", r"[A-F]*\d?", r"D(-\d+)*",
+            r"\d{3,}", r"(?:A|B)C?D{0,2}", r"\w-\w", r"0?1+|2", r".-."]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_regex_dfa_matches_re_fullmatch(pattern):
+    dfa = RegexDFA(pattern, CHARACTER)
+    alphabet = "0129ABCDFMWH-: "   # mostly characters the patterns use, so random strings match often enough
+    rng = np.random.default_rng(abs(hash(pattern)) % 2 ** 32)
+    samples = {"".join(rng.choice(list(alphabet), n)) for n in rng.integers(0, 9, 400)}
+    samples |= {"12:30 AM", "1:05:59FM", "WH-02", "WH-04", "ABAB", "ABBA", "", "ACDD", "D-1-22", "1234", "2", "0111"}
+    for text in samples:
+        assert dfa.contains(encode(text)) == bool(re.fullmatch(pattern, text)), (pattern, text)
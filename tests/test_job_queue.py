@@ -0,0 +1,210 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import job_queue
+from job_queue import JobQueue, JobFailed, run_stage, deliver_webhooks
+
+
+@pytest.fixture(autouse=True)
+def fast(monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_POLL_S", 0.01)
+    monkeypatch.setattr(job_queue, "JOB_RETRY_DELAY_S", 0.05)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "jobs.sqlite")
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def run_workers(queue, handlers):
+    """Start one run_stage thread per (stage, next_stage, handler); returns the stop Event."""
+    stop = threading.Event()
+    for i, (stage, next_stage, handler) in enumerate(handlers):
+        threading.Thread(target=run_stage, args=(queue, stage, next_stage, handler, f"w{i}", stop),
+                         daemon=True).start()
+    return stop
+
+
+def test_job_moves_through_the_stages(db):
+    queue = JobQueue(db)
+    job_id = queue.submit(b"img", "a.png")
+    assert queue.get(job_id)["status"] == "queued" and queue.pending() == 1
+
+    stop = run_workers(queue, [("ocr", "structure", lambda job: {"image": None, "blocks": "[]"}),
+                               ("structure", "done", lambda job: {"result": json.dumps({"Total": "1"})})])
+    try:
+        wait_for(lambda: queue.get(job_id)["status"] == "done")
+    finally:
+        stop.set()
+    job = queue.get(job_id)
+    assert job["result"] == {"Total": "1"} and job["error"] is None and job["attempts"] == 1
+    assert {"ocr_wait_s", "ocr_s", "structure_wait_s", "structure_s", "total_s"} <= set(job["timings"])
+    assert job["timings"]["ocr_attempts"] == job["timings"]["structure_attempts"] == 1
+    assert queue.pending() == 0
+
+
+def test_expired_lease_is_taken_over_and_the_old_worker_loses_the_job(db):
+    queue = JobQueue(db, visibility=0.05)
+    job_id = queue.submit(b"img")
+    first = queue.claim("ocr", "w1")
+    assert queue.claim("ocr", "w2") is None          # leased
+    time.sleep(0.08)                                 # w1 crashed or hung
+    second = queue.claim("ocr", "w2")
+    assert second["id"] == job_id and second["attempts"] == 2
+    assert not queue.advance(first, "structure", 1.0)
+    assert not queue.extend(first)
+    assert queue.advance(second, "structure", 1.0)
+    assert queue.get(job_id)["stage"] == "structure"
+
+
+def test_renewed_lease_is_not_taken_over(db):
+    queue = JobQueue(db, visibility=0.2)
+    queue.submit(b"img")
+    job = queue.claim("ocr", "w1")
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.extend(job)
+    assert queue.claim("ocr", "w2") is None
+
+
+def test_retries_back_off_then_fail(db):
+    queue = JobQueue(db, max_attempts=3)
+    job_id = queue.submit(b"img")
+    delays = []
+    for attempt in (1, 2):
+        job = queue.claim("ocr", "w1")
+        assert job["attempts"] == attempt
+        assert queue.retry(job, "boom")
+        retried = time.time()
+        assert queue.claim("ocr", "w1") is None      # backing off
+        wait_for(lambda: queue.get(job_id)["status"] == "queued" and
+                 queue.conn.execute("SELECT available_at FROM jobs").fetchone()[0] <= time.time())
+        delays.append(queue.conn.execute("SELECT available_at FROM jobs").fetchone()[0] - retried)
+    assert delays[1] > 1.5 * delays[0]               # exponential
+
+    job = queue.claim("ocr", "w1")
+    assert queue.retry(job, "boom")
+    failed = queue.get(job_id)
+    assert failed["status"] == "failed" and failed["error"] == "ocr: boom"
+    assert failed["attempts"] == 3 and failed["timings"]["ocr_attempts"] == 3
+
+
+def test_lease_running_out_on_the_last_attempt_fails_the_job(db):
+    queue = JobQueue(db, visibility=0.05, max_attempts=1)
+    job_id = queue.submit(b"img")
+    queue.claim("ocr", "w1")
+    time.sleep(0.08)
+    assert queue.claim("ocr", "w2") is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and "visibility timeout" in job["error"]
+    assert job["attempts"] == 1 and job["timings"]["ocr_attempts"] == 1
+
+
+def test_job_failed_is_not_retried(db):
+    queue = JobQueue(db)
+    job_id = queue.submit(b"img")
+
+    def undecodable(job):
+        raise JobFailed("not an image")
+
+    stop = run_workers(queue, [("ocr", "structure", undecodable)])
+    try:
+        wait_for(lambda: queue.get(job_id)["status"] == "failed")
+    finally:
+        stop.set()
+    job = queue.get(job_id)
+    assert job["error"] == "ocr: not an image" and job["attempts"] == 1
+
+
+def test_concurrent_workers_claim_each_job_once(db):
+    JobQueue(db)     # create the table before the workers race
+    ids = [JobQueue(db).submit(b"img") for _ in range(30)]
+    claimed = []
+    lock = threading.Lock()
+
+    def worker(name):
+        queue = JobQueue(db)     # own connection, as a separate process would have
+        while True:
+            job = queue.claim("ocr", name)
+            if job is None:
+                return
+            with lock:
+                claimed.append(job["id"])
+            queue.advance(job, "done", 0.0)
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(ids)
+
+
+def test_webhook_is_retried_until_delivered(db):
+    received, statuses = [], [500, 200]
+
+    class Hook(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(statuses.pop(0))
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Hook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    queue = JobQueue(db)
+    job_id = queue.submit(b"img", webhook=f"http://127.0.0.1:{server.server_port}/hook")
+    queue.advance(queue.claim("ocr", "w1"), "done", 0.0, result=json.dumps({"Total": "1"}))
+
+    stop = threading.Event()
+    threading.Thread(target=deliver_webhooks, args=(queue, "hook", stop), daemon=True).start()
+    try:
+        wait_for(lambda: queue.get(job_id)["webhook"] == "sent")
+    finally:
+        stop.set()
+        server.shutdown()
+    assert len(received) == 2
+    assert received[-1]["id"] == job_id and received[-1]["result"] == {"Total": "1"}
+
+
+def test_webhook_redirects_are_not_followed(db):
+    paths = []
+
+    class Hook(BaseHTTPRequestHandler):
+        def do_POST(self):
+            paths.append(self.path)
+            self.send_response(307)
+            self.send_header("Location", "/elsewhere")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Hook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    queue = JobQueue(db)
+    job_id = queue.submit(b"img", webhook=f"http://127.0.0.1:{server.server_port}/hook")
+    queue.advance(queue.claim("ocr", "w1"), "done", 0.0)
+
+    stop = threading.Event()
+    threading.Thread(target=deliver_webhooks, args=(queue, "hook", stop), daemon=True).start()
+    try:
+        wait_for(lambda: len(paths) >= 2)    # first attempt and one retry, both to /hook
+    finally:
+        stop.set()
+        server.shutdown()
+    assert set(paths) == {"/hook"}
+    assert queue.get(job_id)["webhook"] == "pending"    # a redirect counts as a failed delivery
@@ -0,0 +1,69 @@
+import time
+import threading
+
+from llm_cache import LLMCache
+
+BLOCKS = [{"text": "Order ID", "conf": 0.98, "x": 40.2, "y": 101.7},
+          {"text": "987654112349587825G", "conf": 0.91, "x": 260.0, "y": 100.4}]
+
+
+class CountingLLM:
+    def __init__(self, release=None):
+        self.calls = 0
+        self.release = release
+        self.lock = threading.Lock()
+
+    def __call__(self, blocks):
+        with self.lock:
+            self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        return {"Order ID": blocks[1]["text"]}
+
+
+def test_concurrent_callers_share_one_upstream_call(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    release = threading.Event()
+    llm = CountingLLM(release)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.call("p", 1, BLOCKS, llm))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    while not cache.inflight:   # the owner is inside the upstream call
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+    assert llm.calls == 1
+    assert results == [{"Order ID": "987654112349587825G"}] * 8
+
+
+def test_caller_that_missed_while_owner_finished_does_not_call_again(tmp_path):
+    llm = CountingLLM()
+
+    class RacyCache(LLMCache):
+        raced = False
+
+        def get(self, key):
+            value = super().get(key)
+            if not self.raced:
+                # another request completes between this caller's miss and its lock
+                self.raced = True
+                other = threading.Thread(target=self.call, args=("p", 1, BLOCKS, llm))
+                other.start()
+                other.join()
+            return value
+
+    cache = RacyCache(str(tmp_path / "llm.sqlite"))
+    assert cache.call("p", 1, BLOCKS, llm) == {"Order ID": "987654112349587825G"}
+    assert llm.calls == 1
+
+
+def test_jittered_rescan_hits_the_cache(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    llm = CountingLLM()
+    cache.call("p", 1, BLOCKS, llm)
+    jittered = [dict(b, x=b["x"] + 1, y=b["y"] - 1) for b in reversed(BLOCKS)]
+    cache.call("p", 1, jittered, llm)
+    cache.call("p", 2, BLOCKS, llm)   # a new prompt version is a new key
+    assert llm.calls == 2
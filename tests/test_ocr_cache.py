@@ -0,0 +1,37 @@
+import re
+
+import numpy as np
+
+from easyocr.cache import OCRCache
+
+IMAGE = np.zeros((32, 64, 3), dtype=np.uint8)
+MD5S = ["a" * 32]
+FR = {"lang_list": ["fr"], "lang_char": "abc", "dict_list": ["fr.txt"], "quantize": True, "backend": "torch"}
+
+
+def test_reader_settings_are_part_of_the_key():
+    key = OCRCache.make_key(IMAGE, {"detail": 1}, MD5S, FR)
+    assert key == OCRCache.make_key(IMAGE, {"detail": 1}, MD5S, dict(FR))
+    # same model files, different languages / settings
+    assert key != OCRCache.make_key(IMAGE, {"detail": 1}, MD5S, dict(FR, lang_list=["fr", "de"], lang_char="abcd"))
+    assert key != OCRCache.make_key(IMAGE, {"detail": 1}, MD5S, dict(FR, quantize=False))
+    assert key != OCRCache.make_key(IMAGE, {"detail": 1}, MD5S, dict(FR, backend="onnx"))
+
+
+def test_parameters_are_keyed_on_stable_values():
+    params = {"mag_ratio": np.float64(1.5), "rotation_info": {90, 180}, "allowlist": re.compile("[0-9]")}
+    same = {"mag_ratio": 1.5, "rotation_info": {180, 90}, "allowlist": re.compile("[0-9]")}
+    key = OCRCache.make_key(IMAGE, params, MD5S, FR)
+    assert key is not None and key == OCRCache.make_key(IMAGE, same, MD5S, FR)
+
+
+def test_parameters_without_a_stable_value_are_not_cached():
+    assert OCRCache.make_key(IMAGE, {"constraint": object()}, MD5S, FR) is None
+
+
+def test_put_get_roundtrip(tmp_path):
+    cache = OCRCache(str(tmp_path / "ocr.sqlite"))
+    key = OCRCache.make_key(IMAGE, {}, MD5S, FR)
+    cache.put(key, [([[0, 0], [1, 0], [1, 1], [0, 1]], "A", 0.9)])
+    assert cache.get(key) == [([[0, 0], [1, 0], [1, 1], [0, 1]], "A", 0.9)]
+    cache.close()
@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+import easyocr
+from reader_pool import ReaderPool
+from recognition_batcher import RecognitionBatcher
+
+IMAGE = np.zeros((32, 64, 3), dtype=np.uint8)
+
+
+class FakeReader:
+    def __init__(self, *args, **kwargs):
+        self.calls = []
+
+    def readtext(self, image, **kwargs):
+        self.calls.append(("readtext", kwargs))
+        return "unbatched"
+
+    def detect(self, img, **kwargs):
+        self.calls.append(("detect", kwargs))
+        return [[[0, 10, 0, 10]]], [[]]
+
+
+class FakeBatcher:
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, grey, horizontal_list, free_list, **kwargs):
+        self.calls.append(kwargs)
+        future = Future()
+        future.set_result("batched")
+        return future
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(easyocr, "Reader", FakeReader)
+    return ReaderPool(size=1, batcher=FakeBatcher())
+
+
+def test_batched_call_splits_detect_and_recognize_options(pool):
+    assert asyncio.run(pool.areadtext(IMAGE, canvas_size=1280, allowlist="0123")) == "batched"
+    reader = pool._readers.get()
+    assert reader.calls == [("detect", {"reformat": False, "canvas_size": 1280})]
+    assert pool.batcher.calls == [{"allowlist": "0123"}]
+
+
+def test_unsupported_option_runs_unbatched(pool):
+    assert asyncio.run(pool.areadtext(IMAGE, detail=0)) == "unbatched"
+    assert pool._readers.get().calls == [("readtext", {"detail": 0})]
+    assert pool.batcher.calls == []
+
+
+def test_batcher_rejects_unsupported_option():
+    batcher = RecognitionBatcher.__new__(RecognitionBatcher)
+    with pytest.raises(TypeError):
+        batcher.submit(IMAGE[..., 0], [], [], paragraph=True)
@@ -0,0 +1,12 @@
+import numpy as np
+
+from easyocr.recognition import get_width_buckets
+
+
+def _crop(w, h=64):
+    return (None, np.zeros((h, w), np.uint8))
+
+
+def test_width_buckets_pad_each_crop_to_the_next_multiple_of_imgH():
+    image_list = [_crop(300), _crop(60), _crop(64), _crop(130), _crop(2000)]
+    assert get_width_buckets(image_list, 64, 512) == [(64, [1, 2]), (192, [3]), (320, [0]), (512, [4])]
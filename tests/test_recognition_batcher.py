@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import recognition_batcher
+from recognition_batcher import RecognitionBatcher
+
+
+class FakeReader:
+    character = "0123456789abcdefghijklmnopqrstuvwxyz"
+    lang_char = character
+    model_lang = "latin"
+    recognizer = converter = None
+    device = "cpu"
+
+
+BOX = [[2, 40, 2, 20]]   # one horizontal box: x_min, x_max, y_min, y_max
+
+
+@pytest.fixture
+def grey():
+    return np.zeros((32, 64), dtype=np.uint8)
+
+
+def fake_get_text(*args, **kwargs):
+    image_list = args[5]
+    return [(box, "text", 0.9) for box, _ in image_list]
+
+
+def test_error_fails_group_and_scheduler_keeps_running(monkeypatch, grey):
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("recognizer blew up")
+        return fake_get_text(*args, **kwargs)
+
+    monkeypatch.setattr(recognition_batcher, "get_text", flaky)
+    batcher = RecognitionBatcher(FakeReader(), max_wait_ms=1)
+    try:
+        with pytest.raises(RuntimeError, match="blew up"):
+            batcher.recognize(grey, BOX, [])
+        assert batcher.submit(grey, BOX, []).result(timeout=5)[0][1] == "text"
+    finally:
+        batcher.close()
+
+
+def test_arabic_results_are_reordered(monkeypatch, grey):
+    bidi = pytest.importorskip("bidi")
+    monkeypatch.setattr(recognition_batcher, "get_text",
+                        lambda *args, **kwargs: [(box, "abc ال", 0.9) for box, _ in args[5]])
+    reader = FakeReader()
+    reader.model_lang = "arabic"
+    batcher = RecognitionBatcher(reader, max_wait_ms=1)
+    try:
+        result = batcher.submit(grey, BOX, []).result(timeout=5)
+    finally:
+        batcher.close()
+    assert result[0][1] == bidi.get_display("abc ال")
@@ -0,0 +1,58 @@
+import torch
+from torch import nn
+
+from easyocr import weights
+
+
+class Tiny(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(1, 4, 3)
+        self.bn = nn.BatchNorm2d(4)
+        self.rnn = nn.LSTM(4, 8, bidirectional=True, batch_first=True)
+        self.linear = nn.Linear(16, 5)
+
+    def forward(self, x):
+        x = self.bn(self.conv(x)).mean(2).permute(0, 2, 1)
+        return self.linear(self.rnn(x)[0])
+
+
+class Payload:
+    def __reduce__(self):
+        return (print, ("unpickled",))
+
+
+def source(tmp_path):
+    torch.manual_seed(0)
+    model = Tiny().eval()
+    path = tmp_path / "tiny.pth"
+    torch.save({"module." + k: v for k, v in model.state_dict().items()}, path)
+    return model, str(path)
+
+
+def test_compiled_model_matches_source(tmp_path):
+    model, path = source(tmp_path)
+    weights.save_compiled(path)
+    torch.load(weights.compiled_path(path), weights_only=True)   # tensors and plain metadata only
+    x = torch.randn(2, 1, 8, 12)
+    with torch.no_grad():
+        assert torch.equal(weights.load_compiled(path, Tiny, quantize=False)(x), model(x))
+        torch.quantization.quantize_dynamic(model, dtype=torch.qint8, inplace=True)
+        compiled = weights.load_compiled(path, Tiny, quantize=True)
+        assert isinstance(compiled.rnn, torch.ao.nn.quantized.dynamic.LSTM)
+        assert torch.equal(compiled(x), model(x))
+
+
+def test_stale_compiled_weights_are_ignored(tmp_path):
+    model, path = source(tmp_path)
+    weights.save_compiled(path)
+    torch.save({"module." + k: v + 1 for k, v in model.state_dict().items()}, path)
+    assert weights.load_compiled(path, Tiny, quantize=False) is None
+
+
+def test_pickled_objects_are_not_loaded(tmp_path, capsys):
+    _, path = source(tmp_path)
+    torch.save({"header": weights.compiled_header(path), "state_dict": {}, "extra": Payload()},
+               weights.compiled_path(path))
+    assert weights.load_compiled(path, Tiny, quantize=False) is None
+    assert "unpickled" not in capsys.readouterr().out
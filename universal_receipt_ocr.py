@@ -3,12 +3,13 @@ import os
 import sys
 import json
 import csv
-import cv2
 import easyocr
 import openai
 
 from pathlib import Path
 from json import JSONDecodeError
+from llm_cache import cached_structuring
+from block_encoding import BLOCK_FORMAT, encode_blocks, paragraph_blocks, token_report
 
 # ——— CONFIG ———
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -22,16 +23,26 @@ except Exception as e:
     sys.exit(1)
 
 OUTPUT_CSV = "output.csv"
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "ocr_cache.sqlite")   # "" disables the OCR result cache
+OCR_MERGE_ROWS = os.getenv("OCR_MERGE_ROWS", "0") == "1"   # merge side-by-side words into one block (fewer prompt tokens)
+LLM_PROMPT_VERSION = 2   # bump whenever the extraction prompt below changes
 # —————————————————
 
+_reader = None
+
+def get_reader():
+    """Build the EasyOCR Reader once (with the on-disk result cache) and reuse it."""
+    global _reader
+    if _reader is None:
+        _reader = easyocr.Reader(["en"], gpu=False, cache=OCR_CACHE_PATH or None)
+    return _reader
+
 def extract_blocks(image_path: Path):
     """Load image and return EasyOCR blocks: dicts of text, conf, x, y."""
-    img = cv2.imread(str(image_path))
-    if img is None:
-        raise FileNotFoundError(f"Cannot open image: {image_path}")
-    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    reader = easyocr.Reader(["en"], gpu=False)
-    results = reader.readtext(rgb, detail=1)
+    reader = get_reader()
+    results = reader.readtext(str(image_path), detail=1)   # decoded once inside readtext
+    if OCR_MERGE_ROWS:
+        return paragraph_blocks(results)
     blocks = []
     for bbox, text, conf in results:
         x = float((bbox[0][0] + bbox[2][0]) / 2)
@@ -39,20 +50,23 @@ def extract_blocks(image_path: Path):
         blocks.append({"text": text, "conf": float(conf), "x": x, "y": y})
     return blocks
 
+@cached_structuring("universal_receipt_ocr.call_llm_extract", LLM_PROMPT_VERSION)
 def call_llm_extract(blocks):
     """
     Ask GPT-4 to return ALL label:value pairs it finds in the receipt,
     as a single flat JSON object with no extra commentary.
     """
+    report = token_report(blocks)
+    print(f"🔢 LLM blocks: {report['json_tokens']} → {report['compact_tokens']} tokens")
     prompt = f"""
-You are given a list of OCR text blocks from a receipt.
-Each block is a JSON object with keys: text, conf, x, y.
+You are given the OCR text blocks from a receipt.
+{BLOCK_FORMAT}
 
 Extract **every** field name (label) and its corresponding value from the receipt.
 Return **only** a single JSON object mapping labels to values—no commentary.
 
 OCR blocks:
-{json.dumps(blocks, indent=2)}
+{encode_blocks(blocks)}
 """
     # Use the v0.28 ChatCompletion interface
     resp = openai.ChatCompletion.create(